@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from setuptools import setup, find_packages
+from setuptools import setup
 
 with open("README.md", "r", encoding="utf-8") as fh:
     long_description = fh.read()
@@ -15,8 +15,22 @@ setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     url="https://github.com/yourusername/parabola-rm-builder",
-    packages=find_packages(where="src"),
-    package_dir={"": "src"},
+    # Installed as the "src" package, which the console script and the
+    # package-relative imports expect, rather than from inside src/
+    packages=[
+        "src",
+        "src.builders",
+        "src.builders.bootloader",
+        "src.builders.kernel",
+        "src.builders.partition",
+        "src.config_manager",
+        "src.cross_env",
+        "src.executor",
+        "src.installers",
+        "src.installers.desktop",
+        "src.installers.system",
+        "src.verification",
+    ],
     classifiers=[
         "Development Status :: 3 - Alpha",
         "Intended Audience :: Developers",
@@ -31,8 +45,10 @@ setup(
     python_requires=">=3.6",
     install_requires=[
         "pyyaml>=5.1",
-        "argparse>=1.4.0",
     ],
+    extras_require={
+        "git": ["pygit2>=1.12"],
+    },
     entry_points={
         "console_scripts": [
             "parabola-rm-builder=src.cli:main",
@@ -41,5 +57,6 @@ setup(
     include_package_data=True,
     package_data={
         "": ["config/*.yaml", "resources/**/*"],
+        "src.installers.desktop": ["assets/*", "templates/*"],
     },
 )
\ No newline at end of file
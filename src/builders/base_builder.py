@@ -0,0 +1,638 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Base Builder for Parabola RM
+
+This module provides the functionality shared by the component builders.
+"""
+
+import os
+import fcntl
+import shutil
+import hashlib
+import logging
+from operator import attrgetter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+from ..cross_env.env_manager import CrossEnvManager
+
+try:
+    import pygit2
+except ImportError:
+    pygit2 = None
+
+logger = logging.getLogger(__name__)
+
+# ioctl request to share the extents of one file with another (reflink)
+FICLONE = 0x40049409
+
+class BaseBuilder:
+    """
+    Base Builder
+
+    This class holds the helpers shared by the bootloader and kernel builders.
+    Subclasses are expected to set `config`, `env_manager` and `build_dir`.
+    """
+
+    config: Dict[str, Any]
+    env_manager: CrossEnvManager
+    build_dir: str
+
+    def _get_mirror(self, url: str, branch: Optional[str] = None) -> Optional[str]:
+        """
+        Create or update a local bare mirror of a branch of a git repository
+
+        Only the tip of the branch is fetched, so neither the history nor the
+        other branches and tags are downloaded. The mirror is stored under the
+        git cache directory of the environment manager in a subdirectory named
+        after the SHA-1 of the URL. The cache directory is mounted at the same
+        path in the containers, so the mirror persists across builds.
+
+        Args:
+            url: URL of the upstream repository
+            branch: Branch to mirror, or None for the default branch
+
+        Returns:
+            Path to the mirror, or None if the mirror could not be prepared
+        """
+        try:
+            cache_dir = self.env_manager.git_cache_dir
+            os.makedirs(cache_dir, exist_ok=True)
+
+            mirror_dir = os.path.join(cache_dir, hashlib.sha1(url.encode()).hexdigest())
+            git_cmd = ['git', '--git-dir', mirror_dir]
+
+            # Serialize concurrent builds working on the same mirror
+            with open(f"{mirror_dir}.lock", 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+                if os.path.isdir(mirror_dir):
+                    logger.info("Updating git mirror of %s", url)
+
+                    # Move the branch (or the branch HEAD points to) to the fetched tip
+                    returncode, step, stderr = self.env_manager.run_batch([
+                        ('fetch', git_cmd + ['fetch', '--depth=1', 'origin', branch or 'HEAD']),
+                        ('update', git_cmd + ['update-ref', f"refs/heads/{branch}" if branch else 'HEAD', 'FETCH_HEAD'])
+                    ])
+                else:
+                    logger.info("Creating git mirror of %s", url)
+
+                    command = ['git', 'clone', '--bare', '--depth=1', '--single-branch']
+                    if branch:
+                        command.extend(['--branch', branch])
+                    command.extend([url, mirror_dir])
+
+                    returncode, stdout, stderr = self.env_manager.run_command(command)
+
+            if returncode != 0:
+                logger.warning("Failed to prepare git mirror of %s: %s", url, stderr)
+                return None
+
+            return mirror_dir
+        except Exception as e:
+            logger.warning("Error preparing git mirror of %s: %s", url, str(e))
+            return None
+
+    def _get_build_env(self) -> Dict[str, str]:
+        """
+        Get the environment variables for cross-compiling with make
+
+        When compiler caching is enabled, the cross compiler is wrapped with
+        ccache (or with sccache if a remote cache bucket is configured) so that
+        unchanged objects are reused across rebuilds. Outside of a container,
+        the wrapper is only used if it is installed.
+
+        Returns:
+            Dictionary of environment variables
+        """
+        build_config = self.config.get('cross_compilation', {}).get('build', {})
+
+        env_vars = {
+            'ARCH': 'arm',
+            'CROSS_COMPILE': 'arm-poky-linux-gnueabi-'
+        }
+
+        # Share the job slots of the orchestrator's jobserver with other builds
+        jobserver = build_config.get('jobserver')
+        if jobserver:
+            env_vars['MAKEFLAGS'] = f"-j{build_config.get('parallel_jobs', 4)} --jobserver-auth={jobserver}"
+
+        if not build_config.get('use_ccache', False):
+            return env_vars
+
+        remote = build_config.get('ccache_remote')
+        wrapper = 'sccache' if remote else 'ccache'
+
+        # The container image ships ccache, the host may not
+        if self.env_manager.is_local() and not shutil.which(wrapper):
+            logger.warning("Compiler cache enabled but %s is not installed, building without it", wrapper)
+            return env_vars
+
+        # The cache directory is mounted at the same path in the containers
+        cache_dir = os.path.abspath(os.path.expanduser(
+            build_config.get('cache_dir') or os.path.join(self.build_dir, '.ccache')
+        ))
+        os.makedirs(cache_dir, exist_ok=True)
+
+        if remote:
+            env_vars['CROSS_COMPILE'] = f"sccache {env_vars['CROSS_COMPILE']}"
+            env_vars['SCCACHE_BUCKET'] = remote
+            env_vars['SCCACHE_DIR'] = cache_dir
+        else:
+            env_vars['CROSS_COMPILE'] = f"ccache {env_vars['CROSS_COMPILE']}"
+            env_vars['CCACHE_DIR'] = cache_dir
+            env_vars['CCACHE_COMPRESS'] = '1'
+            env_vars['CCACHE_MAXSIZE'] = str(build_config.get('ccache_max_size', '5G'))
+
+        return env_vars
+
+    def _get_make_command(self, *targets: str) -> List[str]:
+        """
+        Get the make command to build the given targets
+
+        Builds running under the orchestrator's jobserver get their job slots
+        through MAKEFLAGS, so no -j option is passed to them.
+
+        Args:
+            targets: Make targets to build
+
+        Returns:
+            Command to run make
+        """
+        build_config = self.config.get('cross_compilation', {}).get('build', {})
+
+        command = ['make']
+        if not build_config.get('jobserver'):
+            command.extend(['-j', str(build_config.get('parallel_jobs', 4))])
+        command.extend(targets)
+
+        return command
+
+    def _publish(self, src: str, dst: str) -> None:
+        """
+        Publish a build artifact without copying its contents where possible
+
+        The artifact is hard-linked if the source and destination are on the
+        same filesystem, otherwise reflinked on filesystems that support it
+        (btrfs, XFS), and only copied with sendfile as a last resort.
+
+        Args:
+            src: Path to the artifact in the build tree
+            dst: Path to publish the artifact to
+        """
+        if os.path.lexists(dst):
+            os.unlink(dst)
+
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+
+        try:
+            with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            return
+        except OSError:
+            pass
+
+        self._fast_copy(src, dst)
+
+    def _fast_copy(self, src: str, dst: str) -> None:
+        """
+        Copy a file in the kernel with sendfile
+
+        The destination is preallocated so the copy is written into contiguous
+        blocks. Permissions and timestamps are not copied.
+
+        Args:
+            src: Path to the source file
+            dst: Path to the destination file
+        """
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            size = os.fstat(fsrc.fileno()).st_size
+
+            if size > 0:
+                try:
+                    os.posix_fallocate(fdst.fileno(), 0, size)
+                except OSError:
+                    # Not supported by every filesystem; the copy works regardless
+                    pass
+
+            offset = 0
+            while offset < size:
+                sent = os.sendfile(fdst.fileno(), fsrc.fileno(), offset, size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+
+    def _get_artifact_key(self, source_dir: str, input_files: List[str]) -> Optional[str]:
+        """
+        Get the key of a build in the artifact cache
+
+        The key is a SHA-256 over the source revision, the given configuration
+        files, the patches and the build environment. Caching is only enabled
+        when PARABOLA_ARTIFACT_CACHE is set to 1.
+
+        Args:
+            source_dir: Source tree being built
+            input_files: Configuration files that affect the build
+
+        Returns:
+            Cache key, or None if caching is disabled or the key cannot be computed
+        """
+        if os.environ.get('PARABOLA_ARTIFACT_CACHE') != '1':
+            return None
+
+        returncode, stdout, stderr = self.env_manager.run_command(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=source_dir
+        )
+
+        if returncode != 0:
+            logger.warning("Failed to determine source revision: %s", stderr)
+            return None
+
+        digest = hashlib.sha256()
+        digest.update(type(self).__name__.encode())
+        digest.update(stdout.strip().encode())
+        digest.update(repr(sorted(
+            (key, value) for key, value in self._get_build_env().items() if key != 'MAKEFLAGS'
+        )).encode())
+
+        patches_dir = getattr(self, 'patches_dir', None)
+        patch_paths = self._list_patches(patches_dir) if patches_dir else []
+
+        for path in list(input_files) + patch_paths:
+            digest.update(path.encode())
+            if os.path.isfile(path):
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+
+        return digest.hexdigest()
+
+    def _get_artifact_cache_dir(self, key: str) -> str:
+        """
+        Get the artifact cache directory for a build
+
+        Args:
+            key: Cache key returned by _get_artifact_key
+
+        Returns:
+            Path to the cache directory
+        """
+        return os.path.join(os.path.dirname(self.build_dir), 'artifact-cache', key)
+
+    def _restore_artifacts(self, key: str, artifact_paths: List[str]) -> bool:
+        """
+        Publish previously built artifacts from the artifact cache
+
+        Args:
+            key: Cache key returned by _get_artifact_key
+            artifact_paths: Paths the artifacts are published to
+
+        Returns:
+            True if all artifacts were found in the cache, False otherwise
+        """
+        cache_dir = self._get_artifact_cache_dir(key)
+        cached_paths = [os.path.join(cache_dir, os.path.basename(path)) for path in artifact_paths]
+
+        if not all(os.path.isfile(path) for path in cached_paths):
+            return False
+
+        for cached_path, artifact_path in zip(cached_paths, artifact_paths):
+            self._publish(cached_path, artifact_path)
+
+        return True
+
+    def _store_artifacts(self, key: str, artifact_paths: List[str]) -> None:
+        """
+        Store published artifacts in the artifact cache
+
+        The artifacts are copied rather than linked so that later builds
+        rewriting files in the build tree cannot alter the cached copies.
+
+        Args:
+            key: Cache key returned by _get_artifact_key
+            artifact_paths: Paths of the published artifacts
+        """
+        cache_dir = self._get_artifact_cache_dir(key)
+        os.makedirs(cache_dir, exist_ok=True)
+
+        for artifact_path in artifact_paths:
+            cached_path = os.path.join(cache_dir, os.path.basename(artifact_path))
+            self._fast_copy(artifact_path, f"{cached_path}.tmp")
+            os.replace(f"{cached_path}.tmp", cached_path)
+
+    def _ensure_worktree(self, url: str, worktree_dir: str, branch: Optional[str] = None) -> bool:
+        """
+        Check out a fresh worktree of a repository from its local mirror
+
+        Any existing worktree is discarded, so local modifications made by a
+        previous build can never conflict with the update.
+
+        Args:
+            url: URL of the upstream repository
+            worktree_dir: Directory to check the worktree out to
+            branch: Branch to check out, or None for the default branch
+
+        Returns:
+            True if the worktree was checked out successfully, False otherwise
+        """
+        mirror_dir = self._get_mirror(url, branch)
+
+        if not mirror_dir:
+            logger.error("No git mirror available for %s", url)
+            return False
+
+        git_cmd = ['git', '--git-dir', mirror_dir]
+
+        if os.path.lexists(worktree_dir):
+            returncode, stdout, stderr = self.env_manager.run_command(
+                git_cmd + ['worktree', 'remove', '--force', worktree_dir]
+            )
+
+            # Not a worktree of the mirror (e.g. a clone made by an older version)
+            if returncode != 0:
+                shutil.rmtree(worktree_dir)
+
+        # Forget worktrees whose directories were deleted by hand
+        self.env_manager.run_command(git_cmd + ['worktree', 'prune'])
+
+        returncode, stdout, stderr = self.env_manager.run_command(
+            git_cmd + ['worktree', 'add', '--detach', worktree_dir, branch or 'HEAD']
+        )
+
+        if returncode != 0:
+            logger.error("Failed to check out worktree of %s: %s", url, stderr)
+            return False
+
+        return True
+
+    def _apply_patch_series(self, patches_dir: str, source_dir: str) -> bool:
+        """
+        Apply all patches in a directory to a source tree
+
+        Patches are grouped so that no two groups touch the same top-level
+        directory of the source tree. Each group is applied with a single git
+        invocation and independent groups are applied concurrently. This trades
+        atomicity across groups for speed: if one group fails, the others may
+        already have been applied.
+
+        Args:
+            patches_dir: Directory containing the .patch files
+            source_dir: Source tree to apply the patches to
+
+        Returns:
+            True if the patches were applied successfully, False otherwise
+        """
+        patch_paths = self._list_patches(patches_dir)
+
+        if not patch_paths:
+            logger.info("No patches to apply")
+            return True
+
+        logger.info("Applying %d patches", len(patch_paths))
+
+        groups = self._group_patches(patch_paths)
+
+        if len(groups) == 1:
+            return self._apply_patch_group(groups[0], source_dir)
+
+        with ThreadPoolExecutor(max_workers=min(len(groups), os.cpu_count() or 1)) as executor:
+            results = list(executor.map(lambda group: self._apply_patch_group(group, source_dir), groups))
+
+        return all(results)
+
+    def _list_patches(self, patches_dir: str) -> List[str]:
+        """
+        List the patches in a directory in the order to apply them
+
+        Hidden files (such as editor swap files) are skipped.
+
+        Args:
+            patches_dir: Directory containing the .patch files
+
+        Returns:
+            Paths to the patches, sorted by file name
+        """
+        if not os.path.isdir(patches_dir):
+            return []
+
+        with os.scandir(patches_dir) as entries:
+            patches = sorted(
+                (
+                    entry for entry in entries
+                    if entry.name.endswith('.patch') and not entry.name.startswith('.') and entry.is_file()
+                ),
+                key=attrgetter('name')
+            )
+
+        return [entry.path for entry in patches]
+
+    def _apply_patch_group(self, patch_paths: List[str], source_dir: str) -> bool:
+        """
+        Apply a group of patches to a source tree
+
+        The patches are applied with a single git invocation. If that fails they
+        are applied one at a time so the offending patch can be reported. When
+        pygit2 is installed, they are applied in-process first, and with git if
+        that fails.
+
+        Args:
+            patch_paths: Paths to the patches, in the order to apply them
+            source_dir: Source tree to apply the patches to
+
+        Returns:
+            True if the patches were applied successfully, False otherwise
+        """
+        if pygit2 is not None:
+            try:
+                if self._apply_patch_group_in_process(patch_paths, source_dir):
+                    return True
+            except Exception as e:
+                logger.warning("Failed to apply patches with libgit2: %s", str(e))
+
+            logger.warning("Applying patches with git instead")
+
+        # git apply is atomic, so a failed batch leaves the tree untouched
+        returncode, stdout, stderr = self.env_manager.run_command(
+            ['git', 'apply'] + patch_paths,
+            cwd=source_dir
+        )
+
+        if returncode == 0:
+            return True
+
+        logger.warning("Failed to apply patches in one batch, applying them one by one")
+
+        for patch_path in patch_paths:
+            logger.info("Applying patch: %s", os.path.basename(patch_path))
+
+            returncode, stdout, stderr = self.env_manager.run_command(
+                ['git', 'apply', patch_path],
+                cwd=source_dir
+            )
+
+            if returncode != 0:
+                logger.error("Failed to apply patch %s: %s", os.path.basename(patch_path), stderr)
+                return False
+
+        return True
+
+    def _apply_patch_group_in_process(self, patch_paths: List[str], source_dir: str) -> bool:
+        """
+        Apply a group of patches to a source tree with libgit2
+
+        All patches are applied through a single repository handle, without
+        spawning a git process per patch. libgit2 applies each patch on its
+        own, so if one does not apply, the files changed by the patches before
+        it are restored, leaving the tree as it was.
+
+        Args:
+            patch_paths: Paths to the patches, in the order to apply them
+            source_dir: Source tree to apply the patches to
+
+        Returns:
+            True if the patches were applied successfully, False if one does not apply
+        """
+        repo = pygit2.Repository(source_dir)
+        diffs = []
+
+        for patch_path in patch_paths:
+            with open(patch_path, 'rb') as f:
+                diffs.append((patch_path, pygit2.Diff.parse_diff(f.read())))
+
+        # Keep the files the patches change, to restore them if one fails
+        paths = {
+            path
+            for patch_path, diff in diffs
+            for delta in diff.deltas
+            for path in (delta.old_file.path, delta.new_file.path)
+        }
+        saved = self._save_files(source_dir, paths)
+
+        try:
+            for patch_path, diff in diffs:
+                if not repo.applies(diff, pygit2.GIT_APPLY_LOCATION_WORKDIR):
+                    logger.warning("Patch %s does not apply with libgit2", os.path.basename(patch_path))
+                    self._restore_files(source_dir, saved)
+                    return False
+
+                repo.apply(diff, pygit2.GIT_APPLY_LOCATION_WORKDIR)
+        except Exception:
+            self._restore_files(source_dir, saved)
+            raise
+
+        return True
+
+    @staticmethod
+    def _save_files(source_dir: str, paths: Set[str]) -> Dict[str, Optional[Tuple[bytes, int]]]:
+        """
+        Read files of a source tree so they can be restored later
+
+        Args:
+            source_dir: Source tree holding the files
+            paths: Paths of the files, relative to the source tree
+
+        Returns:
+            Dictionary of paths to their content and mode, None for missing files
+        """
+        saved = {}
+
+        for path in paths:
+            full_path = os.path.join(source_dir, path)
+
+            if os.path.isfile(full_path):
+                with open(full_path, 'rb') as f:
+                    saved[path] = (f.read(), os.stat(full_path).st_mode)
+            else:
+                saved[path] = None
+
+        return saved
+
+    @staticmethod
+    def _restore_files(source_dir: str, saved: Dict[str, Optional[Tuple[bytes, int]]]) -> None:
+        """
+        Restore files of a source tree saved by _save_files
+
+        Args:
+            source_dir: Source tree holding the files
+            saved: Content and mode of the files, None for files to remove
+        """
+        for path, state in saved.items():
+            full_path = os.path.join(source_dir, path)
+
+            if state is None:
+                if os.path.lexists(full_path):
+                    os.remove(full_path)
+                continue
+
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+
+            with open(full_path, 'wb') as f:
+                f.write(state[0])
+            os.chmod(full_path, state[1])
+
+    def _group_patches(self, patch_paths: List[str]) -> List[List[str]]:
+        """
+        Group patches that touch overlapping top-level directories
+
+        Args:
+            patch_paths: Paths to the patches, in the order to apply them
+
+        Returns:
+            List of patch groups; patches keep their relative order in each group
+        """
+        groups: List[Tuple[Set[str], List[str]]] = []
+
+        for patch_path in patch_paths:
+            components = self._get_patch_components(patch_path)
+
+            # Patches whose targets cannot be determined are applied serially
+            if not components:
+                return [list(patch_paths)]
+
+            group_patches = []
+            remaining = []
+
+            for group_components, patches in groups:
+                if group_components & components:
+                    components |= group_components
+                    group_patches.extend(patches)
+                else:
+                    remaining.append((group_components, patches))
+
+            group_patches.sort(key=patch_paths.index)
+            group_patches.append(patch_path)
+            remaining.append((components, group_patches))
+            groups = remaining
+
+        return [patches for components, patches in groups]
+
+    def _get_patch_components(self, patch_path: str) -> Set[str]:
+        """
+        Get the top-level directories of the source tree touched by a patch
+
+        Args:
+            patch_path: Path to the patch
+
+        Returns:
+            Set of top-level path components
+        """
+        components = set()
+
+        with open(patch_path, 'r', errors='replace') as f:
+            for line in f:
+                if line.startswith('diff --git a/'):
+                    path = line[len('diff --git a/'):].split(' b/', 1)[0]
+                elif line.startswith(('--- a/', '+++ b/')):
+                    path = line[len('--- a/'):].rstrip('\n').split('\t', 1)[0]
+                else:
+                    continue
+
+                components.add(path.split('/', 1)[0])
+
+        return components
@@ -8,20 +8,43 @@ This module handles the compilation and configuration of the U-Boot bootloader.
 """
 
 import os
-import sys
 import logging
+import mmap
+import re
+import string
 import tempfile
-import shutil
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Dict, Any
 
-# Add the parent directory to the path
-sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
-
-from src.cross_env.env_manager import CrossEnvManager
+from ...cross_env.env_manager import CrossEnvManager
+from ..base_builder import BaseBuilder
 
 logger = logging.getLogger(__name__)
 
-class UBootBuilder:
+# Root directory of the repository
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+# Upstream U-Boot repository
+UBOOT_REPO_URL = 'https://github.com/remarkable/uboot.git'
+
+# The mmcargs entry of the default environment in include/configs/zero-gravitas.h
+_MMCARGS_RE = re.compile(rb'"mmcargs=setenv bootargs.*?\\0" \\', re.DOTALL)
+
+# Replacement mmcargs entry, filled in from the boot parameters
+_MMCARGS_TEMPLATE = string.Template(
+    '"mmcargs=setenv bootargs console=$console,$baudrate " \\\n'
+    '                       "root=$root_device $additional_params por=$por;\\0" \\'
+)
+
+# Default boot parameters; U-Boot variables are expanded by U-Boot at boot time
+_BOOT_PARAM_DEFAULTS = {
+    'console': '${console}',
+    'baudrate': '${baudrate}',
+    'root_device': '/dev/mmcblk1p2',
+    'additional_params': 'rootwait rootfstype=ext4 rw',
+    'por': '${por}'
+}
+
+class UBootBuilder(BaseBuilder):
     """
     U-Boot Bootloader Builder
     
@@ -40,12 +63,14 @@ class UBootBuilder:
         self.env_manager = env_manager
         self.bootloader_config = config.get('bootloader', {})
         
+        # mmcargs entry, generated on first use
+        self._mmcargs = None
+        
         # Set up paths
-        self.build_dir = os.path.join(
-            os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))),
-            'build',
-            'bootloader'
-        )
+        self.build_dir = os.path.join(_REPO_ROOT, 'build', 'bootloader')
+        self.uboot_dir = os.path.join(self.build_dir, 'uboot')
+        self.patches_dir = os.path.join(_REPO_ROOT, 'resources', 'patches', 'bootloader')
+        self.output_dir = os.path.join(_REPO_ROOT, 'output', 'bootloader')
         
         # Create build directory if it doesn't exist
         os.makedirs(self.build_dir, exist_ok=True)
@@ -88,37 +113,11 @@ class UBootBuilder:
             True if the repository was cloned successfully, False otherwise
         """
         try:
-            # Check if the repository already exists
-            uboot_dir = os.path.join(self.build_dir, 'uboot')
+            logger.info("Checking out U-Boot repository...")
             
-            if os.path.isdir(uboot_dir):
-                logger.info("U-Boot repository already exists, updating...")
-                
-                # Update the repository
-                returncode, stdout, stderr = self.env_manager.run_command(
-                    ['git', 'pull'],
-                    cwd=uboot_dir
-                )
-                
-                if returncode != 0:
-                    logger.error("Failed to update U-Boot repository: %s", stderr)
-                    return False
-            else:
-                logger.info("Cloning U-Boot repository...")
-                
-                # Clone the repository
-                returncode, stdout, stderr = self.env_manager.run_command(
-                    [
-                        'git',
-                        'clone',
-                        'https://github.com/remarkable/uboot.git',
-                        uboot_dir
-                    ]
-                )
-                
-                if returncode != 0:
-                    logger.error("Failed to clone U-Boot repository: %s", stderr)
-                    return False
+            # Check out a fresh worktree, discarding changes made by previous builds
+            if not self._ensure_worktree(UBOOT_REPO_URL, self.uboot_dir):
+                return False
             
             logger.info("U-Boot repository cloned/updated successfully")
             return True
@@ -134,37 +133,11 @@ class UBootBuilder:
             True if the patches were applied successfully, False otherwise
         """
         try:
-            # Check if there are any patches to apply
-            patches_dir = os.path.join(
-                os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))),
-                'resources',
-                'patches',
-                'bootloader'
-            )
-            
-            if not os.path.isdir(patches_dir) or not os.listdir(patches_dir):
-                logger.info("No patches to apply")
-                return True
-            
             # Apply patches
-            uboot_dir = os.path.join(self.build_dir, 'uboot')
+            uboot_dir = self.uboot_dir
             
-            for patch_file in sorted(os.listdir(patches_dir)):
-                if not patch_file.endswith('.patch'):
-                    continue
-                
-                logger.info("Applying patch: %s", patch_file)
-                
-                patch_path = os.path.join(patches_dir, patch_file)
-                
-                returncode, stdout, stderr = self.env_manager.run_command(
-                    ['git', 'apply', patch_path],
-                    cwd=uboot_dir
-                )
-                
-                if returncode != 0:
-                    logger.error("Failed to apply patch %s: %s", patch_file, stderr)
-                    return False
+            if not self._apply_patch_series(self.patches_dir, uboot_dir):
+                return False
             
             logger.info("Patches applied successfully")
             return True
@@ -181,20 +154,15 @@ class UBootBuilder:
         """
         try:
             # Configure U-Boot
-            uboot_dir = os.path.join(self.build_dir, 'uboot')
+            uboot_dir = self.uboot_dir
             
             logger.info("Configuring U-Boot...")
             
-            # Set up environment variables
-            env_vars = {
-                'ARCH': 'arm',
-                'CROSS_COMPILE': 'arm-poky-linux-gnueabi-'
-            }
-            
             # Make the zero-gravitas_defconfig
             returncode, stdout, stderr = self.env_manager.run_command(
                 ['make', 'zero-gravitas_defconfig'],
-                cwd=uboot_dir
+                cwd=uboot_dir,
+                env=self._get_build_env()
             )
             
             if returncode != 0:
@@ -224,32 +192,47 @@ class UBootBuilder:
             logger.warning("U-Boot configuration file not found: %s", config_file)
             return
         
-        # Read the configuration file
-        with open(config_file, 'r') as f:
-            config_content = f.read()
-        
-        # Modify the configuration
-        boot_params = self.bootloader_config.get('boot_params', {})
+        mmcargs = self._get_mmcargs()
         
-        # Replace the mmcargs line
-        mmcargs = f'"mmcargs=setenv bootargs console=${{{boot_params.get('console', 'console')}}},{boot_params.get('baudrate', '${baudrate}')} " \\\n'
-        mmcargs += f'                       "root={boot_params.get('root_device', '/dev/mmcblk1p2')} {boot_params.get('additional_params', 'rootwait rootfstype=ext4 rw')} por=${{{boot_params.get('por', 'por')}}};"\\0" \\\n'
-        
-        # Replace the mmcargs line in the configuration
-        import re
-        config_content = re.sub(
-            r'"mmcargs=setenv bootargs.*?\\0" \\',
-            mmcargs,
-            config_content,
-            flags=re.DOTALL
-        )
+        # Search the memory-mapped file so only the pages up to the match are read
+        with open(config_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            match = _MMCARGS_RE.search(mm)
+            
+            if not match:
+                logger.warning("mmcargs not found in U-Boot configuration file: %s", config_file)
+                return
+            
+            if match.group(0) == mmcargs:
+                logger.debug("U-Boot configuration already up to date")
+                return
+            
+            config_content = mm[:match.start()] + mmcargs + mm[match.end():]
         
-        # Write the modified configuration
-        with open(config_file, 'w') as f:
+        # Write the modified configuration to a sibling file and swap it in atomically
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(config_file), delete=False) as f:
             f.write(config_content)
+            os.fchmod(f.fileno(), os.stat(config_file).st_mode & 0o7777)
+        
+        os.replace(f.name, config_file)
         
         logger.debug("U-Boot configuration modified successfully")
     
+    def _get_mmcargs(self) -> bytes:
+        """
+        Get the mmcargs environment entry based on user settings
+        
+        Returns:
+            The mmcargs entry as it appears in the U-Boot configuration header
+        """
+        if self._mmcargs is None:
+            boot_params = self.bootloader_config.get('boot_params', {})
+            
+            self._mmcargs = _MMCARGS_TEMPLATE.substitute(
+                {key: boot_params.get(key, default) for key, default in _BOOT_PARAM_DEFAULTS.items()}
+            ).encode()
+        
+        return self._mmcargs
+    
     def _build_uboot(self) -> bool:
         """
         Build U-Boot
@@ -259,20 +242,30 @@ class UBootBuilder:
         """
         try:
             # Build U-Boot
-            uboot_dir = os.path.join(self.build_dir, 'uboot')
+            uboot_dir = self.uboot_dir
             
             logger.info("Building U-Boot...")
             
-            # Set up environment variables
-            env_vars = {
-                'ARCH': 'arm',
-                'CROSS_COMPILE': 'arm-poky-linux-gnueabi-'
-            }
+            output_dir = self.output_dir
+            artifact_paths = [os.path.join(output_dir, 'u-boot.imx')]
+            
+            # Reuse the binary of an identical earlier build if available
+            cache_key = self._get_artifact_key(uboot_dir, [
+                os.path.join(uboot_dir, '.config'),
+                os.path.join(uboot_dir, 'include', 'configs', 'zero-gravitas.h')
+            ])
+            
+            os.makedirs(output_dir, exist_ok=True)
+            
+            if cache_key and self._restore_artifacts(cache_key, artifact_paths):
+                logger.info("U-Boot restored from the artifact cache")
+                return True
             
             # Build U-Boot
             returncode, stdout, stderr = self.env_manager.run_command(
-                ['make', '-j', str(self.config.get('cross_compilation', {}).get('build', {}).get('parallel_jobs', 4))],
-                cwd=uboot_dir
+                self._get_make_command(),
+                cwd=uboot_dir,
+                env=self._get_build_env()
             )
             
             if returncode != 0:
@@ -280,19 +273,14 @@ class UBootBuilder:
                 return False
             
             # Copy the U-Boot binary to the output directory
-            output_dir = os.path.join(
-                os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))),
-                'output',
-                'bootloader'
-            )
-            
-            os.makedirs(output_dir, exist_ok=True)
-            
-            shutil.copy(
+            self._publish(
                 os.path.join(uboot_dir, 'u-boot.imx'),
                 os.path.join(output_dir, 'u-boot.imx')
             )
             
+            if cache_key:
+                self._store_artifacts(cache_key, artifact_paths)
+            
             logger.info("U-Boot built successfully")
             return True
         except Exception as e:
@@ -306,9 +294,4 @@ class UBootBuilder:
         Returns:
             Path to the U-Boot binary
         """
-        return os.path.join(
-            os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))),
-            'output',
-            'bootloader',
-            'u-boot.imx'
-        )
\ No newline at end of file
+        return os.path.join(self.output_dir, 'u-boot.imx')
\ No newline at end of file
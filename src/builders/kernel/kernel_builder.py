@@ -8,21 +8,22 @@ This module handles the compilation and configuration of the Linux kernel.
 """
 
 import os
-import sys
 import logging
-import tempfile
-import shutil
-import re
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Dict, Any
 
-# Add the parent directory to the path
-sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
-
-from src.cross_env.env_manager import CrossEnvManager
+from ...cross_env.env_manager import CrossEnvManager
+from ..base_builder import BaseBuilder
 
 logger = logging.getLogger(__name__)
 
-class KernelBuilder:
+# Root directory of the repository
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+# Upstream Linux kernel repository and branch
+KERNEL_REPO_URL = 'https://github.com/remarkable/linux.git'
+KERNEL_BRANCH = 'lars/zero-gravitas_4.9'
+
+class KernelBuilder(BaseBuilder):
     """
     Linux Kernel Builder
     
@@ -42,11 +43,10 @@ class KernelBuilder:
         self.kernel_config = config.get('kernel', {})
         
         # Set up paths
-        self.build_dir = os.path.join(
-            os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))),
-            'build',
-            'kernel'
-        )
+        self.build_dir = os.path.join(_REPO_ROOT, 'build', 'kernel')
+        self.kernel_dir = os.path.join(self.build_dir, 'linux')
+        self.patches_dir = os.path.join(_REPO_ROOT, 'resources', 'patches', 'kernel')
+        self.output_dir = os.path.join(_REPO_ROOT, 'output', 'kernel')
         
         # Create build directory if it doesn't exist
         os.makedirs(self.build_dir, exist_ok=True)
@@ -93,39 +93,11 @@ class KernelBuilder:
             True if the repository was cloned successfully, False otherwise
         """
         try:
-            # Check if the repository already exists
-            kernel_dir = os.path.join(self.build_dir, 'linux')
+            logger.info("Checking out Linux kernel repository...")
             
-            if os.path.isdir(kernel_dir):
-                logger.info("Linux kernel repository already exists, updating...")
-                
-                # Update the repository
-                returncode, stdout, stderr = self.env_manager.run_command(
-                    ['git', 'pull'],
-                    cwd=kernel_dir
-                )
-                
-                if returncode != 0:
-                    logger.error("Failed to update Linux kernel repository: %s", stderr)
-                    return False
-            else:
-                logger.info("Cloning Linux kernel repository...")
-                
-                # Clone the repository
-                returncode, stdout, stderr = self.env_manager.run_command(
-                    [
-                        'git',
-                        'clone',
-                        '--branch',
-                        'lars/zero-gravitas_4.9',
-                        'https://github.com/remarkable/linux.git',
-                        kernel_dir
-                    ]
-                )
-                
-                if returncode != 0:
-                    logger.error("Failed to clone Linux kernel repository: %s", stderr)
-                    return False
+            # Check out a fresh worktree, discarding changes made by previous builds
+            if not self._ensure_worktree(KERNEL_REPO_URL, self.kernel_dir, KERNEL_BRANCH):
+                return False
             
             logger.info("Linux kernel repository cloned/updated successfully")
             return True
@@ -141,37 +113,11 @@ class KernelBuilder:
             True if the patches were applied successfully, False otherwise
         """
         try:
-            # Check if there are any patches to apply
-            patches_dir = os.path.join(
-                os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))),
-                'resources',
-                'patches',
-                'kernel'
-            )
-            
-            if not os.path.isdir(patches_dir) or not os.listdir(patches_dir):
-                logger.info("No patches to apply")
-                return True
-            
             # Apply patches
-            kernel_dir = os.path.join(self.build_dir, 'linux')
+            kernel_dir = self.kernel_dir
             
-            for patch_file in sorted(os.listdir(patches_dir)):
-                if not patch_file.endswith('.patch'):
-                    continue
-                
-                logger.info("Applying patch: %s", patch_file)
-                
-                patch_path = os.path.join(patches_dir, patch_file)
-                
-                returncode, stdout, stderr = self.env_manager.run_command(
-                    ['git', 'apply', patch_path],
-                    cwd=kernel_dir
-                )
-                
-                if returncode != 0:
-                    logger.error("Failed to apply patch %s: %s", patch_file, stderr)
-                    return False
+            if not self._apply_patch_series(self.patches_dir, kernel_dir):
+                return False
             
             logger.info("Patches applied successfully")
             return True
@@ -187,7 +133,7 @@ class KernelBuilder:
             True if the blobs were removed successfully, False otherwise
         """
         try:
-            kernel_dir = os.path.join(self.build_dir, 'linux')
+            kernel_dir = self.kernel_dir
             
             logger.info("Removing proprietary blobs from the Linux kernel...")
             
@@ -195,12 +141,19 @@ class KernelBuilder:
             firmware_dir = os.path.join(kernel_dir, 'firmware')
             
             if os.path.isdir(firmware_dir):
-                for root, dirs, files in os.walk(firmware_dir):
-                    for file in files:
-                        if file != 'epdc_ES103CS1.fw.ihex':
-                            file_path = os.path.join(root, file)
-                            os.remove(file_path)
-                            logger.debug("Removed proprietary blob: %s", file_path)
+                debug = logger.isEnabledFor(logging.DEBUG)
+                pending_dirs = [firmware_dir]
+                
+                # Walk the tree iteratively; DirEntry reuses the type from readdir()
+                while pending_dirs:
+                    with os.scandir(pending_dirs.pop()) as entries:
+                        for entry in entries:
+                            if entry.is_dir(follow_symlinks=False):
+                                pending_dirs.append(entry.path)
+                            elif entry.name != 'epdc_ES103CS1.fw.ihex':
+                                os.unlink(entry.path)
+                                if debug:
+                                    logger.debug("Removed proprietary blob: %s", entry.path)
             
             logger.info("Proprietary blobs removed successfully")
             return True
@@ -216,20 +169,15 @@ class KernelBuilder:
             True if the kernel was configured successfully, False otherwise
         """
         try:
-            kernel_dir = os.path.join(self.build_dir, 'linux')
+            kernel_dir = self.kernel_dir
             
             logger.info("Configuring Linux kernel...")
             
-            # Set up environment variables
-            env_vars = {
-                'ARCH': 'arm',
-                'CROSS_COMPILE': 'arm-poky-linux-gnueabi-'
-            }
-            
             # Make the zero-gravitas_defconfig
             returncode, stdout, stderr = self.env_manager.run_command(
                 ['make', 'zero-gravitas_defconfig'],
-                cwd=kernel_dir
+                cwd=kernel_dir,
+                env=self._get_build_env()
             )
             
             if returncode != 0:
@@ -263,81 +211,74 @@ class KernelBuilder:
         with open(config_file, 'r') as f:
             config_content = f.read()
         
-        # Modify the configuration
+        # Collect the option values based on user settings
+        options = {}
         drivers = self.kernel_config.get('drivers', {})
         
         # EPDC driver settings
         epdc = drivers.get('epdc', {})
-        if epdc.get('auto_partial_refresh', True):
-            config_content = self._ensure_config_option(config_content, 'CONFIG_FB_MXC_EINK_AUTO_UPDATE_MODE', 'y')
-        else:
-            config_content = self._ensure_config_option(config_content, 'CONFIG_FB_MXC_EINK_AUTO_UPDATE_MODE', 'n')
+        options['CONFIG_FB_MXC_EINK_AUTO_UPDATE_MODE'] = 'y' if epdc.get('auto_partial_refresh', True) else 'n'
         
         # USB communication options
         usb = drivers.get('usb', {})
-        if usb.get('enable_acm', True):
-            config_content = self._ensure_config_option(config_content, 'CONFIG_USB_ACM', 'y')
-            config_content = self._ensure_config_option(config_content, 'CONFIG_USB_F_ACM', 'y')
-        else:
-            config_content = self._ensure_config_option(config_content, 'CONFIG_USB_ACM', 'n')
-            config_content = self._ensure_config_option(config_content, 'CONFIG_USB_F_ACM', 'n')
+        acm = 'y' if usb.get('enable_acm', True) else 'n'
+        options['CONFIG_USB_ACM'] = acm
+        options['CONFIG_USB_F_ACM'] = acm
         
-        if usb.get('enable_cdc_composite', True):
-            config_content = self._ensure_config_option(config_content, 'CONFIG_USB_U_SERIAL', 'y')
-            config_content = self._ensure_config_option(config_content, 'CONFIG_USB_CDC_COMPOSITE', 'y')
-        else:
-            config_content = self._ensure_config_option(config_content, 'CONFIG_USB_U_SERIAL', 'n')
-            config_content = self._ensure_config_option(config_content, 'CONFIG_USB_CDC_COMPOSITE', 'n')
+        cdc_composite = 'y' if usb.get('enable_cdc_composite', True) else 'n'
+        options['CONFIG_USB_U_SERIAL'] = cdc_composite
+        options['CONFIG_USB_CDC_COMPOSITE'] = cdc_composite
         
         # Hardware support
         hardware_support = self.kernel_config.get('hardware_support', {})
         
         # Wi-Fi support
-        if hardware_support.get('wifi_support', False):
-            config_content = self._ensure_config_option(config_content, 'CONFIG_BRCMFMAC', 'm')
-        else:
-            config_content = self._ensure_config_option(config_content, 'CONFIG_BRCMFMAC', 'n')
+        options['CONFIG_BRCMFMAC'] = 'm' if hardware_support.get('wifi_support', False) else 'n'
         
         # Power management
-        if hardware_support.get('power_management', True):
-            config_content = self._ensure_config_option(config_content, 'CONFIG_PM', 'y')
-            config_content = self._ensure_config_option(config_content, 'CONFIG_PM_SLEEP', 'y')
-        else:
-            config_content = self._ensure_config_option(config_content, 'CONFIG_PM', 'n')
-            config_content = self._ensure_config_option(config_content, 'CONFIG_PM_SLEEP', 'n')
+        power_management = 'y' if hardware_support.get('power_management', True) else 'n'
+        options['CONFIG_PM'] = power_management
+        options['CONFIG_PM_SLEEP'] = power_management
+        
+        # Apply all options in a single pass over the file
+        new_content = self._set_config_options(config_content, options)
+        
+        if new_content == config_content:
+            logger.debug("Linux kernel configuration already up to date")
+            return
         
         # Write the modified configuration
         with open(config_file, 'w') as f:
-            f.write(config_content)
+            f.write(new_content)
         
         logger.debug("Linux kernel configuration modified successfully")
     
-    def _ensure_config_option(self, config_content: str, option: str, value: str) -> str:
+    def _set_config_options(self, config_content: str, options: Dict[str, str]) -> str:
         """
-        Ensure that a configuration option is set to the specified value
+        Set configuration options to the specified values
+        
+        Existing assignments are rewritten in place and options that are not
+        present yet are appended to the end of the file.
         
         Args:
             config_content: Configuration file content
-            option: Configuration option
-            value: Value to set
+            options: Dictionary of configuration options to values
         
         Returns:
             Modified configuration file content
         """
-        # Check if the option exists
-        if re.search(rf'^{option}=', config_content, re.MULTILINE):
-            # Replace the existing option
-            config_content = re.sub(
-                rf'^{option}=.*$',
-                f'{option}={value}',
-                config_content,
-                flags=re.MULTILINE
-            )
-        else:
-            # Add the option
-            config_content += f'\n{option}={value}\n'
+        lines = config_content.splitlines()
+        found = set()
         
-        return config_content
+        for i, line in enumerate(lines):
+            option, separator, _ = line.partition('=')
+            if separator and option in options:
+                lines[i] = f'{option}={options[option]}'
+                found.add(option)
+        
+        lines.extend(f'{option}={value}' for option, value in options.items() if option not in found)
+        
+        return '\n'.join(lines) + '\n'
     
     def _build_kernel(self) -> bool:
         """
@@ -347,52 +288,57 @@ class KernelBuilder:
             True if the kernel was built successfully, False otherwise
         """
         try:
-            kernel_dir = os.path.join(self.build_dir, 'linux')
+            kernel_dir = self.kernel_dir
             
             logger.info("Building Linux kernel...")
             
-            # Set up environment variables
-            env_vars = {
-                'ARCH': 'arm',
-                'CROSS_COMPILE': 'arm-poky-linux-gnueabi-'
-            }
+            output_dir = self.output_dir
+            artifact_paths = list(self.get_output_paths().values())
+            
+            # Reuse the files of an identical earlier build if available
+            cache_key = self._get_artifact_key(kernel_dir, [
+                os.path.join(kernel_dir, '.config'),
+                os.path.join(kernel_dir, 'arch', 'arm', 'configs', 'zero-gravitas_defconfig')
+            ])
+            
+            # Create the output directory
+            os.makedirs(output_dir, exist_ok=True)
+            
+            if cache_key and self._restore_artifacts(cache_key, artifact_paths):
+                logger.info("Linux kernel restored from the artifact cache")
+                return True
             
             # Build the kernel
             returncode, stdout, stderr = self.env_manager.run_command(
-                ['make', '-j', str(self.config.get('cross_compilation', {}).get('build', {}).get('parallel_jobs', 4))],
-                cwd=kernel_dir
+                self._get_make_command(),
+                cwd=kernel_dir,
+                env=self._get_build_env()
             )
             
             if returncode != 0:
                 logger.error("Failed to build Linux kernel: %s", stderr)
                 return False
             
-            # Create the output directory
-            output_dir = os.path.join(
-                os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))),
-                'output',
-                'kernel'
-            )
-            
-            os.makedirs(output_dir, exist_ok=True)
-            
             # Copy the kernel image and device tree binary
-            shutil.copy(
+            self._publish(
                 os.path.join(kernel_dir, 'arch', 'arm', 'boot', 'zImage'),
                 os.path.join(output_dir, 'zImage')
             )
             
-            shutil.copy(
+            self._publish(
                 os.path.join(kernel_dir, 'arch', 'arm', 'boot', 'dts', 'zero-gravitas.dtb'),
                 os.path.join(output_dir, 'zero-gravitas.dtb')
             )
             
             # Copy the EPDC waveform file
-            shutil.copy(
+            self._publish(
                 os.path.join(kernel_dir, 'firmware', 'epdc_ES103CS1.fw.ihex'),
                 os.path.join(output_dir, 'epdc_ES103CS1.fw.ihex')
             )
             
+            if cache_key:
+                self._store_artifacts(cache_key, artifact_paths)
+            
             logger.info("Linux kernel built successfully")
             return True
         except Exception as e:
@@ -406,11 +352,7 @@ class KernelBuilder:
         Returns:
             Dictionary of file names to paths
         """
-        output_dir = os.path.join(
-            os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))),
-            'output',
-            'kernel'
-        )
+        output_dir = self.output_dir
         
         return {
             'zImage': os.path.join(output_dir, 'zImage'),
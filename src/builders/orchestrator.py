@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Build Orchestrator for Parabola RM
+
+This module runs independent component builds in parallel.
+"""
+
+import os
+import copy
+import logging
+import logging.handlers
+import multiprocessing
+from typing import Dict, Any, List, Tuple, Type
+
+from ..cross_env.env_manager import CrossEnvManager
+
+logger = logging.getLogger(__name__)
+
+def _init_worker_logging(log_queue: Any, level: int) -> None:
+    """
+    Route the log records of a worker process to the parent process
+
+    Args:
+        log_queue: Queue shared with the parent's log listener
+        level: Logging level of the parent's root logger
+    """
+    root_logger = logging.getLogger()
+    root_logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+    root_logger.setLevel(level)
+
+def _run_builder(builder_class: Type, config: Dict[str, Any], env_manager: CrossEnvManager) -> bool:
+    """
+    Run a single builder in a worker process
+
+    Args:
+        builder_class: Builder class to instantiate
+        config: Configuration dictionary
+        env_manager: Cross-compilation environment manager
+
+    Returns:
+        True if the component was built successfully, False otherwise
+    """
+    return builder_class(config, env_manager).build()
+
+class BuildOrchestrator:
+    """
+    Build Orchestrator
+
+    This class builds components that have no dependency on each other (such as
+    the bootloader and the kernel) concurrently, one worker process per builder.
+    """
+
+    def __init__(self, config: Dict[str, Any], env_manager: CrossEnvManager):
+        """
+        Initialize the Build Orchestrator
+
+        Args:
+            config: Configuration dictionary
+            env_manager: Cross-compilation environment manager
+        """
+        self.config = config
+        self.env_manager = env_manager
+
+    def build(self, builder_classes: List[Type]) -> bool:
+        """
+        Build the components in parallel
+
+        When commands run directly on the host, the builds share a GNU Make
+        jobserver so that at most the configured number of parallel jobs run
+        across all of them. Inside containers the jobserver pipe cannot be
+        passed through, so the jobs are split evenly between the builds instead.
+
+        Args:
+            builder_classes: Builder classes to run
+
+        Returns:
+            True if all components were built successfully, False otherwise
+        """
+        if not builder_classes:
+            return True
+
+        parallel_jobs = int(self.config.get('cross_compilation', {}).get('build', {}).get('parallel_jobs', 4))
+        build_config = copy.deepcopy(self.config)
+        build_settings = build_config.setdefault('cross_compilation', {}).setdefault('build', {})
+
+        jobserver_fds = None
+
+        if self.env_manager.env_type == 'container':
+            # Share the make jobs between the builds
+            build_settings['parallel_jobs'] = max(1, parallel_jobs // len(builder_classes))
+        else:
+            jobserver_fds = self._create_jobserver(parallel_jobs - len(builder_classes))
+            build_settings['jobserver'] = '{},{}'.format(*jobserver_fds)
+
+        # Fork the workers so they inherit the jobserver pipe. multiprocessing.Pool
+        # is used rather than ProcessPoolExecutor, which only accepts a context
+        # and a worker initializer from Python 3.7.
+        context = multiprocessing.get_context('fork')
+
+        # Forward the workers' log records to the handlers of this process
+        root_logger = logging.getLogger()
+        log_queue = context.Queue()
+        listener = logging.handlers.QueueListener(log_queue, *root_logger.handlers, respect_handler_level=True)
+        listener.start()
+
+        success = True
+
+        try:
+            with context.Pool(len(builder_classes), _init_worker_logging, (log_queue, root_logger.level)) as pool:
+                results = [
+                    (builder_class.__name__, pool.apply_async(_run_builder, (builder_class, build_config, self.env_manager)))
+                    for builder_class in builder_classes
+                ]
+
+                for name, async_result in results:
+                    try:
+                        result = async_result.get()
+                    except Exception as e:
+                        logger.error("Error running %s: %s", name, str(e))
+                        result = False
+
+                    if not result:
+                        logger.error("%s failed", name)
+                        success = False
+        finally:
+            listener.stop()
+
+            if jobserver_fds:
+                for fd in jobserver_fds:
+                    os.close(fd)
+
+        return success
+
+    def _create_jobserver(self, tokens: int) -> Tuple[int, int]:
+        """
+        Create a GNU Make jobserver pipe
+
+        Every top-level make owns one implicit job slot, so the pipe is filled
+        with one token for each additional job that may run.
+
+        Args:
+            tokens: Number of tokens to put in the pipe
+
+        Returns:
+            Tuple of (read descriptor, write descriptor)
+        """
+        read_fd, write_fd = os.pipe()
+
+        # make finds the pipe through the descriptors inherited by the builds
+        os.set_inheritable(read_fd, True)
+        os.set_inheritable(write_fd, True)
+
+        if tokens > 0:
+            os.write(write_fd, b'+' * tokens)
+
+        return read_fd, write_fd
@@ -8,20 +8,41 @@ This module handles the partitioning and formatting of the eMMC storage.
 """
 
 import os
-import sys
-import logging
-import tempfile
-import shutil
 import re
+import time
+import atexit
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, List, Optional, Tuple
 
-# Add the parent directory to the path
-sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
-
-from src.cross_env.env_manager import CrossEnvManager
+from ...cross_env.env_manager import CrossEnvManager
 
 logger = logging.getLogger(__name__)
 
+# Interval at which the partition device nodes are polled for
+PARTITION_POLL_INTERVAL = 0.02
+
+# Devices whose names end in a digit (mmcblk1, nvme0n1, loop0) separate the
+# partition number with a "p"
+_PART_SUFFIX_RE = re.compile(r'\d$')
+
+def _partition_name(device: str, number: int) -> str:
+    """
+    Get the name of a partition of a device
+
+    Args:
+        device: Device (e.g., /dev/mmcblk1 or /dev/sda)
+        number: Partition number
+
+    Returns:
+        Partition device (e.g., /dev/mmcblk1p1 or /dev/sda1)
+    """
+    if _PART_SUFFIX_RE.search(device):
+        return f"{device}p{number}"
+    
+    return f"{device}{number}"
+
 class PartitionManager:
     """
     Partition Manager
@@ -40,6 +61,11 @@ class PartitionManager:
         self.config = config
         self.env_manager = env_manager
         self.partition_config = config.get('partition', {})
+        
+        # Original values of the sysfs queue settings changed by tune_device
+        self._saved_queue_settings = {}
+        self._tuning_lock = threading.Lock()
+        atexit.register(self.restore_device_tuning)
     
     def partition_device(self, device: str) -> bool:
         """
@@ -60,56 +86,37 @@ class PartitionManager:
             system_size = layout.get('system_size', 2)
             home_size = layout.get('home_size', 0)
             
-            # Create a temporary file for the fdisk commands
-            with tempfile.NamedTemporaryFile(mode='w', delete=False) as f:
-                # Create a new DOS partition table
-                f.write("o\n")
-                
-                # Create the FAT partition
-                f.write("n\n")  # New partition
-                f.write("p\n")  # Primary partition
-                f.write("1\n")  # Partition number 1
-                f.write("\n")   # Default first sector
-                f.write(f"+{fat_size}M\n")  # Size in MiB
-                f.write("t\n")  # Change partition type
-                f.write("c\n")  # W95 FAT32 (LBA)
-                f.write("a\n")  # Set bootable flag
-                
-                # Create the system partition
-                f.write("n\n")  # New partition
-                f.write("p\n")  # Primary partition
-                f.write("2\n")  # Partition number 2
-                f.write("\n")   # Default first sector
-                f.write(f"+{system_size}G\n")  # Size in GiB
-                
-                # Create the home partition
-                f.write("n\n")  # New partition
-                f.write("p\n")  # Primary partition
-                f.write("3\n")  # Partition number 3
-                f.write("\n")   # Default first sector
-                if home_size > 0:
-                    f.write(f"+{home_size}G\n")  # Size in GiB
-                else:
-                    f.write("\n")  # Use all remaining space
-                
-                # Write the changes
-                f.write("w\n")
-                
-                f.flush()
-                
-                # Run fdisk
+            # Discard the whole device so the flash controller sees all blocks as free
+            if self.partition_config.get('discard', True):
                 returncode, stdout, stderr = self.env_manager.run_command(
-                    ['fdisk', device],
-                    cwd=None,
-                    stdin=open(f.name, 'r')
+                    ['blkdiscard', '-f', device],
+                    cwd=None
                 )
                 
                 if returncode != 0:
-                    logger.error("Failed to partition device: %s", stderr)
-                    return False
+                    logger.warning("Failed to discard device %s: %s", device, stderr)
+                    # Continue anyway, not every device supports discard
+            
+            # Describe the whole partition table in a single sfdisk script. sfdisk
+            # aligns each partition to the device's optimal I/O size (1 MiB by
+            # default), as parted --align optimal would.
+            script = '\n'.join([
+                'label: dos',
+                f',{fat_size}MiB,c,*',  # FAT partition: W95 FAT32 (LBA), bootable
+                f',{system_size}GiB,L',  # System partition
+                f',{home_size}GiB,L' if home_size > 0 else ',,L'  # Home partition, remaining space by default
+            ]) + '\n'
+            
+            # Run sfdisk
+            returncode, stdout, stderr = self.env_manager.run_command(
+                ['sfdisk', device],
+                cwd=None,
+                input=script
+            )
             
-            # Remove the temporary file
-            os.unlink(f.name)
+            if returncode != 0:
+                logger.error("Failed to partition device: %s", stderr)
+                return False
             
             logger.info("Device partitioned successfully")
             return True
@@ -117,6 +124,29 @@ class PartitionManager:
             logger.error("Error partitioning device: %s", str(e))
             return False
     
+    def wait_for_partitions(self, device: str, count: int = 3, timeout: float = 2.0) -> bool:
+        """
+        Wait for the kernel to create the device nodes of the new partitions
+        
+        Args:
+            device: Device that was partitioned (e.g., /dev/mmcblk1)
+            count: Number of partitions to wait for
+            timeout: Maximum time to wait in seconds
+        
+        Returns:
+            True if all partitions appeared in time, False otherwise
+        """
+        partitions = [_partition_name(device, number) for number in range(1, count + 1)]
+        deadline = time.monotonic() + timeout
+        
+        while not all(os.path.exists(partition) for partition in partitions):
+            if time.monotonic() >= deadline:
+                logger.error("Partitions of %s did not appear within %.1f seconds", device, timeout)
+                return False
+            time.sleep(PARTITION_POLL_INTERVAL)
+        
+        return True
+    
     def format_partitions(self, device: str) -> bool:
         """
         Format the partitions
@@ -130,78 +160,73 @@ class PartitionManager:
         try:
             logger.info("Formatting partitions on device: %s", device)
             
+            self.tune_device(device)
+            
             # Get filesystem options
             filesystem = self.partition_config.get('filesystem', {})
             fat_type = filesystem.get('fat_type', 'vfat')
             system_type = filesystem.get('system_type', 'ext4')
             home_type = filesystem.get('home_type', 'ext4')
             
-            # Format the FAT partition
-            logger.info("Formatting FAT partition...")
-            returncode, stdout, stderr = self.env_manager.run_command(
-                ['mkfs.vfat', f"{device}p1"],
-                cwd=None
-            )
-            
-            if returncode != 0:
-                logger.error("Failed to format FAT partition: %s", stderr)
-                return False
-            
-            # Format the system partition
-            logger.info("Formatting system partition...")
-            
             # Get ext4 parameters
             ext4_params = filesystem.get('ext4_params', {})
             journal_size = ext4_params.get('journal_size', 4)
             block_size = ext4_params.get('block_size', 1024)
             inode_size = ext4_params.get('inode_size', 128)
             inode_ratio = ext4_params.get('inode_ratio', 4096)
+            lazy_init = ext4_params.get('lazy_init', True)
+            stripe_auto = ext4_params.get('stripe_auto', True)
             
             # Build the mkfs.ext4 command
             ext4_cmd = [
                 'mkfs.ext4',
+                '-F',
                 '-O', '^64bit',
                 '-O', '^metadata_csum',
                 '-O', 'uninit_bg',
                 '-J', f'size={journal_size}',
                 '-b', str(block_size),
                 '-i', str(inode_ratio),
-                '-I', str(inode_size),
-                f"{device}p2"
+                '-I', str(inode_size)
             ]
             
-            returncode, stdout, stderr = self.env_manager.run_command(
-                ext4_cmd,
-                cwd=None
-            )
+            extended_options = []
             
-            if returncode != 0:
-                logger.error("Failed to format system partition: %s", stderr)
-                return False
+            # Leave zeroing the inode tables and journal to the kernel after mounting
+            if lazy_init:
+                extended_options.append('lazy_itable_init=1,lazy_journal_init=1,discard')
             
-            # Format the home partition
-            logger.info("Formatting home partition...")
+            # Align allocations to the device's preferred I/O size
+            if stripe_auto:
+                stride = self._get_io_size(device) // int(block_size)
+                if stride > 1:
+                    extended_options.append(f'stride={stride},stripe_width={stride}')
             
-            # Build the mkfs.ext4 command
-            ext4_cmd = [
-                'mkfs.ext4',
-                '-O', '^64bit',
-                '-O', '^metadata_csum',
-                '-O', 'uninit_bg',
-                '-J', f'size={journal_size}',
-                '-b', str(block_size),
-                '-i', str(inode_ratio),
-                '-I', str(inode_size),
-                f"{device}p3"
-            ]
+            if extended_options:
+                ext4_cmd.extend(['-E', ','.join(extended_options)])
             
-            returncode, stdout, stderr = self.env_manager.run_command(
-                ext4_cmd,
-                cwd=None
-            )
+            # Commands to format each partition
+            format_commands = {
+                'FAT': ['mkfs.vfat', _partition_name(device, 1)],
+                'system': ext4_cmd + [_partition_name(device, 2)],
+                'home': ext4_cmd + [_partition_name(device, 3)]
+            }
             
-            if returncode != 0:
-                logger.error("Failed to format home partition: %s", stderr)
+            # The partitions are independent, so format them concurrently
+            max_parallel = max(1, int(filesystem.get('max_parallel', 3)))
+            
+            for name in format_commands:
+                logger.info("Formatting %s partition...", name)
+            
+            results = self._run_commands(format_commands, max_parallel)
+            success = True
+            
+            for name, (returncode, stdout, stderr) in results.items():
+                if returncode != 0:
+                    logger.error("Failed to format %s partition: %s", name, stderr)
+                    success = False
+            
+            if not success:
                 return False
             
             logger.info("Partitions formatted successfully")
@@ -210,6 +235,95 @@ class PartitionManager:
             logger.error("Error formatting partitions: %s", str(e))
             return False
     
+    def tune_device(self, device: str) -> None:
+        """
+        Tune the I/O queue of a device for large sequential transfers
+        
+        Read-ahead is raised to 4 MiB and the mq-deadline scheduler is selected
+        if available. The original settings are restored on exit.
+        
+        Args:
+            device: Device to tune (e.g., /dev/mmcblk1)
+        """
+        queue_dir = os.path.join('/sys/block', os.path.basename(device), 'queue')
+        
+        for name, value in (('read_ahead_kb', '4096'), ('scheduler', 'mq-deadline')):
+            path = os.path.join(queue_dir, name)
+            
+            # Formatting and bootloader installation may tune the device concurrently
+            with self._tuning_lock:
+                self._tune_queue_setting(path, name, value)
+    
+    def _tune_queue_setting(self, path: str, name: str, value: str) -> None:
+        """
+        Change a sysfs queue setting, remembering its original value
+        
+        Args:
+            path: Path to the sysfs attribute
+            name: Name of the attribute
+            value: Value to set
+        """
+        if path in self._saved_queue_settings:
+            return
+        
+        try:
+            with open(path, 'r') as f:
+                current = f.read().strip()
+            
+            if name == 'scheduler':
+                # The active scheduler is listed in brackets, e.g. "[none] mq-deadline"
+                if value not in current.replace('[', ' ').replace(']', ' ').split():
+                    return
+                current = current[current.index('[') + 1:current.index(']')] if '[' in current else current
+            
+            with open(path, 'w') as f:
+                f.write(value)
+            
+            self._saved_queue_settings[path] = current
+        except (OSError, ValueError) as e:
+            logger.debug("Failed to set %s: %s", path, str(e))
+    
+    def restore_device_tuning(self) -> None:
+        """
+        Restore the I/O queue settings changed by tune_device
+        """
+        for path, value in self._saved_queue_settings.items():
+            try:
+                with open(path, 'w') as f:
+                    f.write(value)
+            except OSError as e:
+                logger.warning("Failed to restore %s: %s", path, str(e))
+        
+        self._saved_queue_settings.clear()
+    
+    def _get_io_size(self, device: str) -> int:
+        """
+        Get the preferred I/O size of a device
+        
+        This is the optimal I/O size reported by the block layer, falling back to
+        the minimum I/O size and, for eMMC devices, the erase group size.
+        
+        Args:
+            device: Device to query (e.g., /dev/mmcblk1)
+        
+        Returns:
+            Preferred I/O size in bytes, or 0 if it cannot be determined
+        """
+        sysfs_dir = os.path.join('/sys/block', os.path.basename(device))
+        
+        for attribute in ('queue/optimal_io_size', 'queue/minimum_io_size', 'device/preferred_erase_size'):
+            try:
+                with open(os.path.join(sysfs_dir, attribute), 'r') as f:
+                    size = int(f.read().strip())
+            except (OSError, ValueError):
+                continue
+            
+            # The minimum I/O size is usually just the sector size
+            if size > 512:
+                return size
+        
+        return 0
+    
     def install_bootloader(self, device: str, bootloader_path: str) -> bool:
         """
         Install the bootloader to the device
@@ -224,44 +338,45 @@ class PartitionManager:
         try:
             logger.info("Installing bootloader to device: %s", device)
             
-            # Enable writing to the boot0 partition
-            returncode, stdout, stderr = self.env_manager.run_command(
-                ['sh', '-c', f'echo 0 > /sys/block/{os.path.basename(device)}boot0/force_ro'],
-                cwd=None
-            )
+            self.tune_device(device)
             
-            if returncode != 0:
-                logger.error("Failed to enable writing to boot0 partition: %s", stderr)
-                return False
+            # Read-only switch of the boot0 partition
+            ro_path = f'/sys/block/{os.path.basename(device)}boot0/force_ro'
             
-            # Zero out the boot0 partition
-            returncode, stdout, stderr = self.env_manager.run_command(
-                ['dd', 'if=/dev/zero', f'of={device}boot0', 'bs=512', 'count=4096'],
-                cwd=None
-            )
-            
-            if returncode != 0:
-                logger.error("Failed to zero out boot0 partition: %s", stderr)
+            # Enable writing to the boot0 partition
+            try:
+                with open(ro_path, 'w') as f:
+                    f.write('0')
+            except OSError as e:
+                logger.error("Failed to enable writing to boot0 partition: %s", str(e))
                 return False
             
-            # Install the bootloader
-            returncode, stdout, stderr = self.env_manager.run_command(
-                ['dd', f'if={bootloader_path}', f'of={device}boot0', 'bs=512', 'seek=2'],
-                cwd=None
-            )
+            # Zero out the first 2 MiB of the boot0 partition bypassing the page cache,
+            # install the bootloader at a 1 KiB offset in a single write and flush
+            # the written data to the device once, all in a single invocation
+            boot_partition = f'{device}boot0'
+            step_errors = {
+                'zero': "Failed to zero out boot0 partition: %s",
+                'write': "Failed to install bootloader: %s",
+                'flush': "Failed to flush boot0 partition: %s"
+            }
+            
+            returncode, step, stderr = self.env_manager.run_batch([
+                ('zero', ['dd', 'if=/dev/zero', f'of={boot_partition}', 'bs=1M', 'count=2', 'oflag=direct']),
+                ('write', ['dd', f'if={bootloader_path}', f'of={boot_partition}', 'bs=1M', 'seek=1024', 'oflag=seek_bytes', 'iflag=fullblock']),
+                ('flush', ['blockdev', '--flushbufs', boot_partition])
+            ])
             
             if returncode != 0:
-                logger.error("Failed to install bootloader: %s", stderr)
+                logger.error(step_errors[step], stderr)
                 return False
             
             # Re-enable read-only mode for the boot0 partition
-            returncode, stdout, stderr = self.env_manager.run_command(
-                ['sh', '-c', f'echo 1 > /sys/block/{os.path.basename(device)}boot0/force_ro'],
-                cwd=None
-            )
-            
-            if returncode != 0:
-                logger.error("Failed to re-enable read-only mode for boot0 partition: %s", stderr)
+            try:
+                with open(ro_path, 'w') as f:
+                    f.write('1')
+            except OSError as e:
+                logger.error("Failed to re-enable read-only mode for boot0 partition: %s", str(e))
                 return False
             
             logger.info("Bootloader installed successfully")
@@ -274,6 +389,9 @@ class PartitionManager:
         """
         Mount the partitions
         
+        Partitions are mounted concurrently, except that mount points nested
+        inside other mount points are only mounted after their parents.
+        
         Args:
             device: Device to mount (e.g., /dev/mmcblk1)
             mount_points: Dictionary of partition numbers to mount points
@@ -284,23 +402,29 @@ class PartitionManager:
         try:
             logger.info("Mounting partitions on device: %s", device)
             
-            for partition, mount_point in mount_points.items():
-                # Create the mount point if it doesn't exist
-                os.makedirs(mount_point, exist_ok=True)
+            for level in self._group_by_depth(mount_points):
+                # Create the mount points if they don't exist
+                for partition in level:
+                    os.makedirs(mount_points[partition], exist_ok=True)
                 
-                # Mount the partition
-                returncode, stdout, stderr = self.env_manager.run_command(
-                    ['mount', f"{device}p{partition}", mount_point],
-                    cwd=None
+                # Mount the partitions
+                results = self._run_commands(
+                    {partition: ['mount', _partition_name(device, partition), mount_points[partition]] for partition in level}
                 )
                 
-                if returncode != 0:
-                    logger.error("Failed to mount partition %s: %s", partition, stderr)
-                    return False
+                success = True
+                
+                for partition, (returncode, stdout, stderr) in results.items():
+                    if returncode != 0:
+                        logger.error("Failed to mount partition %s: %s", partition, stderr)
+                        success = False
+                    else:
+                        logger.debug("Mounted partition %s to %s", partition, mount_points[partition])
                 
-                logger.info("Mounted partition %s to %s", partition, mount_point)
+                if not success:
+                    return False
             
-            logger.info("Partitions mounted successfully")
+            logger.info("Mounted %d partitions: %s", len(mount_points), list(mount_points))
             return True
         except Exception as e:
             logger.error("Error mounting partitions: %s", str(e))
@@ -310,6 +434,8 @@ class PartitionManager:
         """
         Unmount the partitions
         
+        Mount points are unmounted concurrently, deepest first.
+        
         Args:
             mount_points: List of mount points to unmount
         
@@ -319,21 +445,67 @@ class PartitionManager:
         try:
             logger.info("Unmounting partitions...")
             
-            for mount_point in mount_points:
-                # Unmount the partition
-                returncode, stdout, stderr = self.env_manager.run_command(
-                    ['umount', mount_point],
-                    cwd=None
-                )
+            levels = self._group_by_depth(dict(enumerate(mount_points)))
+            
+            for level in reversed(levels):
+                # Unmount the partitions
+                results = self._run_commands({i: ['umount', mount_points[i]] for i in level})
                 
-                if returncode != 0:
-                    logger.error("Failed to unmount %s: %s", mount_point, stderr)
-                    return False
+                success = True
+                
+                for i, (returncode, stdout, stderr) in results.items():
+                    if returncode != 0:
+                        logger.error("Failed to unmount %s: %s", mount_points[i], stderr)
+                        success = False
+                    else:
+                        logger.debug("Unmounted %s", mount_points[i])
                 
-                logger.info("Unmounted %s", mount_point)
+                if not success:
+                    return False
             
-            logger.info("Partitions unmounted successfully")
+            logger.info("Unmounted %d partitions: %s", len(mount_points), mount_points)
             return True
         except Exception as e:
             logger.error("Error unmounting partitions: %s", str(e))
-            return False
\ No newline at end of file
+            return False
+    
+    def _group_by_depth(self, mount_points: Dict[Any, str]) -> List[List[Any]]:
+        """
+        Group mount points by the depth of their paths
+        
+        Args:
+            mount_points: Dictionary of keys to mount points
+        
+        Returns:
+            Lists of keys, from the shallowest mount points to the deepest
+        """
+        levels = {}
+        
+        for key, mount_point in mount_points.items():
+            depth = os.path.normpath(os.path.abspath(mount_point)).count(os.sep)
+            levels.setdefault(depth, []).append(key)
+        
+        return [levels[depth] for depth in sorted(levels)]
+    
+    def _run_commands(self, commands: Dict[Any, List[str]], max_workers: Optional[int] = None) -> Dict[Any, Tuple[int, str, str]]:
+        """
+        Run independent commands concurrently
+        
+        Args:
+            commands: Dictionary of keys to commands
+            max_workers: Maximum number of commands to run at the same time,
+                         or None to run all of them at once
+        
+        Returns:
+            Dictionary of keys to (return code, stdout, stderr) tuples
+        """
+        if not commands:
+            return {}
+        
+        with ThreadPoolExecutor(max_workers=min(max_workers or len(commands), len(commands))) as executor:
+            futures = {
+                key: executor.submit(self.env_manager.run_command, command, cwd=None)
+                for key, command in commands.items()
+            }
+            
+            return {key: future.result() for key, future in futures.items()}
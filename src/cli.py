@@ -7,21 +7,14 @@ Command Line Interface for Parabola RM Builder
 This module provides the command line interface for the Parabola RM Builder.
 """
 
-import os
 import sys
 import argparse
 import logging
 import yaml
 from typing import Dict, Any, List, Optional
 
-# Add the parent directory to the path
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
-from src.config_manager.config_manager import ConfigManager
-from src.cross_env.env_manager import CrossEnvManager
-from src.builders.bootloader.uboot_builder import UBootBuilder
-from src.builders.kernel.kernel_builder import KernelBuilder
-from src.executor.installation_executor import InstallationExecutor
+from .config_manager.config_manager import ConfigManager
+from .cross_env.env_manager import CrossEnvManager
 
 # Set up logging
 logging.basicConfig(
@@ -229,16 +222,31 @@ def build_components(args: argparse.Namespace, config_manager: ConfigManager) ->
             logger.error("Failed to set up cross-compilation environment")
             return 1
         
-        # Build components
+        # Import the builders only when building, to keep other commands fast
         if args.all:
+            from .executor.installation_executor import InstallationExecutor
+            
             # Use the installation executor to build all components
             executor = InstallationExecutor(config_manager, env_manager)
             if not executor._build_components():
                 logger.error("Failed to build components")
                 return 1
+        elif args.bootloader and args.kernel:
+            from .builders.bootloader.uboot_builder import UBootBuilder
+            from .builders.kernel.kernel_builder import KernelBuilder
+            from .builders.orchestrator import BuildOrchestrator
+            
+            # Build the bootloader and the kernel in parallel
+            logger.info("Building bootloader and kernel...")
+            orchestrator = BuildOrchestrator(config, env_manager)
+            if not orchestrator.build([UBootBuilder, KernelBuilder]):
+                logger.error("Failed to build components")
+                return 1
         else:
             # Build individual components
             if args.bootloader:
+                from .builders.bootloader.uboot_builder import UBootBuilder
+                
                 logger.info("Building bootloader...")
                 bootloader_builder = UBootBuilder(config, env_manager)
                 if not bootloader_builder.build():
@@ -247,6 +255,8 @@ def build_components(args: argparse.Namespace, config_manager: ConfigManager) ->
                 logger.info("Bootloader built successfully")
             
             if args.kernel:
+                from .builders.kernel.kernel_builder import KernelBuilder
+                
                 logger.info("Building kernel...")
                 kernel_builder = KernelBuilder(config, env_manager)
                 if not kernel_builder.build():
@@ -283,6 +293,8 @@ def install_parabola(args: argparse.Namespace, config_manager: ConfigManager) ->
             logger.error("Failed to set up cross-compilation environment")
             return 1
         
+        from .executor.installation_executor import InstallationExecutor
+        
         # Create the installation executor
         executor = InstallationExecutor(config_manager, env_manager)
         
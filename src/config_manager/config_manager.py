@@ -8,12 +8,52 @@ This module handles loading, validating, and managing the configuration for the
 """
 
 import os
+import copy
 import yaml
 import logging
-from typing import Dict, Any, Optional
+import functools
+from typing import Dict, Any, Optional, Tuple
+
+# Use the libyaml bindings when available
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
 
 logger = logging.getLogger(__name__)
 
+# Scalar types recognized without an explicit tag; everything else loads as a string
+_IMPLICIT_TAGS = {
+    'tag:yaml.org,2002:bool',
+    'tag:yaml.org,2002:float',
+    'tag:yaml.org,2002:int',
+    'tag:yaml.org,2002:merge',
+    'tag:yaml.org,2002:null'
+}
+
+class ConfigLoader(SafeLoader):
+    """
+    Safe YAML loader that only resolves the scalar types used by configurations
+    """
+
+ConfigLoader.yaml_implicit_resolvers = {
+    first: [(tag, regexp) for tag, regexp in resolvers if tag in _IMPLICIT_TAGS]
+    for first, resolvers in SafeLoader.yaml_implicit_resolvers.items()
+}
+
+@functools.lru_cache(maxsize=512)
+def _split_key_path(key_path: str) -> Tuple[str, ...]:
+    """
+    Split a dot-separated key path into its keys
+
+    Args:
+        key_path: Dot-separated key path
+
+    Returns:
+        Tuple of keys
+    """
+    return tuple(key_path.split('.'))
+
 class ConfigManager:
     """
     Configuration Manager for Parabola RM Builder
@@ -37,6 +77,10 @@ class ConfigManager:
             'config',
             'default.yaml'
         )
+        
+        # Merged configuration and the modification times of the files it was loaded from
+        self._cached = None
+        self._cached_mtimes = ()
     
     def load_config(self) -> Dict[str, Any]:
         """
@@ -45,10 +89,17 @@ class ConfigManager:
         Returns:
             The loaded configuration as a dictionary
         """
+        # Reuse the previously loaded configuration if the files have not changed
+        mtimes = self._get_config_mtimes()
+        
+        if self._cached is not None and mtimes == self._cached_mtimes:
+            self.config = copy.deepcopy(self._cached)
+            return self.config
+        
         # Load default configuration
         try:
             with open(self.default_config_path, 'r') as f:
-                self.config = yaml.safe_load(f)
+                self.config = yaml.load(f, Loader=ConfigLoader)
                 logger.debug("Loaded default configuration from %s", self.default_config_path)
         except Exception as e:
             logger.error("Failed to load default configuration: %s", str(e))
@@ -58,7 +109,7 @@ class ConfigManager:
         if self.config_path:
             try:
                 with open(self.config_path, 'r') as f:
-                    user_config = yaml.safe_load(f)
+                    user_config = yaml.load(f, Loader=ConfigLoader)
                     logger.debug("Loaded user configuration from %s", self.config_path)
                     
                     # Merge user configuration with default configuration
@@ -67,8 +118,28 @@ class ConfigManager:
                 logger.error("Failed to load user configuration: %s", str(e))
                 raise
         
+        self._cached = copy.deepcopy(self.config)
+        self._cached_mtimes = mtimes
+        
         return self.config
     
+    def _get_config_mtimes(self) -> Tuple[Optional[int], ...]:
+        """
+        Get the modification times of the configuration files
+        
+        Returns:
+            Tuple of modification times in nanoseconds, None for missing files
+        """
+        mtimes = []
+        
+        for path in (self.default_config_path, self.config_path):
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns if path else None)
+            except OSError:
+                mtimes.append(None)
+        
+        return tuple(mtimes)
+    
     def _merge_configs(self, default_config: Dict[str, Any], user_config: Dict[str, Any]) -> None:
         """
         Merge user configuration with default configuration
@@ -77,15 +148,21 @@ class ConfigManager:
             default_config: Default configuration dictionary
             user_config: User configuration dictionary
         """
-        for key, value in user_config.items():
-            if (
-                key in default_config and 
-                isinstance(default_config[key], dict) and 
-                isinstance(value, dict)
-            ):
-                self._merge_configs(default_config[key], value)
-            else:
-                default_config[key] = value
+        # Merge nested dictionaries iteratively rather than recursing into them
+        stack = [(default_config, user_config)]
+        
+        while stack:
+            target, source = stack.pop()
+            
+            for key, value in source.items():
+                if (
+                    key in target and 
+                    isinstance(target[key], dict) and 
+                    isinstance(value, dict)
+                ):
+                    stack.append((target[key], value))
+                else:
+                    target[key] = value
     
     def validate_config(self) -> bool:
         """
@@ -117,14 +194,13 @@ class ConfigManager:
         Returns:
             The value at the specified key path, or the default value if not found
         """
-        keys = key_path.split('.')
         value = self.config
         
-        for key in keys:
-            if isinstance(value, dict) and key in value:
+        try:
+            for key in _split_key_path(key_path):
                 value = value[key]
-            else:
-                return default
+        except (KeyError, TypeError):
+            return default
         
         return value
     
@@ -136,7 +212,7 @@ class ConfigManager:
             key_path: Dot-separated key path (e.g., 'cross_compilation.environment_type')
             value: Value to set
         """
-        keys = key_path.split('.')
+        keys = _split_key_path(key_path)
         config = self.config
         
         for i, key in enumerate(keys[:-1]):
@@ -155,7 +231,7 @@ class ConfigManager:
         """
         try:
             with open(output_path, 'w') as f:
-                yaml.dump(self.config, f, default_flow_style=False)
+                yaml.dump(self.config, f, Dumper=SafeDumper, default_flow_style=False, sort_keys=False)
                 logger.debug("Saved configuration to %s", output_path)
         except Exception as e:
             logger.error("Failed to save configuration: %s", str(e))
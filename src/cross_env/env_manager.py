@@ -10,13 +10,277 @@ including both containerized and direct toolchain approaches.
 
 import os
 import sys
+import shutil
+import json
+import hashlib
+import pickle
 import logging
+import shlex
+import tempfile
 import platform
+import functools
+import contextlib
 import subprocess
-from typing import Dict, Any, List, Optional, Tuple
+import threading
+import collections
+from typing import Dict, Any, List, Optional, Tuple, Iterator, IO
 
 logger = logging.getLogger(__name__)
 
+# Root directory of the repository
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Default location of the local git mirrors (overridable via PARABOLA_GIT_CACHE)
+DEFAULT_GIT_CACHE_DIR = os.path.join('~', '.cache', 'parabola-rm', 'git')
+
+@functools.lru_cache(maxsize=None)
+def _resolve_executable(name: str, search_path: Optional[str]) -> str:
+    """
+    Resolve a command name to the absolute path of its executable
+
+    Args:
+        name: Command name
+        search_path: Value of PATH to search
+
+    Returns:
+        Absolute path to the executable, or the name itself if it was not found
+    """
+    return shutil.which(name, path=search_path) or name
+
+# Commands that only succeed if the container runtime is able to run containers
+# (the Docker daemon is reachable, Podman's storage and conmon are usable)
+_RUNTIME_PROBES = {
+    'docker': ['version', '--format', '{{.Server.Version}}'],
+    'podman': ['info', '--format', '{{.Host.Arch}}']
+}
+
+@functools.lru_cache(maxsize=1)
+def _detect_runtime() -> Optional[str]:
+    """
+    Detect a working container runtime, preferring Docker over Podman
+
+    Runtimes that are not on PATH are skipped without spawning a process. The
+    others are probed with a single command that also checks their health, and
+    the result is cached for the lifetime of the process.
+
+    Returns:
+        Absolute path to the container runtime, or None if none was found
+    """
+    for name, probe in _RUNTIME_PROBES.items():
+        path = shutil.which(name)
+        
+        if not path:
+            continue
+        
+        result = subprocess.run(
+            [path] + probe,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=False
+        )
+        
+        if result.returncode == 0:
+            logger.debug("%s found: %s", name.capitalize(), result.stdout.decode().strip())
+            return path
+        
+        logger.warning("%s is installed but not usable: %s", name.capitalize(), result.stderr.decode().strip())
+    
+    return None
+
+# reMarkable toolchain archive (gzip-compressed tarball)
+_TOOLCHAIN_URL = 'https://ipfs.eeems.website/ipfs/Qmdkdeh3bodwDLM9YvPrMoAi6dFYDDCodAnHvjG5voZxiC'
+
+# Size of the chunks the toolchain download is streamed in
+_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Directory of the parsed toolchain environment setup scripts
+ENV_CACHE_DIR = os.path.join('~', '.cache', 'parabola-rm', 'env')
+
+# Number of trailing output lines of a command that are kept in memory
+OUTPUT_TAIL_LINES = 2000
+
+# Image indexes of the local image stores, read instead of asking the runtime
+_PODMAN_IMAGE_STORES = [
+    os.path.join(os.environ.get('XDG_DATA_HOME', os.path.join('~', '.local', 'share')), 'containers', 'storage', 'overlay-images', 'images.json'),
+    os.path.join(os.sep, 'var', 'lib', 'containers', 'storage', 'overlay-images', 'images.json')
+]
+_DOCKER_IMAGE_STORES = [
+    os.path.join(os.sep, 'var', 'lib', 'docker', 'image', 'overlay2', 'repositories.json')
+]
+
+# Image names read from each image index, keyed by path, with the index mtime
+_image_store_cache = {}
+
+def _read_image_store(path: str) -> Optional[frozenset]:
+    """
+    Read the names of the images in a local image index
+
+    Both Podman's images.json and Docker's repositories.json are understood.
+    The result is cached until the index is modified.
+
+    Args:
+        path: Path to the image index
+
+    Returns:
+        Set of image names, or None if the index could not be read
+    """
+    path = os.path.expanduser(path)
+
+    try:
+        mtime = os.stat(path).st_mtime_ns
+
+        cached = _image_store_cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        with open(path, 'rb') as f:
+            index = json.load(f)
+
+        if isinstance(index, dict):
+            # Docker: {"Repositories": {"name": {"name:tag": "sha256:..."}}}
+            names = frozenset(tag for tags in index.get('Repositories', {}).values() for tag in tags)
+        else:
+            # Podman: [{"names": ["localhost/name:tag"], ...}]
+            names = frozenset(name for image in index for name in image.get('names') or [])
+
+        _image_store_cache[path] = (mtime, names)
+        return names
+    except (OSError, ValueError, AttributeError, TypeError):
+        return None
+
+# Working directories are resolved once; the process never changes its own
+_abspath = functools.lru_cache(maxsize=16)(os.path.abspath)
+_realpath = functools.lru_cache(maxsize=16)(os.path.realpath)
+
+# Prefix of the lines that mark the start of each step of a batch in its output
+_STEP_MARKER = '::step '
+
+@functools.lru_cache(maxsize=None)
+def _render_dockerfile(base_image: str) -> str:
+    """
+    Render the Dockerfile of the cross-compilation environment
+    
+    Args:
+        base_image: Image both build stages are based on
+    
+    Returns:
+        Content of the Dockerfile
+    """
+    # Keep downloaded packages in a cache mount that outlives the layer
+    # instead of downloading them again
+    apt_install = (
+        "RUN --mount=type=cache,target=/var/cache/apt,sharing=locked \\\n"
+        "    --mount=type=cache,target=/var/lib/apt,sharing=locked \\\n"
+        "    rm -f /etc/apt/apt.conf.d/docker-clean && \\\n"
+        "    echo 'Binary::apt::APT::Keep-Downloaded-Packages \"true\";' > /etc/apt/apt.conf.d/keep-cache && \\\n"
+        "    apt-get update && \\\n"
+        "    apt-get install -y --no-install-recommends \\\n"
+    )
+    
+    return ''.join([
+        # Needed for the cache mounts below
+        "# syntax=docker/dockerfile:1.4\n\n",
+        
+        # Download and extract the toolchain in a throwaway stage, so the
+        # download tools do not end up in the final image
+        "# Download and install the reMarkable toolchain\n",
+        f"FROM {base_image} AS fetcher\n\n",
+        "ENV DEBIAN_FRONTEND=noninteractive\n\n",
+        apt_install,
+        "        ca-certificates \\\n",
+        "        wget\n\n",
+        
+        # Extract the archive while it is downloaded; pipefail makes a failed
+        # download fail the build
+        "SHELL [\"/bin/bash\", \"-o\", \"pipefail\", \"-c\"]\n",
+        "RUN mkdir -p /opt/toolchain && \\\n",
+        f"    wget -qO- {_TOOLCHAIN_URL} | tar xzf - -C /opt/toolchain && \\\n",
+        "    rm -rf /opt/toolchain/poky-2.1.3/sysroots/x86_64-pokysdk-linux/usr/share/doc \\\n",
+        "        /opt/toolchain/poky-2.1.3/sysroots/x86_64-pokysdk-linux/usr/share/man \\\n",
+        "        /opt/toolchain/poky-2.1.3/sysroots/x86_64-pokysdk-linux/usr/share/locale\n\n",
+        
+        # The final image only contains what the builds run
+        f"FROM {base_image}\n\n",
+        
+        # Set up environment variables
+        "ENV DEBIAN_FRONTEND=noninteractive\n",
+        "ENV TZ=UTC\n\n",
+        
+        # Install dependencies; the host compiler builds the kernel and
+        # U-Boot host tools, git checks out the sources, ccache caches objects
+        apt_install,
+        "        build-essential \\\n",
+        "        ca-certificates \\\n",
+        "        ccache \\\n",
+        "        git \\\n",
+        "        make \\\n",
+        "        python3\n\n",
+        
+        "COPY --from=fetcher /opt/toolchain /opt/toolchain\n\n",
+        
+        # Set up environment variables for the toolchain
+        "# Set up environment variables\n",
+        "ENV PATH=\"/opt/toolchain/poky-2.1.3/sysroots/x86_64-pokysdk-linux/usr/bin:/opt/toolchain/poky-2.1.3/sysroots/x86_64-pokysdk-linux/usr/sbin:${PATH}\"\n",
+        "ENV OECORE_NATIVE_SYSROOT=\"/opt/toolchain/poky-2.1.3/sysroots/x86_64-pokysdk-linux\"\n",
+        
+        # Create a working directory
+        "\n# Create a working directory\n",
+        "WORKDIR /workspaces\n\n",
+        
+        # Set the entrypoint
+        "# Set the entrypoint\n",
+        "ENTRYPOINT [\"/bin/bash\"]\n"
+    ])
+
+def _parse_env_setup(content: str) -> Dict[str, str]:
+    """
+    Parse the variables exported by a toolchain environment setup script
+    
+    Args:
+        content: Content of the environment setup script
+    
+    Returns:
+        Dictionary of variable names to values, with the quotes removed
+    """
+    env_vars = {}
+    exporting = False
+    
+    # Tokenize the whole script at once; an export may list several assignments
+    for token in shlex.split(content, comments=True):
+        if token == 'export':
+            exporting = True
+            continue
+        
+        key, separator, value = token.partition('=')
+        
+        if exporting and separator and key.isidentifier():
+            env_vars[key] = value
+        else:
+            exporting = False
+    
+    return env_vars
+
+def _drain_output(pipe: IO[bytes], tail: collections.deque, steps: Optional[List[str]] = None) -> None:
+    """
+    Read the output of a command line by line until it exits
+    
+    Args:
+        pipe: Pipe connected to the output of the command
+        tail: Bounded deque receiving the decoded lines
+        steps: List receiving the names of the batch steps marked in the
+            output, however long ago they scrolled out of the tail
+    """
+    debug = logger.isEnabledFor(logging.DEBUG)
+    
+    with pipe:
+        for line in iter(pipe.readline, b''):
+            line = line.decode(errors='replace')
+            tail.append(line)
+            if steps is not None and line.startswith(_STEP_MARKER):
+                steps.append(line[len(_STEP_MARKER):].rstrip('\n'))
+            if debug:
+                logger.debug("%s", line.rstrip('\n'))
+
 class CrossEnvManager:
     """
     Cross-Compilation Environment Manager
@@ -41,12 +305,49 @@ class CrossEnvManager:
             self.container_config = config.get('cross_compilation', {}).get('container', {})
         else:
             self.direct_config = config.get('cross_compilation', {}).get('direct', {})
+            self._toolchain_path = os.path.expanduser(
+                self.direct_config.get('install_path', '~/.parabola-rm-builder/toolchain')
+            )
+        
+        # Name of the container image, used for every container command. The tag
+        # includes a digest of the Dockerfile, so a configuration change that
+        # alters the image selects a new tag and anything else reuses the image.
+        self._image_name = f"parabola-rm-builder-toolchain:{self.toolchain_version}"
+        if self.env_type == 'container':
+            dockerfile_digest = hashlib.blake2b(self._generate_dockerfile().encode(), digest_size=8).hexdigest()
+            self._image_name += f"-{dockerfile_digest}"
         
         # Build configuration
         self.build_config = config.get('cross_compilation', {}).get('build', {})
         
         # Environment variables for cross-compilation
         self.env_vars = {}
+        
+        # Environment of the commands, built once instead of copied per command
+        self._base_env = dict(os.environ)
+        
+        # Container images known to exist
+        self._image_cache = set()
+        
+        # Long-lived container commands are executed in, see session()
+        self._session_container = None
+        
+        # Resource limit and volume mount options, built on first use
+        self._container_options = None
+        
+        # Directory of the local git mirrors
+        self.git_cache_dir = os.path.abspath(os.path.expanduser(
+            os.environ.get('PARABOLA_GIT_CACHE', DEFAULT_GIT_CACHE_DIR)
+        ))
+        
+        # Host directories mounted at the same path in every container, so the
+        # caches in them outlive the containers and the paths git records in
+        # them (such as the gitdir of a worktree) resolve on the host as well
+        self._shared_dirs = [_REPO_ROOT, self.git_cache_dir]
+        
+        # Share the compiler cache as well, if it is kept outside the repository
+        if self.build_config.get('use_ccache', False) and self.build_config.get('cache_dir'):
+            self._shared_dirs.append(os.path.abspath(os.path.expanduser(self.build_config['cache_dir'])))
     
     def setup_environment(self) -> bool:
         """
@@ -71,7 +372,7 @@ class CrossEnvManager:
         
         # Check if Docker/Podman is installed
         if not self._check_container_runtime():
-            logger.error("Container runtime (Docker/Podman) not found")
+            logger.error("No usable container runtime (Docker/Podman) found")
             return False
         
         # Check if the container image exists
@@ -116,33 +417,14 @@ class CrossEnvManager:
             True if Docker/Podman is installed, False otherwise
         """
         try:
-            # Try Docker first
-            result = subprocess.run(
-                ['docker', '--version'],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                check=False
-            )
+            runtime = _detect_runtime()
             
-            if result.returncode == 0:
-                logger.debug("Docker found: %s", result.stdout.decode().strip())
-                self.container_runtime = 'docker'
-                return True
-            
-            # Try Podman if Docker is not available
-            result = subprocess.run(
-                ['podman', '--version'],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                check=False
-            )
-            
-            if result.returncode == 0:
-                logger.debug("Podman found: %s", result.stdout.decode().strip())
-                self.container_runtime = 'podman'
-                return True
+            if runtime is None:
+                return False
             
-            return False
+            # Keep the absolute path so the runtime is not looked up on PATH again
+            self.container_runtime = runtime
+            return True
         except Exception as e:
             logger.error("Error checking container runtime: %s", str(e))
             return False
@@ -157,15 +439,44 @@ class CrossEnvManager:
         Returns:
             True if the image exists, False otherwise
         """
+        # Images do not disappear on their own, so only a positive result is cached
+        if image_name in self._image_cache:
+            return True
+        
         try:
+            podman = os.path.basename(self.container_runtime) == 'podman'
+            
+            # Look the image up in the local image store before asking the runtime;
+            # only a hit is trusted, the runtime may keep its images elsewhere
+            if podman:
+                stores, names = _PODMAN_IMAGE_STORES, {image_name, f'localhost/{image_name}'}
+            else:
+                stores, names = _DOCKER_IMAGE_STORES, {image_name}
+            
+            for store in stores:
+                store_names = _read_image_store(store)
+                if store_names and not names.isdisjoint(store_names):
+                    self._image_cache.add(image_name)
+                    return True
+            
+            if podman:
+                command = [self.container_runtime, 'image', 'exists', image_name]
+            else:
+                # Docker has no "image exists"; print only the ID instead of the full JSON
+                command = [self.container_runtime, 'image', 'inspect', '--format', '{{.Id}}', image_name]
+            
             result = subprocess.run(
-                [self.container_runtime, 'image', 'inspect', image_name],
+                command,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 check=False
             )
             
-            return result.returncode == 0
+            if result.returncode != 0:
+                return False
+            
+            self._image_cache.add(image_name)
+            return True
         except Exception as e:
             logger.error("Error checking container image: %s", str(e))
             return False
@@ -182,24 +493,38 @@ class CrossEnvManager:
         """
         try:
             # Generate Dockerfile
-            dockerfile_path = self._generate_dockerfile()
+            dockerfile = self._generate_dockerfile()
             
             # Build the image
             logger.info("Building container image %s", image_name)
             
+            # Pass the Dockerfile on standard input; nothing is copied from the
+            # build context, so an empty directory is uploaded as the context
             build_cmd = [
                 self.container_runtime, 'build',
                 '-t', image_name,
-                '-f', dockerfile_path,
-                os.path.dirname(dockerfile_path)
+                '-f', '-'
             ]
             
-            result = subprocess.run(
-                build_cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                check=False
-            )
+            # Podman keeps intermediate layers by default; with BuildKit, embed the
+            # cache metadata in the image so a rebuild can reuse its layers
+            if os.path.basename(self.container_runtime) != 'podman':
+                build_cmd.extend([
+                    '--build-arg', 'BUILDKIT_INLINE_CACHE=1',
+                    '--cache-from', image_name
+                ])
+            
+            with tempfile.TemporaryDirectory() as context_dir:
+                build_cmd.append(context_dir)
+                
+                result = subprocess.run(
+                    build_cmd,
+                    input=dockerfile.encode(),
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    env=dict(os.environ, DOCKER_BUILDKIT='1'),
+                    check=False
+                )
             
             if result.returncode != 0:
                 logger.error("Failed to build container image: %s", result.stderr.decode())
@@ -216,66 +541,9 @@ class CrossEnvManager:
         Generate a Dockerfile for the cross-compilation environment
         
         Returns:
-            Path to the generated Dockerfile
+            Content of the generated Dockerfile
         """
-        # Create the dockerfiles directory if it doesn't exist
-        dockerfiles_dir = os.path.join(
-            os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
-            'docker',
-            'toolchain'
-        )
-        os.makedirs(dockerfiles_dir, exist_ok=True)
-        
-        # Generate the Dockerfile
-        dockerfile_path = os.path.join(dockerfiles_dir, 'Dockerfile')
-        
-        with open(dockerfile_path, 'w') as f:
-            f.write(f"FROM {self.container_config.get('base_image', 'debian:bullseye')}\n\n")
-            
-            # Set up environment variables
-            f.write("ENV DEBIAN_FRONTEND=noninteractive\n")
-            f.write("ENV TZ=UTC\n\n")
-            
-            # Install dependencies
-            f.write("RUN apt-get update && \\\n")
-            f.write("    apt-get install -y --no-install-recommends \\\n")
-            f.write("        build-essential \\\n")
-            f.write("        ca-certificates \\\n")
-            f.write("        curl \\\n")
-            f.write("        git \\\n")
-            f.write("        make \\\n")
-            f.write("        cmake \\\n")
-            f.write("        python3 \\\n")
-            f.write("        python3-pip \\\n")
-            f.write("        wget \\\n")
-            f.write("        xz-utils \\\n")
-            f.write("        && \\\n")
-            f.write("    apt-get clean && \\\n")
-            f.write("    rm -rf /var/lib/apt/lists/*\n\n")
-            
-            # Install the toolchain
-            f.write("# Download and install the reMarkable toolchain\n")
-            f.write("RUN mkdir -p /opt/toolchain && \\\n")
-            f.write("    cd /opt/toolchain && \\\n")
-            f.write("    wget -q https://ipfs.eeems.website/ipfs/Qmdkdeh3bodwDLM9YvPrMoAi6dFYDDCodAnHvjG5voZxiC -O toolchain.tar.gz && \\\n")
-            f.write("    tar xf toolchain.tar.gz && \\\n")
-            f.write("    rm toolchain.tar.gz\n\n")
-            
-            # Set up environment variables for the toolchain
-            f.write("# Set up environment variables\n")
-            f.write("ENV PATH=\"/opt/toolchain/poky-2.1.3/sysroots/x86_64-pokysdk-linux/usr/bin:/opt/toolchain/poky-2.1.3/sysroots/x86_64-pokysdk-linux/usr/sbin:${PATH}\"\n")
-            f.write("ENV OECORE_NATIVE_SYSROOT=\"/opt/toolchain/poky-2.1.3/sysroots/x86_64-pokysdk-linux\"\n")
-            
-            # Create a working directory
-            f.write("\n# Create a working directory\n")
-            f.write("WORKDIR /workspaces\n\n")
-            
-            # Set the entrypoint
-            f.write("# Set the entrypoint\n")
-            f.write("ENTRYPOINT [\"/bin/bash\"]\n")
-        
-        logger.debug("Generated Dockerfile at %s", dockerfile_path)
-        return dockerfile_path
+        return _render_dockerfile(self.container_config.get('base_image', 'debian:bullseye'))
     
     def _get_container_image_name(self) -> str:
         """
@@ -284,7 +552,7 @@ class CrossEnvManager:
         Returns:
             Name of the container image
         """
-        return f"parabola-rm-builder-toolchain:{self.toolchain_version}"
+        return self._image_name
     
     def _check_toolchain(self, toolchain_path: str) -> bool:
         """
@@ -316,9 +584,7 @@ class CrossEnvManager:
         Returns:
             Path to the toolchain
         """
-        return os.path.expanduser(
-            self.direct_config.get('install_path', '~/.parabola-rm-builder/toolchain')
-        )
+        return self._toolchain_path
     
     def _install_toolchain(self, toolchain_path: str) -> bool:
         """
@@ -334,28 +600,51 @@ class CrossEnvManager:
             # Create the toolchain directory
             os.makedirs(toolchain_path, exist_ok=True)
             
-            # Download the toolchain
-            logger.info("Downloading reMarkable toolchain")
+            # Stream the archive from curl into tar, so it is never written to disk
+            logger.info("Downloading and extracting reMarkable toolchain")
             
-            toolchain_url = "https://ipfs.eeems.website/ipfs/Qmdkdeh3bodwDLM9YvPrMoAi6dFYDDCodAnHvjG5voZxiC"
-            toolchain_archive = os.path.join(toolchain_path, "toolchain.tar.gz")
+            expected_sha256 = self.direct_config.get('toolchain_sha256')
+            sha256 = hashlib.sha256()
             
-            # Download the toolchain archive
-            subprocess.run(
-                ['wget', '-q', toolchain_url, '-O', toolchain_archive],
-                check=True
+            curl_process = subprocess.Popen(
+                ['curl', '-fsSL', _TOOLCHAIN_URL],
+                stdout=subprocess.PIPE
+            )
+            tar_process = subprocess.Popen(
+                ['tar', 'xzf', '-', '-C', toolchain_path],
+                stdin=subprocess.PIPE
             )
             
-            # Extract the toolchain
-            logger.info("Extracting toolchain")
+            try:
+                # Hash the archive on its way to tar
+                for chunk in iter(lambda: curl_process.stdout.read(_DOWNLOAD_CHUNK_SIZE), b''):
+                    sha256.update(chunk)
+                    tar_process.stdin.write(chunk)
+            except BrokenPipeError:
+                # tar exited early; its return code tells why
+                pass
+            finally:
+                curl_process.stdout.close()
+                try:
+                    tar_process.stdin.close()
+                except BrokenPipeError:
+                    pass
             
-            subprocess.run(
-                ['tar', 'xf', toolchain_archive, '-C', toolchain_path],
-                check=True
-            )
+            curl_returncode = curl_process.wait()
+            tar_returncode = tar_process.wait()
             
-            # Remove the archive
-            os.remove(toolchain_archive)
+            if curl_returncode != 0:
+                logger.error("Failed to download toolchain (curl exited with %d)", curl_returncode)
+                return False
+            
+            if tar_returncode != 0:
+                logger.error("Failed to extract toolchain (tar exited with %d)", tar_returncode)
+                return False
+            
+            if expected_sha256 and sha256.hexdigest() != expected_sha256.lower():
+                logger.error("Toolchain checksum mismatch: expected %s, got %s", expected_sha256, sha256.hexdigest())
+                shutil.rmtree(toolchain_path, ignore_errors=True)
+                return False
             
             logger.info("Toolchain installed successfully")
             return True
@@ -377,104 +666,401 @@ class CrossEnvManager:
             'environment-setup-armv7at2hf-neon-poky-linux-gnueabi'
         )
         
-        # Parse the environment setup script
+        self.env_vars.update(self._load_env_setup(env_setup_file))
+        
+        # Add environment variables to the environment of the commands
+        self._base_env.update(self.env_vars)
+    
+    def _load_env_setup(self, env_setup_file: str) -> Dict[str, str]:
+        """
+        Load the variables exported by the environment setup script
+        
+        The parsed variables are cached on disk, keyed by the path, modification
+        time and size of the script, so the script is only parsed again after
+        it changes.
+        
+        Args:
+            env_setup_file: Path to the environment setup script
+        
+        Returns:
+            Dictionary of variable names to values
+        """
+        st = os.stat(env_setup_file)
+        key = hashlib.sha256(f'{os.path.abspath(env_setup_file)}:{st.st_mtime_ns}:{st.st_size}'.encode()).hexdigest()
+        
+        cache_dir = os.path.expanduser(ENV_CACHE_DIR)
+        cache_file = os.path.join(cache_dir, f'envvars-{key}.pkl')
+        
+        try:
+            with open(cache_file, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            pass
+        
         with open(env_setup_file, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line.startswith('export '):
-                    parts = line[7:].split('=', 1)
-                    if len(parts) == 2:
-                        key, value = parts
-                        # Remove quotes if present
-                        if value.startswith('"') and value.endswith('"'):
-                            value = value[1:-1]
-                        self.env_vars[key] = value
-        
-        # Add environment variables to the current process
-        for key, value in self.env_vars.items():
-            os.environ[key] = value
-    
-    def get_build_command(self, command: List[str], cwd: Optional[str] = None) -> List[str]:
+            env_vars = _parse_env_setup(f.read())
+        
+        # Write the cache entry to a sibling file and swap it in atomically
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=cache_dir, delete=False) as f:
+                pickle.dump(env_vars, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(f.name, cache_file)
+        except OSError as e:
+            logger.debug("Failed to cache toolchain environment: %s", str(e))
+        
+        return env_vars
+    
+    def is_local(self) -> bool:
+        """
+        Check if commands run directly on the host
+        
+        Returns:
+            True if commands run on the host, False if they run in a container
+        """
+        return self.env_type != 'container'
+    
+    def get_build_command(self, command: List[str], cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None, interactive: bool = False) -> List[str]:
         """
         Get the command to run in the cross-compilation environment
         
         Args:
             command: Command to run
             cwd: Working directory
+            env: Additional environment variables
+            interactive: Whether the command reads from standard input
         
         Returns:
             Command to run in the cross-compilation environment
         """
         if self.env_type == 'container':
-            return self._get_container_command(command, cwd)
+            return self._get_container_command(command, cwd, env, interactive)
         else:
             return command
     
-    def _get_container_command(self, command: List[str], cwd: Optional[str] = None) -> List[str]:
+    def _get_container_command(self, command: List[str], cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None, interactive: bool = False) -> List[str]:
         """
         Get the command to run in the containerized environment
         
         Args:
             command: Command to run
             cwd: Working directory
+            env: Additional environment variables
+            interactive: Whether the command reads from standard input
         
         Returns:
             Command to run in the containerized environment
         """
+        # Run the command in the session container if the working directory is
+        # visible there
+        if self._session_container and (not cwd or self._in_session(cwd)):
+            container_cmd = [self.container_runtime, 'exec']
+            
+            if interactive:
+                container_cmd.append('-i')
+            
+            if env:
+                for key, value in env.items():
+                    container_cmd.extend(['-e', f"{key}={value}"])
+            
+            if cwd:
+                container_cmd.extend(['-w', _abspath(cwd)])
+            
+            # exec does not go through the entrypoint, so no shell is needed
+            container_cmd.append(self._session_container)
+            container_cmd.extend(command)
+            
+            return container_cmd
+        
         container_cmd = [self.container_runtime, 'run', '--rm']
         
-        # Add resource limits
-        resource_limits = self.container_config.get('resource_limits', {})
-        if 'cpu' in resource_limits:
-            container_cmd.extend(['--cpus', str(resource_limits['cpu'])])
-        if 'memory' in resource_limits:
-            container_cmd.extend(['--memory', str(resource_limits['memory'])])
+        # Keep standard input open so it reaches the command
+        if interactive:
+            container_cmd.append('-i')
         
-        # Add volume mounts
-        volume_mounts = self.container_config.get('volume_mounts', [])
-        for mount in volume_mounts:
-            container_cmd.extend(['-v', mount])
+        # Add resource limits and volume mounts, including the current directory
+        container_cmd.extend(self._get_container_options({'/workspaces/cwd': cwd} if cwd else None))
         
-        # Add current directory as a volume
+        # Add environment variables
+        if env:
+            for key, value in env.items():
+                container_cmd.extend(['-e', f"{key}={value}"])
+        
+        # Work in the current directory
         if cwd:
-            container_cmd.extend(['-v', f"{os.path.abspath(cwd)}:/workspaces/cwd"])
             container_cmd.extend(['-w', '/workspaces/cwd'])
         
         # Add the image name
         container_cmd.append(self._get_container_image_name())
         
-        # Add the command
-        container_cmd.extend(['-c', ' '.join(command)])
+        # Add the command, quoted for the shell the image uses as its entrypoint
+        container_cmd.extend(['-c', ' '.join(map(shlex.quote, command))])
         
         return container_cmd
     
-    def run_command(self, command: List[str], cwd: Optional[str] = None) -> Tuple[int, str, str]:
+    def _get_container_options(self, extra_mounts: Optional[Dict[str, str]] = None) -> List[str]:
+        """
+        Get the resource limit and volume mount options of the container
+        
+        Volume mounts are keyed by their destination, so a mount replaces a
+        configured mount with the same destination instead of being passed
+        twice, which the container runtime rejects.
+        
+        Args:
+            extra_mounts: Dictionary of container paths to host paths to mount
+                in addition to the configured volume mounts
+        
+        Returns:
+            Options to pass to the container runtime
+        """
+        # The configured options only depend on the configuration, so parse them once
+        if self._container_options is None:
+            resource_options = []
+            
+            # Add resource limits
+            resource_limits = self.container_config.get('resource_limits', {})
+            if 'cpu' in resource_limits:
+                resource_options.extend(['--cpus', str(resource_limits['cpu'])])
+            if 'memory' in resource_limits:
+                resource_options.extend(['--memory', str(resource_limits['memory'])])
+            
+            # Add volume mounts (source:destination[:options]); host paths are
+            # resolved so different paths to the same directory compare equal
+            mounts = {}
+            for mount in self.container_config.get('volume_mounts', []):
+                parts = mount.split(':')
+                if len(parts) > 1 and os.path.isabs(parts[0]):
+                    parts[0] = _realpath(parts[0])
+                mounts[parts[1] if len(parts) > 1 else parts[0]] = ':'.join(parts)
+            
+            # Create the shared directories, so the container runtime does not
+            # create them owned by root
+            for path in self._shared_dirs:
+                os.makedirs(path, exist_ok=True)
+                mounts[path] = f"{_realpath(path)}:{path}"
+            
+            self._container_options = (resource_options, mounts)
+        
+        resource_options, mounts = self._container_options
+        
+        if extra_mounts:
+            mounts = dict(mounts)
+            for destination, source in extra_mounts.items():
+                mounts[destination] = f"{_realpath(source)}:{destination}"
+        
+        options = list(resource_options)
+        for mount in mounts.values():
+            options.extend(['-v', mount])
+        
+        return options
+    
+    def _in_session(self, path: str) -> bool:
+        """
+        Check if a path is visible at the same path in the session container
+        
+        Args:
+            path: Path to check
+        
+        Returns:
+            True if the path is inside a shared directory, False otherwise
+        """
+        path = _abspath(path)
+        return any(path == root or path.startswith(root + os.sep) for root in self._shared_dirs)
+    
+    def start_session(self) -> bool:
+        """
+        Start a long-lived container that subsequent commands are executed in
+        
+        The shared directories, including the repository, are mounted at the
+        same path inside the container, so commands working in them can be
+        executed there with "exec" instead of starting a new container for each
+        of them.
+        
+        Returns:
+            True if the container was started successfully, False otherwise
+        """
+        try:
+            container_cmd = [
+                self.container_runtime, 'run', '-d', '--rm',
+                '--name', f'parabola-rm-builder-{os.getpid()}'
+            ]
+            container_cmd.extend(self._get_container_options())
+            container_cmd.extend([self._get_container_image_name(), '-c', 'sleep infinity'])
+            
+            result = subprocess.run(
+                container_cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                check=False
+            )
+            
+            if result.returncode != 0:
+                logger.error("Failed to start session container: %s", result.stderr.decode())
+                return False
+            
+            self._session_container = result.stdout.decode().strip()
+            logger.debug("Started session container %s", self._session_container)
+            return True
+        except Exception as e:
+            logger.error("Error starting session container: %s", str(e))
+            return False
+    
+    def stop_session(self) -> None:
+        """
+        Stop the container started by start_session()
+        """
+        if not self._session_container:
+            return
+        
+        container, self._session_container = self._session_container, None
+        
+        try:
+            subprocess.run(
+                [self.container_runtime, 'rm', '-f', container],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                check=False
+            )
+        except Exception as e:
+            logger.error("Error stopping session container: %s", str(e))
+    
+    @contextlib.contextmanager
+    def session(self) -> Iterator[None]:
+        """
+        Run the commands issued within the context in a single container
+        
+        Outside of the containerized environment, or if the container cannot be
+        started, commands are run as usual.
+        """
+        if self.env_type != 'container' or self._session_container or not self.start_session():
+            yield
+            return
+        
+        try:
+            yield
+        finally:
+            self.stop_session()
+    
+    def run_command(self, command: List[str], cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None, input: Optional[str] = None) -> Tuple[int, str, str]:
         """
         Run a command in the cross-compilation environment
         
         Args:
             command: Command to run
             cwd: Working directory
+            env: Additional environment variables
+            input: Text to pass to the command on standard input
+        
+        Returns:
+            Tuple of (return code, stdout, stderr); only the last
+            OUTPUT_TAIL_LINES lines of each output are returned
+        """
+        return self._run_process(command, cwd, env, input)
+    
+    def _run_process(self, command: List[str], cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None, input: Optional[str] = None, steps: Optional[List[str]] = None) -> Tuple[int, str, str]:
+        """
+        Run a command in the cross-compilation environment, see run_command()
+        
+        Args:
+            command: Command to run
+            cwd: Working directory
+            env: Additional environment variables
+            input: Text to pass to the command on standard input
+            steps: List receiving the names of the batch steps marked in stdout
         
         Returns:
             Tuple of (return code, stdout, stderr)
         """
         try:
-            cmd = self.get_build_command(command, cwd)
+            cmd = self.get_build_command(command, cwd, env, input is not None)
+            
+            process_env = {**self._base_env, **env} if env else self._base_env
             
             logger.debug("Running command: %s", ' '.join(cmd))
             
+            # Pass an absolute executable and keep close_fds off (descriptors are
+            # non-inheritable by default) so CPython can use posix_spawn()
+            # instead of fork()+exec() when launching the command. Container
+            # commands get their working directory from the container runtime,
+            # and leaving cwd unset keeps them on that fast path as well.
             process = subprocess.Popen(
                 cmd,
+                executable=_resolve_executable(cmd[0], self._base_env.get('PATH')),
+                stdin=subprocess.PIPE if input is not None else None,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
-                cwd=cwd,
-                env=os.environ.copy()
+                bufsize=64 * 1024,
+                cwd=None if self.env_type == 'container' else cwd,
+                env=process_env,
+                close_fds=False
             )
             
-            stdout, stderr = process.communicate()
+            # Consume the output while the command runs, keeping only its tail, so
+            # the memory used does not grow with the length of a build log
+            stdout_tail = collections.deque(maxlen=OUTPUT_TAIL_LINES)
+            stderr_tail = collections.deque(maxlen=OUTPUT_TAIL_LINES)
+            readers = [
+                threading.Thread(target=_drain_output, args=(process.stdout, stdout_tail, steps), daemon=True),
+                threading.Thread(target=_drain_output, args=(process.stderr, stderr_tail), daemon=True)
+            ]
+            
+            for reader in readers:
+                reader.start()
+            
+            if input is not None:
+                try:
+                    process.stdin.write(input.encode())
+                except BrokenPipeError:
+                    pass
+                finally:
+                    process.stdin.close()
+            
+            for reader in readers:
+                reader.join()
+            
+            process.wait()
             
-            return process.returncode, stdout.decode(), stderr.decode()
+            return process.returncode, ''.join(stdout_tail), ''.join(stderr_tail)
         except Exception as e:
             logger.error("Error running command: %s", str(e))
-            return 1, '', str(e)
\ No newline at end of file
+            return 1, '', str(e)
+    
+    def run_batch(self, steps: List[Tuple[str, List[str]]], cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None) -> Tuple[int, str, str]:
+        """
+        Run a sequence of commands in the cross-compilation environment
+        
+        In the containerized environment all commands run in a single container,
+        so the container startup cost is paid once rather than once per command.
+        The sequence stops at the first command that fails.
+        
+        Args:
+            steps: List of (step name, command) tuples
+            cwd: Working directory
+            env: Additional environment variables
+        
+        Returns:
+            Tuple of (return code, name of the last step started, stderr)
+        """
+        if not steps:
+            return 0, '', ''
+        
+        if self.env_type != 'container':
+            for name, command in steps:
+                returncode, stdout, stderr = self.run_command(command, cwd=cwd, env=env)
+                
+                if returncode != 0:
+                    return returncode, name, stderr
+            
+            return 0, name, ''
+        
+        # Echo a marker before each command so the failing step can be told apart
+        script = ' && '.join(
+            f"echo {shlex.quote(_STEP_MARKER + name)} && {' '.join(map(shlex.quote, command))}" for name, command in steps
+        )
+        
+        # Track the markers while the output is read, as the tail of a long
+        # batch may no longer hold the marker of the failing step
+        started = []
+        returncode, stdout, stderr = self._run_process(['/bin/bash', '-c', script], cwd=cwd, env=env, steps=started)
+        
+        return returncode, started[-1] if started else steps[0][0], stderr
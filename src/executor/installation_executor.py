@@ -8,23 +8,20 @@ This module coordinates the entire installation process.
 """
 
 import os
-import sys
 import logging
 import tempfile
 import shutil
-import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, List, Optional, Tuple
 
-# Add the parent directory to the path
-sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
-
-from src.config_manager.config_manager import ConfigManager
-from src.cross_env.env_manager import CrossEnvManager
-from src.builders.bootloader.uboot_builder import UBootBuilder
-from src.builders.kernel.kernel_builder import KernelBuilder
-from src.builders.partition.partition_manager import PartitionManager
-from src.installers.system.system_installer import SystemInstaller
-from src.installers.desktop.desktop_configurator import DesktopConfigurator
+from ..config_manager.config_manager import ConfigManager
+from ..cross_env.env_manager import CrossEnvManager
+from ..builders.bootloader.uboot_builder import UBootBuilder
+from ..builders.kernel.kernel_builder import KernelBuilder
+from ..builders.orchestrator import BuildOrchestrator
+from ..builders.partition.partition_manager import PartitionManager
+from ..installers.system.system_installer import SystemInstaller
+from ..installers.desktop.desktop_configurator import DesktopConfigurator
 
 logger = logging.getLogger(__name__)
 
@@ -77,37 +74,36 @@ class InstallationExecutor:
         try:
             logger.info("Starting installation process...")
             
-            # Build components if not skipped
-            if not skip_build:
-                if not self._build_components():
-                    return False
-            
-            # Partition and format the device
-            if not self._partition_and_format(device):
-                return False
-            
-            # Install the bootloader
-            if not self._install_bootloader(device):
-                return False
-            
-            # Mount partitions
-            mount_points = self._create_mount_points()
-            
-            if not self.partition_manager.mount_partitions(device, mount_points):
-                return False
-            
-            try:
-                # Install the system
-                if not self._install_system(mount_points):
+            # Run all commands of the installation in a single container
+            with self.env_manager.session():
+                # Build components if not skipped, before the device is touched, so
+                # that a failed build leaves it as it was
+                if not skip_build:
+                    if not self._build_components():
+                        return False
+                
+                # Partition and format the device, installing the bootloader meanwhile
+                if not self._partition_and_format(device, install_bootloader=True):
                     return False
                 
-                # Install and configure the desktop environment
-                if not self._install_desktop(mount_points):
+                # Mount partitions
+                mount_points = self._create_mount_points()
+                
+                if not self.partition_manager.mount_partitions(device, mount_points):
                     return False
-            finally:
-                # Unmount partitions
-                mount_point_paths = [mount_points[p] for p in sorted(mount_points.keys(), reverse=True)]
-                self.partition_manager.unmount_partitions(mount_point_paths)
+                
+                try:
+                    # Install the system
+                    if not self._install_system(mount_points):
+                        return False
+                    
+                    # Install and configure the desktop environment
+                    if not self._install_desktop(mount_points):
+                        return False
+                finally:
+                    # Unmount partitions
+                    mount_point_paths = [mount_points[p] for p in sorted(mount_points.keys(), reverse=True)]
+                    self.partition_manager.unmount_partitions(mount_point_paths)
             
             logger.info("Installation completed successfully")
             return True
@@ -125,16 +121,10 @@ class InstallationExecutor:
         try:
             logger.info("Building components...")
             
-            # Build the bootloader
-            logger.info("Building bootloader...")
-            if not self.bootloader_builder.build():
-                logger.error("Failed to build bootloader")
-                return False
-            
-            # Build the kernel
-            logger.info("Building kernel...")
-            if not self.kernel_builder.build():
-                logger.error("Failed to build kernel")
+            # The builds are independent, so run them at the same time, sharing
+            # the configured make jobs between them
+            if not BuildOrchestrator(self.config, self.env_manager).build([UBootBuilder, KernelBuilder]):
+                logger.error("Failed to build components")
                 return False
             
             logger.info("Components built successfully")
@@ -143,15 +133,21 @@ class InstallationExecutor:
             logger.error("Error building components: %s", str(e))
             return False
     
-    def _partition_and_format(self, device: str) -> bool:
+    def _partition_and_format(self, device: str, install_bootloader: bool = False) -> bool:
         """
         Partition and format the device
         
+        The bootloader lives in the boot0 hardware partition, which is separate
+        from the partitions being formatted, so it can be installed while the
+        partitions are formatted.
+        
         Args:
             device: Device to partition and format
+            install_bootloader: Whether to install the bootloader while formatting
         
         Returns:
-            True if the device was partitioned and formatted successfully, False otherwise
+            True if the device was partitioned and formatted successfully (and the
+            bootloader installed, if requested), False otherwise
         """
         try:
             logger.info("Partitioning and formatting device...")
@@ -163,10 +159,24 @@ class InstallationExecutor:
             
             # Wait for the kernel to recognize the new partition table
             logger.info("Waiting for the kernel to recognize the new partition table...")
-            time.sleep(2)
+            if not self.partition_manager.wait_for_partitions(device):
+                return False
             
             # Format the partitions
-            if not self.partition_manager.format_partitions(device):
+            if install_bootloader:
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    format_future = executor.submit(self.partition_manager.format_partitions, device)
+                    bootloader_future = executor.submit(self._install_bootloader, device)
+                    
+                    formatted = format_future.result()
+                    bootloader_installed = bootloader_future.result()
+                
+                if not bootloader_installed:
+                    return False
+            else:
+                formatted = self.partition_manager.format_partitions(device)
+            
+            if not formatted:
                 logger.error("Failed to format partitions")
                 return False
             
@@ -212,7 +222,6 @@ class InstallationExecutor:
         """
         # Create temporary mount points
         mount_dir = os.path.join(self.output_dir, 'mnt')
-        os.makedirs(mount_dir, exist_ok=True)
         
         mount_points = {
             1: os.path.join(mount_dir, 'p1'),  # FAT partition
@@ -220,9 +229,18 @@ class InstallationExecutor:
             3: os.path.join(mount_dir, 'p3')   # Home partition
         }
         
-        # Create the mount point directories
+        # List the parent once instead of checking each mount point separately
+        try:
+            with os.scandir(mount_dir) as entries:
+                existing = {entry.name for entry in entries if entry.is_dir()}
+        except FileNotFoundError:
+            os.makedirs(mount_dir)
+            existing = set()
+        
+        # Create the missing mount point directories
         for mount_point in mount_points.values():
-            os.makedirs(mount_point, exist_ok=True)
+            if os.path.basename(mount_point) not in existing:
+                os.makedirs(mount_point, exist_ok=True)
         
         return mount_points
     
@@ -8,20 +8,205 @@ This module handles the installation and configuration of the desktop environmen
 """
 
 import os
-import sys
+import json
+import hashlib
 import logging
-import tempfile
 import shutil
-import re
-from typing import Dict, Any, List, Optional, Tuple
+import shlex
+import string
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List
 
-# Add the parent directory to the path
-sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
-
-from src.cross_env.env_manager import CrossEnvManager
+from ...cross_env.env_manager import CrossEnvManager
 
 logger = logging.getLogger(__name__)
 
+# Directories of the templates of generated files and of the files installed as is
+_TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+_ASSET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+
+# Stamp recording the configuration the desktop environment was installed with
+CONFIG_STAMP_PATH = os.path.join('var', 'lib', 'parabola-rm', 'desktop-config.sha256')
+
+# Battery charge indicator script, relative to the mount point
+BATTERY_MONITOR_PATH = os.path.join('usr', 'sbin', 'battery-monitor.sh')
+
+# Files generated by the installation, relative to the mount point
+INSTALLED_FILES = (
+    os.path.join('etc', 'X11', 'xorg.conf'),
+    os.path.join('var', 'lib', 'remarkable', 'epdc-init-auto'),
+    os.path.join('root', '.xserverrc'),
+    os.path.join('root', '.xinitrc'),
+    os.path.join('root', '.bash_profile'),
+    os.path.join('root', 'configure-xfce.sh')
+)
+
+# pacman invocation installing packages, skipping those already installed; the
+# sync databases are refreshed and the system upgraded in the same transaction,
+# since it is the only pacman call of the installation
+PACMAN_INSTALL_COMMAND = ('pacman', '-Syu', '--noconfirm', '--needed')
+
+# Packages of the X server and the drivers used on the reMarkable
+XORG_PACKAGES = ['xorg-server', 'xf86-video-fbdev', 'xf86-input-evdev']
+
+# Packages of the Xfce desktop environment
+XFCE_PACKAGES = [
+    'exo',
+    'garcon',
+    'thunar',
+    'thunar-volman',
+    'tumbler',
+    'xfce4-appfinder',
+    'xfce4-panel',
+    'xfce4-session',
+    'xfce4-settings',
+    'xfce4-terminal',
+    'xfconf',
+    'xfdesktop',
+    'xfwm4',
+    'xfwm4-themes'
+]
+
+# Packages of the Onboard virtual keyboard
+VIRTUAL_KEYBOARD_PACKAGES = ['onboard', 'ttf-dejavu']
+
+# Packages of the battery charge indicator
+BATTERY_MONITOR_PACKAGES = ['xfce4-genmon-plugin']
+
+# EPDC initialization script enabling automatic screen updates
+EPDC_INIT_SCRIPT = """\
+#!/bin/sh
+echo 1 > /sys/class/graphics/fb0/epdc_update_mode
+"""
+
+# X server, X session and login shell startup files of the root user
+XSERVERRC = """\
+#!/bin/sh
+/var/lib/remarkable/epdc-init-auto
+exec /usr/bin/Xorg -nocursor
+"""
+
+XINITRC = """\
+export GTK_OVERLAY_SCROLLING=0
+# Configure Xfce settings
+~/configure-xfce.sh
+
+dbus-launch xfce4-session
+"""
+
+BASH_PROFILE = """\
+if [[ -z $DISPLAY ]] && [[ $(tty) = /dev/tty1 ]]; then
+    startx
+fi
+"""
+
+# Startup files of the root user, as (name, content, mode)
+AUTO_LOADING_FILES = (
+    ('.xserverrc', XSERVERRC, 0o755),
+    ('.xinitrc', XINITRC, 0o755),
+    ('.bash_profile', BASH_PROFILE, 0o644)
+)
+
+# Optional sections of the Xfce configuration script
+XFCE_OVERLAY_SCROLLING_SECTION = """\
+# Disable overlay scrolling
+gsettings set org.gnome.desktop.interface overlay-scrolling false
+
+"""
+
+XFCE_ANTIALIASING_SECTION = 'xfconf-query -c xsettings -p /Xft/Antialias -s 0\n'
+
+XFCE_DPI_SECTION = 'xfconf-query -c xsettings -p /Xft/DPI -s -1\n'
+
+XFCE_BUTTON_IMAGES_SECTION = """\
+# Disable button images
+xfconf-query -c xsettings -p /Gtk/ButtonImages -s 0
+"""
+
+XFCE_MENU_IMAGES_SECTION = """\
+# Disable menu images
+xfconf-query -c xsettings -p /Gtk/MenuImages -s 0
+"""
+
+XFCE_SHADOWS_SECTION = """\
+# Disable shadows
+xfconf-query -c xfwm4 -p /general/show_dock_shadow -s false
+xfconf-query -c xfwm4 -p /general/show_frame_shadow -s false
+"""
+
+# Panel entry of the battery charge indicator, added to the Xfce configuration
+# script once the indicator is installed. The script runs on every login, so
+# the entry is only added if no panel plugin runs the indicator yet.
+XFCE_BATTERY_MONITOR_SECTION = """\
+
+# Add battery monitor to panel
+if ! xfconf-query -c xfce4-panel -l -v | grep -q /usr/sbin/battery-monitor.sh; then
+    xfce4-panel --add=genmon
+    # Configure the battery monitor
+    xfconf-query -c xfce4-panel -p /plugins/plugin-1/command -s "/usr/sbin/battery-monitor.sh"
+    xfconf-query -c xfce4-panel -p /plugins/plugin-1/use-label -s false
+fi
+"""
+
+# Optional sections of the Xfce configuration script, as (placeholder, setting
+# below the ui configuration, default value, value enabling the section, section)
+XFCE_OPTIONAL_SECTIONS = (
+    ('overlay_scrolling', 'epaper_optimizations.disable_overlay_scrolling', True, True, XFCE_OVERLAY_SCROLLING_SECTION),
+    ('antialiasing', 'font.disable_antialiasing', True, True, XFCE_ANTIALIASING_SECTION),
+    ('dpi', 'font.custom_dpi', False, False, XFCE_DPI_SECTION),
+    ('button_images', 'epaper_optimizations.disable_button_images', True, True, XFCE_BUTTON_IMAGES_SECTION),
+    ('menu_images', 'epaper_optimizations.disable_menu_images', True, True, XFCE_MENU_IMAGES_SECTION),
+    ('shadows', 'epaper_optimizations.disable_shadows', True, True, XFCE_SHADOWS_SECTION)
+)
+
+def _get_setting(config: Dict[str, Any], path: str, default: Any) -> Any:
+    """
+    Get a nested setting from a configuration dictionary
+    
+    Args:
+        config: Configuration dictionary
+        path: Dot-separated keys of the setting
+        default: Value to return if the setting is not present
+    
+    Returns:
+        Value of the setting
+    """
+    for key in path.split('.'):
+        if not isinstance(config, dict) or key not in config:
+            return default
+        config = config[key]
+    
+    return config
+
+@functools.lru_cache(maxsize=None)
+def _load_template(name: str) -> string.Template:
+    """
+    Load a template of a generated file, parsing it only once
+    
+    Args:
+        name: File name of the template
+    
+    Returns:
+        Template object
+    """
+    with open(os.path.join(_TEMPLATE_DIR, name), 'r') as f:
+        return string.Template(f.read())
+
+def _write_file(path: str, content: str, mode: int) -> None:
+    """
+    Write a file and set its mode through a single open file
+    
+    Args:
+        path: Path to the file
+        content: Content of the file
+        mode: Permission bits of the file
+    """
+    with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode), 'w') as f:
+        # Set the mode on the descriptor, since the creation mode is masked by the umask
+        os.fchmod(f.fileno(), mode)
+        f.write(content)
+
 class DesktopConfigurator:
     """
     Desktop Environment Configurator
@@ -40,6 +225,20 @@ class DesktopConfigurator:
         self.config = config
         self.env_manager = env_manager
         self.desktop_config = config.get('desktop', {})
+        self._created_dirs = set()
+    
+    def _ensure_dir(self, path: str) -> None:
+        """
+        Create a directory unless it was already created by this configurator
+        
+        Args:
+            path: Path to the directory
+        """
+        if path in self._created_dirs:
+            return
+        
+        os.makedirs(path, exist_ok=True)
+        self._created_dirs.add(path)
     
     def install(self, mount_point: str) -> bool:
         """
@@ -59,191 +258,183 @@ class DesktopConfigurator:
                 logger.info("No desktop environment selected, skipping installation")
                 return True
             
-            # Install Xorg
-            if not self._install_xorg(mount_point):
-                return False
-            
-            # Install the desktop environment
-            if environment == 'xfce':
-                if not self._install_xfce(mount_point):
-                    return False
-            else:
+            if environment != 'xfce':
                 logger.warning("Unsupported desktop environment: %s", environment)
                 return False
             
-            # Configure automatic loading
-            if not self._configure_auto_loading(mount_point):
-                return False
+            # Skip the installation if it was already done with the same configuration
+            config_digest = self._get_config_digest()
+            
+            if self._is_installed(mount_point, config_digest):
+                logger.info("Desktop configuration unchanged, skipping installation")
+                return True
             
-            # Configure e-paper optimizations
-            if not self._configure_epaper_optimizations(mount_point):
+            # Install all packages in a single pacman transaction
+            if not self._install_packages(mount_point, self._collect_packages()):
                 return False
             
-            # Configure input methods
-            if not self._configure_input_methods(mount_point):
+            # The configuration steps write distinct files, so run them at the same time
+            configuration_steps = [
+                self._configure_xorg,
+                self._configure_auto_loading,
+                self._configure_epaper_optimizations,
+                self._configure_input_methods
+            ]
+            
+            # Create the root user's home directory shared by several steps up front
+            self._ensure_dir(os.path.join(mount_point, 'root'))
+            
+            with ThreadPoolExecutor(max_workers=len(configuration_steps)) as executor:
+                results = list(executor.map(lambda step: step(mount_point), configuration_steps))
+            
+            if not all(results):
                 return False
             
+            # Remember the configuration the desktop environment was installed with
+            self._write_config_stamp(mount_point, config_digest)
+            
             logger.info("Desktop environment installed and configured successfully")
             return True
         except Exception as e:
-            logger.error("Error installing desktop environment: %s", str(e))
+            logger.error("Error installing desktop environment: %s", e)
             return False
     
-    def _install_xorg(self, mount_point: str) -> bool:
+    def _get_config_digest(self) -> str:
+        """
+        Compute a digest of everything the installed files are generated from
+        
+        Returns:
+            Hex digest of the desktop configuration, this module, its assets and templates
         """
-        Install Xorg
+        digest = hashlib.sha256()
+        digest.update(json.dumps(self.desktop_config, sort_keys=True, default=str).encode())
+        
+        paths = [os.path.abspath(__file__)]
+        for directory in (_ASSET_DIR, _TEMPLATE_DIR):
+            paths.extend(os.path.join(directory, name) for name in sorted(os.listdir(directory)))
+        
+        for path in paths:
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        
+        return digest.hexdigest()
+    
+    def _is_installed(self, mount_point: str, config_digest: str) -> bool:
+        """
+        Check whether the desktop environment is installed with the given configuration
         
         Args:
             mount_point: Mount point for the system partition
+            config_digest: Digest returned by _get_config_digest
         
         Returns:
-            True if Xorg was installed successfully, False otherwise
+            True if the stamp matches and all installed files exist, False otherwise
         """
         try:
-            logger.info("Installing Xorg...")
-            
-            # Create a pacman command to install Xorg
-            pacman_cmd = [
-                'chroot',
-                mount_point,
-                'pacman',
-                '-S',
-                '--noconfirm',
-                'xorg-server',
-                'xf86-video-fbdev',
-                'xf86-input-evdev'
-            ]
+            with open(os.path.join(mount_point, CONFIG_STAMP_PATH), 'r') as f:
+                if f.read().strip() != config_digest:
+                    return False
+        except OSError:
+            return False
+        
+        return all(os.path.isfile(os.path.join(mount_point, path)) for path in INSTALLED_FILES)
+    
+    def _write_config_stamp(self, mount_point: str, config_digest: str) -> None:
+        """
+        Record the configuration the desktop environment was installed with
+        
+        Args:
+            mount_point: Mount point for the system partition
+            config_digest: Digest returned by _get_config_digest
+        """
+        try:
+            stamp_path = os.path.join(mount_point, CONFIG_STAMP_PATH)
+            self._ensure_dir(os.path.dirname(stamp_path))
+            
+            with open(stamp_path, 'w') as f:
+                f.write(config_digest + '\n')
+        except OSError as e:
+            logger.warning("Failed to write desktop configuration stamp: %s", e)
+    
+    def _collect_packages(self) -> List[str]:
+        """
+        Collect the packages of the desktop environment and the enabled features
+        
+        Returns:
+            List of package names
+        """
+        packages = XORG_PACKAGES + XFCE_PACKAGES
+        
+        if self.desktop_config.get('input', {}).get('virtual_keyboard', {}).get('enable', True):
+            packages = packages + VIRTUAL_KEYBOARD_PACKAGES
+        
+        return packages + BATTERY_MONITOR_PACKAGES
+    
+    def _install_packages(self, mount_point: str, packages: List[str]) -> bool:
+        """
+        Install packages into the system with pacman
+        
+        Args:
+            mount_point: Mount point for the system partition
+            packages: Packages to install
+        
+        Returns:
+            True if the packages were installed successfully, False otherwise
+        """
+        try:
+            logger.info("Installing %d packages...", len(packages))
+            
+            pacman_cmd = ['chroot', mount_point, *PACMAN_INSTALL_COMMAND, *packages]
             
-            # Run the pacman command
             returncode, stdout, stderr = self.env_manager.run_command(
                 pacman_cmd,
                 cwd=None
             )
             
             if returncode != 0:
-                logger.error("Failed to install Xorg: %s", stderr)
+                logger.error("Failed to install packages: %s", stderr)
                 return False
             
-            # Create the Xorg configuration
-            xorg_conf_dir = os.path.join(mount_point, 'etc', 'X11')
-            os.makedirs(xorg_conf_dir, exist_ok=True)
-            
-            xorg_conf_path = os.path.join(xorg_conf_dir, 'xorg.conf')
-            
-            with open(xorg_conf_path, 'w') as f:
-                f.write('Section "ServerLayout"\n')
-                f.write('    Identifier     "Default Layout"\n')
-                f.write('    Screen         0 "Screen0" 0 0\n')
-                f.write('    InputDevice    "Wacom" "CorePointer"\n')
-                f.write('    InputDevice    "Touchscreen" "CorePointer"\n')
-                f.write('    InputDevice    "Keyboard0" "CoreKeyboard"\n')
-                f.write('EndSection\n\n')
-                
-                f.write('Section "InputDevice"\n')
-                f.write('    Identifier     "Keyboard0"\n')
-                f.write('    Driver         "kbd"\n')
-                f.write('    Option         "XkbLayout" "us"\n')
-                f.write('EndSection\n\n')
-                
-                f.write('Section "InputDevice"\n')
-                f.write('    Identifier     "Wacom"\n')
-                f.write('    Driver         "evdev"\n')
-                f.write('    Option         "Device" "/dev/input/event1"\n')
-                f.write('    Option         "Name" "Wacom I2C Digitizer"\n')
-                f.write('    Option         "Calibration" "0 20966 0 15725"\n')
-                f.write('    Option         "InvertY" "true"\n')
-                f.write('EndSection\n\n')
-                
-                f.write('Section "InputDevice"\n')
-                f.write('    Identifier     "Touchscreen"\n')
-                f.write('    Driver         "evdev"\n')
-                f.write('    Option         "Device" "/dev/input/event2"\n')
-                f.write('    Option         "Name" "cyttsp5_mt"\n')
-                f.write('    Option         "Calibration" "0 20966 0 15725"\n')
-                f.write('    Option         "InvertY" "true"\n')
-                f.write('EndSection\n\n')
-                
-                f.write('Section "Device"\n')
-                f.write('    Identifier     "Card0"\n')
-                f.write('    Driver         "fbdev"\n')
-                f.write('    Option         "fbdev" "/dev/fb0"\n')
-                f.write('EndSection\n\n')
-                
-                f.write('Section "Screen"\n')
-                f.write('    Identifier     "Screen0"\n')
-                f.write('    Device         "Card0"\n')
-                f.write('    DefaultDepth    16\n')
-                f.write('EndSection\n')
-            
-            # Create the EPDC initialization script
-            remarkable_dir = os.path.join(mount_point, 'var', 'lib', 'remarkable')
-            os.makedirs(remarkable_dir, exist_ok=True)
-            
-            epdc_init_path = os.path.join(remarkable_dir, 'epdc-init-auto')
-            
-            with open(epdc_init_path, 'w') as f:
-                f.write('#!/bin/sh\n')
-                f.write('echo 1 > /sys/class/graphics/fb0/epdc_update_mode\n')
-            
-            # Make the script executable
-            os.chmod(epdc_init_path, 0o755)
-            
-            logger.info("Xorg installed successfully")
+            logger.info("Packages installed successfully")
             return True
         except Exception as e:
-            logger.error("Error installing Xorg: %s", str(e))
+            logger.error("Error installing packages: %s", e)
             return False
     
-    def _install_xfce(self, mount_point: str) -> bool:
+    def _configure_xorg(self, mount_point: str) -> bool:
         """
-        Install Xfce
+        Configure Xorg
         
         Args:
             mount_point: Mount point for the system partition
         
         Returns:
-            True if Xfce was installed successfully, False otherwise
+            True if Xorg was configured successfully, False otherwise
         """
         try:
-            logger.info("Installing Xfce...")
-            
-            # Create a pacman command to install Xfce
-            pacman_cmd = [
-                'chroot',
-                mount_point,
-                'pacman',
-                '-S',
-                '--noconfirm',
-                'exo',
-                'garcon',
-                'thunar',
-                'thunar-volman',
-                'tumbler',
-                'xfce4-appfinder',
-                'xfce4-panel',
-                'xfce4-session',
-                'xfce4-settings',
-                'xfce4-terminal',
-                'xfconf',
-                'xfdesktop',
-                'xfwm4',
-                'xfwm4-themes'
-            ]
+            logger.info("Configuring Xorg...")
             
-            # Run the pacman command
-            returncode, stdout, stderr = self.env_manager.run_command(
-                pacman_cmd,
-                cwd=None
-            )
+            # Create the Xorg configuration
+            xorg_conf_dir = os.path.join(mount_point, 'etc', 'X11')
+            self._ensure_dir(xorg_conf_dir)
             
-            if returncode != 0:
-                logger.error("Failed to install Xfce: %s", stderr)
-                return False
+            xorg_conf_path = os.path.join(xorg_conf_dir, 'xorg.conf')
+            
+            shutil.copyfile(os.path.join(_ASSET_DIR, 'xorg.conf'), xorg_conf_path)
+            
+            # Create the EPDC initialization script
+            remarkable_dir = os.path.join(mount_point, 'var', 'lib', 'remarkable')
+            self._ensure_dir(remarkable_dir)
+            
+            epdc_init_path = os.path.join(remarkable_dir, 'epdc-init-auto')
+            
+            # Write the script as an executable
+            _write_file(epdc_init_path, EPDC_INIT_SCRIPT, 0o755)
             
-            logger.info("Xfce installed successfully")
+            logger.info("Xorg configured successfully")
             return True
         except Exception as e:
-            logger.error("Error installing Xfce: %s", str(e))
+            logger.error("Error configuring Xorg: %s", e)
             return False
     
     def _configure_auto_loading(self, mount_point: str) -> bool:
@@ -261,41 +452,16 @@ class DesktopConfigurator:
             
             # Create the root user's home directory if it doesn't exist
             root_home = os.path.join(mount_point, 'root')
-            os.makedirs(root_home, exist_ok=True)
-            
-            # Create .xserverrc
-            xserverrc_path = os.path.join(root_home, '.xserverrc')
-            
-            with open(xserverrc_path, 'w') as f:
-                f.write('#!/bin/sh\n')
-                f.write('/var/lib/remarkable/epdc-init-auto\n')
-                f.write('exec /usr/bin/Xorg -nocursor\n')
-            
-            # Make the script executable
-            os.chmod(xserverrc_path, 0o755)
-            
-            # Create .xinitrc
-            xinitrc_path = os.path.join(root_home, '.xinitrc')
-            
-            with open(xinitrc_path, 'w') as f:
-                f.write('export GTK_OVERLAY_SCROLLING=0\n')
-                f.write('dbus-launch xfce4-session\n')
-            
-            # Make the script executable
-            os.chmod(xinitrc_path, 0o755)
-            
-            # Create .bash_profile
-            bash_profile_path = os.path.join(root_home, '.bash_profile')
+            self._ensure_dir(root_home)
             
-            with open(bash_profile_path, 'w') as f:
-                f.write('if [[ -z $DISPLAY ]] && [[ $(tty) = /dev/tty1 ]]; then\n')
-                f.write('    startx\n')
-                f.write('fi\n')
+            # Create the startup files
+            for name, content, mode in AUTO_LOADING_FILES:
+                _write_file(os.path.join(root_home, name), content, mode)
             
             logger.info("Automatic loading configured successfully")
             return True
         except Exception as e:
-            logger.error("Error configuring automatic loading: %s", str(e))
+            logger.error("Error configuring automatic loading: %s", e)
             return False
     
     def _configure_epaper_optimizations(self, mount_point: str) -> bool:
@@ -311,109 +477,50 @@ class DesktopConfigurator:
         try:
             logger.info("Configuring e-paper optimizations...")
             
-            # Install Onboard virtual keyboard
-            if self.desktop_config.get('input', {}).get('virtual_keyboard', {}).get('enable', True):
-                pacman_cmd = [
-                    'chroot',
-                    mount_point,
-                    'pacman',
-                    '-S',
-                    '--noconfirm',
-                    'onboard',
-                    'ttf-dejavu'
-                ]
-                
-                returncode, stdout, stderr = self.env_manager.run_command(
-                    pacman_cmd,
-                    cwd=None
-                )
-                
-                if returncode != 0:
-                    logger.error("Failed to install Onboard virtual keyboard: %s", stderr)
-                    return False
-            
             # Create a script to configure Xfce settings
-            xfce_config_path = os.path.join(mount_point, 'root', 'configure-xfce.sh')
-            
-            with open(xfce_config_path, 'w') as f:
-                f.write('#!/bin/sh\n\n')
-                
-                # Disable overlay scrolling
-                if self.desktop_config.get('ui', {}).get('epaper_optimizations', {}).get('disable_overlay_scrolling', True):
-                    f.write('# Disable overlay scrolling\n')
-                    f.write('gsettings set org.gnome.desktop.interface overlay-scrolling false\n\n')
-                
-                # Configure appearance
-                f.write('# Configure appearance\n')
-                f.write(f'xfconf-query -c xsettings -p /Net/ThemeName -s "{self.desktop_config.get("ui", {}).get("theme", "High Contrast")}"\n')
-                f.write(f'xfconf-query -c xsettings -p /Net/IconThemeName -s "{self.desktop_config.get("ui", {}).get("icon_theme", "High Contrast")}"\n')
-                
-                # Configure fonts
-                font = self.desktop_config.get('ui', {}).get('font', {})
-                f.write('# Configure fonts\n')
-                f.write(f'xfconf-query -c xsettings -p /Gtk/FontName -s "{font.get("default_font", "System-ui Regular")}"\n')
-                
-                if font.get('disable_antialiasing', True):
-                    f.write('xfconf-query -c xsettings -p /Xft/Antialias -s 0\n')
-                
-                if not font.get('custom_dpi', False):
-                    f.write('xfconf-query -c xsettings -p /Xft/DPI -s -1\n')
-                
-                # Configure toolbar style
-                f.write('# Configure toolbar style\n')
-                f.write('xfconf-query -c xsettings -p /Gtk/ToolbarStyle -s "text"\n')
-                
-                # Disable button and menu images
-                if self.desktop_config.get('ui', {}).get('epaper_optimizations', {}).get('disable_button_images', True):
-                    f.write('# Disable button images\n')
-                    f.write('xfconf-query -c xsettings -p /Gtk/ButtonImages -s 0\n')
-                
-                if self.desktop_config.get('ui', {}).get('epaper_optimizations', {}).get('disable_menu_images', True):
-                    f.write('# Disable menu images\n')
-                    f.write('xfconf-query -c xsettings -p /Gtk/MenuImages -s 0\n')
-                
-                # Configure desktop background
-                f.write('# Configure desktop background\n')
-                f.write('xfconf-query -c xfce4-desktop -p /backdrop/screen0/monitor0/workspace0/color-style -s 0\n')
-                f.write('xfconf-query -c xfce4-desktop -p /backdrop/screen0/monitor0/workspace0/rgba1 -s "ffffff"\n')
-                f.write('xfconf-query -c xfce4-desktop -p /backdrop/screen0/monitor0/workspace0/image-style -s 0\n')
-                
-                # Configure window manager
-                f.write('# Configure window manager\n')
-                f.write('xfconf-query -c xfwm4 -p /general/theme -s "Default-xhdpi"\n')
-                f.write('xfconf-query -c xfwm4 -p /general/title_font -s "System-ui Bold"\n')
-                
-                # Disable shadows
-                if self.desktop_config.get('ui', {}).get('epaper_optimizations', {}).get('disable_shadows', True):
-                    f.write('# Disable shadows\n')
-                    f.write('xfconf-query -c xfwm4 -p /general/show_dock_shadow -s false\n')
-                    f.write('xfconf-query -c xfwm4 -p /general/show_frame_shadow -s false\n')
-                
-                # Configure panel
-                f.write('# Configure panel\n')
-                f.write('xfconf-query -c xfce4-panel -p /panels/panel-1/size -s 50\n')
-                f.write('xfconf-query -c xfce4-panel -p /panels/panel-1/icon-size -s 32\n')
-            
-            # Make the script executable
-            os.chmod(xfce_config_path, 0o755)
-            
-            # Add the script to .xinitrc
-            xinitrc_path = os.path.join(mount_point, 'root', '.xinitrc')
-            
-            with open(xinitrc_path, 'r') as f:
-                content = f.read()
-            
-            content = content.replace('dbus-launch xfce4-session', '# Configure Xfce settings\n~/configure-xfce.sh\n\ndbus-launch xfce4-session')
-            
-            with open(xinitrc_path, 'w') as f:
-                f.write(content)
+            self._write_xfce_config(mount_point)
             
             logger.info("E-paper optimizations configured successfully")
             return True
         except Exception as e:
-            logger.error("Error configuring e-paper optimizations: %s", str(e))
+            logger.error("Error configuring e-paper optimizations: %s", e)
             return False
     
+    def _write_xfce_config(self, mount_point: str) -> None:
+        """
+        Write the script configuring Xfce on login
+        
+        The battery monitor is only added to the panel if it is installed.
+        
+        Args:
+            mount_point: Mount point for the system partition
+        """
+        xfce_config_path = os.path.join(mount_point, 'root', 'configure-xfce.sh')
+        
+        ui = self.desktop_config.get('ui', {})
+        font = ui.get('font', {})
+        
+        # Include the optional sections enabled by the configuration
+        sections = {
+            placeholder: section if bool(_get_setting(ui, path, default)) == enabling_value else ''
+            for placeholder, path, default, enabling_value, section in XFCE_OPTIONAL_SECTIONS
+        }
+        
+        installed = os.path.isfile(os.path.join(mount_point, BATTERY_MONITOR_PATH))
+        sections['battery_monitor'] = XFCE_BATTERY_MONITOR_SECTION if installed else ''
+        
+        # Render the script from its template; the configured values are quoted,
+        # so they cannot break out of the commands
+        script = _load_template('configure-xfce.sh').substitute(
+            sections,
+            theme=shlex.quote(ui.get('theme', 'High Contrast')),
+            icon_theme=shlex.quote(ui.get('icon_theme', 'High Contrast')),
+            font_name=shlex.quote(font.get('default_font', 'System-ui Regular'))
+        )
+        
+        # Write the script as an executable
+        _write_file(xfce_config_path, script, 0o755)
+    
     def _configure_input_methods(self, mount_point: str) -> bool:
         """
         Configure input methods
@@ -433,26 +540,16 @@ class DesktopConfigurator:
             if virtual_keyboard.get('enable', True):
                 # Add Onboard to autostart
                 autostart_dir = os.path.join(mount_point, 'etc', 'xdg', 'autostart')
-                os.makedirs(autostart_dir, exist_ok=True)
+                self._ensure_dir(autostart_dir)
                 
                 onboard_desktop_path = os.path.join(autostart_dir, 'onboard.desktop')
                 
-                with open(onboard_desktop_path, 'w') as f:
-                    f.write('[Desktop Entry]\n')
-                    f.write('Type=Application\n')
-                    f.write('Name=Onboard\n')
-                    f.write('Exec=onboard\n')
-                    f.write('Icon=onboard\n')
-                    f.write('X-GNOME-Autostart-enabled=true\n')
-                    f.write('NoDisplay=false\n')
-                    f.write('Hidden=false\n')
-                    f.write('Comment=Virtual Keyboard\n')
-                    f.write('X-GNOME-Autostart-Phase=Applications\n')
+                shutil.copyfile(os.path.join(_ASSET_DIR, 'onboard.desktop'), onboard_desktop_path)
             
             logger.info("Input methods configured successfully")
             return True
         except Exception as e:
-            logger.error("Error configuring input methods: %s", str(e))
+            logger.error("Error configuring input methods: %s", e)
             return False
     
     def configure_battery_monitor(self, mount_point: str) -> bool:
@@ -468,78 +565,20 @@ class DesktopConfigurator:
         try:
             logger.info("Configuring battery charge indicator...")
             
-            # Install xfce4-genmon-plugin
-            pacman_cmd = [
-                'chroot',
-                mount_point,
-                'pacman',
-                '-S',
-                '--noconfirm',
-                'xfce4-genmon-plugin'
-            ]
-            
-            returncode, stdout, stderr = self.env_manager.run_command(
-                pacman_cmd,
-                cwd=None
-            )
-            
-            if returncode != 0:
-                logger.error("Failed to install xfce4-genmon-plugin: %s", stderr)
-                return False
-            
             # Create the battery monitor script
-            battery_monitor_path = os.path.join(mount_point, 'usr', 'sbin', 'battery-monitor.sh')
-            
-            with open(battery_monitor_path, 'w') as f:
-                f.write('#!/usr/bin/env bash\n\n')
-                f.write('# battery-monitor.sh\n')
-                f.write('# Prints the state of charge of the tablet\'s battery\n')
-                f.write('#\n')
-                f.write('# Parabola-rM is a free operating system for the reMarakble tablet.\n')
-                f.write('# Copyright (C) 2020  Davis Remmel\n')
-                f.write('#\n')
-                f.write('# This program is free software: you can redistribute it and/or modify\n')
-                f.write('# it under the terms of the GNU General Public License as published by\n')
-                f.write('# the Free Software Foundation, either version 3 of the License, or\n')
-                f.write('# (at your option) any later version.\n')
-                f.write('#\n')
-                f.write('# This program is distributed in the hope that it will be useful,\n')
-                f.write('# but WITHOUT ANY WARRANTY; without even the implied warranty of\n')
-                f.write('# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\n')
-                f.write('# GNU General Public License for more details.\n')
-                f.write('#\n')
-                f.write('# You should have received a copy of the GNU General Public License\n')
-                f.write('# along with this program.  If not, see <https://www.gnu.org/licenses/>.\n\n')
-                f.write('# Path for Linux 4.9\n')
-                f.write('battpath="/sys/class/power_supply/bq27441-0"\n\n')
-                f.write('chargenow="$(cat $battpath/charge_now)"\n')
-                f.write('chargefull="$(cat $battpath/charge_full)"\n')
-                f.write('status="$(cat $battpath/status)"\n\n')
-                f.write('chargepct="$(echo $chargenow $chargefull \\\n')
-                f.write('                   | awk \'{printf "%f", $1 / $2 * 100}\' \\\n')
-                f.write('                   | cut -d\'.\' -f1)"\n\n')
-                f.write('symbol=""\n')
-                f.write('if [[ "Charging" == "$status" ]]\n')
-                f.write('then\n')
-                f.write('    symbol=$\'\\u26a1\'  # Lightning symbol\n')
-                f.write('fi\n\n')
-                f.write('echo "${symbol}${chargepct}%"\n')
+            battery_monitor_path = os.path.join(mount_point, BATTERY_MONITOR_PATH)
+            
+            shutil.copyfile(os.path.join(_ASSET_DIR, 'battery-monitor.sh'), battery_monitor_path)
             
             # Make the script executable
             os.chmod(battery_monitor_path, 0o755)
             
-            # Add the battery monitor to the panel
-            xfce_config_path = os.path.join(mount_point, 'root', 'configure-xfce.sh')
-            
-            with open(xfce_config_path, 'a') as f:
-                f.write('\n# Add battery monitor to panel\n')
-                f.write('xfce4-panel --add=genmon\n')
-                f.write('# Configure the battery monitor\n')
-                f.write('xfconf-query -c xfce4-panel -p /plugins/plugin-1/command -s "/usr/sbin/battery-monitor.sh"\n')
-                f.write('xfconf-query -c xfce4-panel -p /plugins/plugin-1/use-label -s false\n')
+            # Add the battery monitor to the panel, if the desktop environment is configured
+            if os.path.isfile(os.path.join(mount_point, 'root', 'configure-xfce.sh')):
+                self._write_xfce_config(mount_point)
             
             logger.info("Battery charge indicator configured successfully")
             return True
         except Exception as e:
-            logger.error("Error configuring battery charge indicator: %s", str(e))
+            logger.error("Error configuring battery charge indicator: %s", e)
             return False
\ No newline at end of file
@@ -0,0 +1,20 @@
+#!/bin/sh
+
+${overlay_scrolling}# Configure appearance
+xfconf-query -c xsettings -p /Net/ThemeName -s ${theme}
+xfconf-query -c xsettings -p /Net/IconThemeName -s ${icon_theme}
+# Configure fonts
+xfconf-query -c xsettings -p /Gtk/FontName -s ${font_name}
+${antialiasing}${dpi}# Configure toolbar style
+xfconf-query -c xsettings -p /Gtk/ToolbarStyle -s "text"
+${button_images}${menu_images}# Configure desktop background
+xfconf-query -c xfce4-desktop -p /backdrop/screen0/monitor0/workspace0/color-style -s 0
+xfconf-query -c xfce4-desktop -p /backdrop/screen0/monitor0/workspace0/rgba1 -s "ffffff"
+xfconf-query -c xfce4-desktop -p /backdrop/screen0/monitor0/workspace0/image-style -s 0
+# Configure window manager
+xfconf-query -c xfwm4 -p /general/theme -s "Default-xhdpi"
+xfconf-query -c xfwm4 -p /general/title_font -s "System-ui Bold"
+${shadows}# Configure panel
+xfconf-query -c xfce4-panel -p /panels/panel-1/size -s 50
+xfconf-query -c xfce4-panel -p /panels/panel-1/icon-size -s 32
+${battery_monitor}
\ No newline at end of file
@@ -8,22 +8,192 @@ This module handles the installation of the Parabola system files.
 """
 
 import os
-import sys
+import io
+import gzip
+import json
+import hashlib
 import logging
+import mmap
 import tempfile
 import shutil
-import re
+import subprocess
+import ipaddress
+import urllib.error
 import urllib.request
 import tarfile
-from typing import Dict, Any, List, Optional, Tuple
+import zlib
+import collections
+from email.message import Message
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple, BinaryIO
 
-# Add the parent directory to the path
-sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
-
-from src.cross_env.env_manager import CrossEnvManager
+from ...cross_env.env_manager import CrossEnvManager
 
 logger = logging.getLogger(__name__)
 
+# Root directory of the repository
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+# Parabola root filesystem archive
+ROOTFS_URL = "https://repo.parabola.nu/iso/armv7h/parabola-systemd-cli-armv7h-latest.tar.gz"
+
+# Record of the rootfs version extracted to the system partition
+ROOTFS_MARKER_PATH = os.path.join('var', 'lib', 'parabola-rm', 'rootfs.json')
+
+# Size of the reads from the rootfs download
+_DOWNLOAD_BUFFER_SIZE = 256 * 1024
+
+# Files extracted from the rootfs up to this size are written by a pool of
+# threads, keeping several writes to the target device in flight
+_EXTRACT_SMALL_FILE_SIZE = 1024 * 1024
+_EXTRACT_WRITERS = 8
+_EXTRACT_QUEUE_DEPTH = 64
+
+# Members are checked by _rootfs_filter, so tarfile's own extraction filter,
+# whose defaults strip setuid bits and refuse absolute symlinks, is disabled
+_EXTRACT_OPTIONS = {'filter': 'fully_trusted'} if hasattr(tarfile, 'data_filter') else {}
+
+# File system table of the reMarkable
+FSTAB = """\
+/dev/mmcblk1p2  /               auto    defaults                    1  1
+/dev/mmcblk1p1  /var/lib/uboot  auto    defaults                    0  0
+/dev/mmcblk1p3  /home           auto    defaults                    0  2
+devpts  /dev/pts        devpts  mode=0620,gid=5                     0  0
+proc    /proc           proc    defaults                            0  0
+tmpfs   /run            tmpfs   mode=0755,nodev,nosuid,strictatime  0  0
+tmpfs   /tmp            tmpfs   defaults                            0  0
+tmpfs   /root/.cache    tmpfs   defaults,size=20M                   0  0
+"""
+
+# systemd-networkd configuration of the USB network interface
+USB0_NETWORK = """\
+[Match]
+Name=usb0
+
+[Network]
+Address={address}/{prefix_length}
+"""
+
+# dnsmasq configuration serving DHCP on the USB network interface
+DNSMASQ_CONF = """\
+interface=usb0
+bind-interfaces
+dhcp-range={range_start},{range_end},{lease_time}m
+dhcp-option=6  # Don't send DNS
+"""
+
+# Script showing the power-off splash screen on shutdown, and its service
+SHUTDOWN_SCRIPT = """\
+#!/usr/bin/env bash
+pgrep Xorg | xargs wait
+sleep 1
+journalctl --vacuum-size=100M
+/var/lib/remarkable/epdc-show-bitmap /var/lib/uboot/splash-off.raw
+"""
+
+SHUTDOWN_SERVICE = """\
+[Unit]
+Description=rM shutdown helper
+
+[Service]
+Type=oneshot
+RemainAfterExit=true
+ExecStop=/var/lib/remarkable/shutdown.sh
+
+[Install]
+WantedBy=multi-user.target
+"""
+
+def _rootfs_filter(member: tarfile.TarInfo, path: str) -> tarfile.TarInfo:
+    """
+    Keep a rootfs member inside the directory it is extracted to
+    
+    Leading slashes are stripped from the member and hard link names, like
+    tar does. Modes, owners and symbolic link targets are kept as they are.
+    
+    Args:
+        member: Archive member
+        path: Directory the archive is extracted to
+    
+    Returns:
+        The member, with relative names
+    """
+    member.name = member.name.lstrip('/')
+    if member.islnk():
+        member.linkname = member.linkname.lstrip('/')
+    
+    for name in (member.name, member.linkname if member.islnk() else ''):
+        if '..' in name.split('/'):
+            raise tarfile.ExtractError("%s would be extracted outside of %s" % (member.name, path))
+    
+    return member
+
+class _TeeReader(io.RawIOBase):
+    """
+    Reader copying everything read from a stream to a file
+    
+    An already downloaded part of the stream can be replayed from a file first,
+    and all data read can be hashed on the way.
+    """
+    
+    def __init__(self, stream: io.BufferedIOBase, copy: Optional[BinaryIO] = None, prefix: Optional[io.BufferedIOBase] = None, prefix_size: int = 0, digest: Optional['hashlib._Hash'] = None):
+        """
+        Initialize the reader
+        
+        Args:
+            stream: Stream to read from
+            copy: File receiving a copy of the data read from the stream, if any
+            prefix: File holding the part of the data read before the stream
+            prefix_size: Number of bytes to read from the prefix file
+            digest: hashlib object updated with all data read, if any
+        """
+        self.stream = stream
+        self.copy = copy
+        self.prefix = prefix
+        self.prefix_remaining = prefix_size
+        self.digest = digest
+        self.received = 0
+    
+    def readable(self) -> bool:
+        """
+        Check whether the reader is readable
+        
+        Returns:
+            Always True
+        """
+        return True
+    
+    def readinto(self, buffer: Any) -> int:
+        """
+        Read data into a buffer, copying the data read from the stream to the file
+        
+        Args:
+            buffer: Buffer to read into
+        
+        Returns:
+            Number of bytes read, 0 at the end of the stream
+        """
+        view = memoryview(buffer)
+        
+        # Replay the already downloaded data first, without copying it again
+        if self.prefix is not None and self.prefix_remaining:
+            count = self.prefix.readinto(view[:self.prefix_remaining])
+            if count:
+                self.prefix_remaining -= count
+                if self.digest is not None:
+                    self.digest.update(view[:count])
+                return count
+            self.prefix_remaining = 0
+        
+        # Read straight into the buffer and copy the same memory to the file
+        count = self.stream.readinto(buffer)
+        self.received += count
+        if self.digest is not None:
+            self.digest.update(view[:count])
+        if self.copy is not None:
+            self.copy.write(view[:count])
+        return count
+
 class SystemInstaller:
     """
     System Installer
@@ -44,11 +214,7 @@ class SystemInstaller:
         self.system_config = config.get('system', {})
         
         # Set up paths
-        self.build_dir = os.path.join(
-            os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))),
-            'build',
-            'system'
-        )
+        self.build_dir = os.path.join(_REPO_ROOT, 'build', 'system')
         
         # Create build directory if it doesn't exist
         os.makedirs(self.build_dir, exist_ok=True)
@@ -66,12 +232,8 @@ class SystemInstaller:
             True if the system was installed successfully, False otherwise
         """
         try:
-            # Download the Parabola rootfs
-            if not self._download_rootfs():
-                return False
-            
-            # Extract the rootfs
-            if not self._extract_rootfs(mount_points[2]):
+            # Download and extract the Parabola rootfs
+            if not self._install_rootfs(mount_points[2]):
                 return False
             
             # Install the kernel
@@ -92,59 +254,553 @@ class SystemInstaller:
             logger.error("Error installing Parabola system: %s", str(e))
             return False
     
-    def _download_rootfs(self) -> bool:
+    def _install_rootfs(self, mount_point: str) -> bool:
         """
-        Download the Parabola rootfs
+        Extract the Parabola rootfs, downloading it first if it is not cached
+        
+        The archive is extracted while it is downloaded, keeping a copy of it
+        in the build directory for later installations.
+        
+        Args:
+            mount_point: Mount point for the system partition
         
         Returns:
-            True if the rootfs was downloaded successfully, False otherwise
+            True if the rootfs was installed successfully, False otherwise
         """
+        rootfs_path = os.path.join(self.build_dir, 'parabola-rootfs.tar.gz')
+        partial_path = rootfs_path + '.part'
+        tar_path = os.path.join(self.build_dir, 'parabola-rootfs.tar')
+        meta_path = os.path.join(self.build_dir, 'parabola-rootfs.meta.json')
+        marker_path = os.path.join(mount_point, ROOTFS_MARKER_PATH)
+        
+        # Hash the archive while it is extracted if a checksum is configured
+        expected_sha256 = self.system_config.get('rootfs_sha256')
+        digest = hashlib.sha256() if expected_sha256 else None
+        
         try:
-            rootfs_path = os.path.join(self.build_dir, 'parabola-rootfs.tar.gz')
+            # Version of the cached rootfs, as reported by the server
+            meta = self._read_state(meta_path)
+            
+            if meta and os.path.isfile(rootfs_path) and self._is_rootfs_outdated(meta):
+                logger.info("Parabola rootfs changed upstream, downloading it again")
+                os.remove(rootfs_path)
+                
+                if os.path.exists(tar_path):
+                    os.remove(tar_path)
             
-            # Check if the rootfs already exists
+            # Skip the extraction if the same rootfs was already extracted to the partition
+            if meta and os.path.isfile(rootfs_path) and self._read_state(marker_path) == meta:
+                logger.info("Parabola rootfs already extracted, skipping extraction")
+                return True
+            
+            # The extraction is redone, so the partition no longer holds a known version
+            if os.path.exists(marker_path):
+                os.remove(marker_path)
+            
+            # Extract the cached rootfs if it was already downloaded
             if os.path.isfile(rootfs_path):
-                logger.info("Parabola rootfs already downloaded")
+                logger.info("Extracting Parabola rootfs...")
+                
+                if os.path.isfile(tar_path):
+                    # Skip the decompression, checking the compressed archive on its own
+                    with open(tar_path, 'rb') as f:
+                        self._extract_archive(_TeeReader(f), mount_point, 'r|')
+                    
+                    if digest:
+                        digest = self._hash_file(rootfs_path)
+                else:
+                    with open(rootfs_path, 'rb') as f:
+                        self._extract_archive(_TeeReader(f, digest=digest), mount_point)
+                
+                if not self._verify_rootfs(digest, expected_sha256):
+                    os.remove(rootfs_path)
+                    
+                    if os.path.exists(tar_path):
+                        os.remove(tar_path)
+                    return False
+                
+                if meta:
+                    self._write_state(marker_path, meta)
+                
+                logger.info("Parabola rootfs extracted successfully")
+                
+                if not os.path.isfile(tar_path):
+                    self._decompress_rootfs(rootfs_path, tar_path)
                 return True
             
-            logger.info("Downloading Parabola rootfs...")
+            # A decompressed copy left from a previous archive is outdated
+            if os.path.exists(tar_path):
+                os.remove(tar_path)
             
-            # Download the rootfs
-            rootfs_url = "https://repo.parabola.nu/iso/armv7h/parabola-systemd-cli-armv7h-latest.tar.gz"
+            # The archive is already compressed, so ask for it as is, and continue
+            # an interrupted download where it stopped
+            partial_size = os.path.getsize(partial_path) if os.path.isfile(partial_path) else 0
+            headers = {'Accept-Encoding': 'identity'}
             
-            urllib.request.urlretrieve(rootfs_url, rootfs_path)
+            if partial_size:
+                headers['Range'] = 'bytes=%d-' % partial_size
+                
+                # Have the server send the whole archive if it changed since the part was downloaded
+                if meta:
+                    headers['If-Range'] = meta.get('etag') or meta.get('last_modified')
             
-            logger.info("Parabola rootfs downloaded successfully")
+            try:
+                response = urllib.request.urlopen(urllib.request.Request(ROOTFS_URL, headers=headers))
+            except urllib.error.HTTPError as e:
+                if e.code != 416 or not partial_size:
+                    raise
+                
+                # The interrupted download had already received the whole archive, if
+                # its size is the one reported by the server and its checksum matches
+                complete = e.headers is not None and e.headers.get('Content-Range') == 'bytes */%d' % partial_size
+                
+                if complete:
+                    if expected_sha256:
+                        complete = self._verify_rootfs(self._hash_file(partial_path), expected_sha256)
+                    else:
+                        complete = self._is_gzip_intact(partial_path)
+                
+                if not complete:
+                    logger.warning("Downloaded part of the Parabola rootfs does not match the archive, downloading it again")
+                    os.remove(partial_path)
+                    return self._install_rootfs(mount_point)
+                
+                os.replace(partial_path, rootfs_path)
+                return self._install_rootfs(mount_point)
+            
+            with response:
+                # Servers without range support send the whole archive again
+                resumed = partial_size and getattr(response, 'status', None) == 206
+                
+                if resumed:
+                    logger.info("Resuming Parabola rootfs download at %d bytes...", partial_size)
+                else:
+                    logger.info("Downloading and extracting Parabola rootfs...")
+                
+                # Remember the version of the archive being downloaded
+                meta = self._get_rootfs_version(response.headers)
+                
+                if meta:
+                    self._write_state(meta_path, meta)
+                elif os.path.exists(meta_path):
+                    os.remove(meta_path)
+                
+                # The downloaded part is extracted from the file, the rest from the response
+                with open(partial_path, 'ab' if resumed else 'wb') as cache, open(partial_path, 'rb') as prefix:
+                    # Reserve the space of a new download up front, so the file system
+                    # allocates it in one go instead of on every write
+                    content_length = response.headers.get('Content-Length')
+                    preallocated = not resumed and self._preallocate(cache, content_length)
+                    
+                    reader = _TeeReader(response, cache, prefix, partial_size if resumed else 0, digest)
+                    
+                    try:
+                        self._extract_archive(reader, mount_point)
+                    except Exception as e:
+                        # An archive cut short by the connection is incomplete rather than corrupt
+                        if content_length and reader.received < int(content_length):
+                            raise ConnectionError(
+                                "Download interrupted after %d of %s bytes" % (reader.received, content_length)
+                            ) from e
+                        raise
+                    finally:
+                        # Cut the reserved space off however the download ends, even when
+                        # interrupted, so the next attempt resumes after the received data
+                        if preallocated:
+                            cache.truncate(cache.tell())
+            
+            if not self._verify_rootfs(digest, expected_sha256):
+                os.remove(partial_path)
+                return False
+            
+            os.replace(partial_path, rootfs_path)
+            
+            if meta:
+                self._write_state(marker_path, meta)
+            
+            logger.info("Parabola rootfs downloaded and extracted successfully")
+            
+            self._decompress_rootfs(rootfs_path, tar_path)
             return True
         except Exception as e:
-            logger.error("Error downloading Parabola rootfs: %s", str(e))
+            logger.error("Error installing Parabola rootfs: %s", str(e))
+            
+            # Keep an interrupted download for the next attempt, unless it is corrupt,
+            # and drop a corrupt cached archive along with its decompressed copy. The
+            # system tar also fails when it cannot write to the partition (e.g. when
+            # it is full), so the archives are checked before they are dropped.
+            if isinstance(e, tarfile.TarError):
+                corrupt_paths = [partial_path, rootfs_path, tar_path]
+            else:
+                corrupt_paths = []
+                if os.path.isfile(partial_path) and not self._is_gzip_intact(partial_path, truncated=True):
+                    corrupt_paths.append(partial_path)
+                if os.path.isfile(rootfs_path) and not self._is_gzip_intact(rootfs_path):
+                    corrupt_paths.extend([rootfs_path, tar_path])
+            
+            for path in corrupt_paths + [marker_path]:
+                if os.path.exists(path):
+                    os.remove(path)
+            
             return False
     
-    def _extract_rootfs(self, mount_point: str) -> bool:
+    @staticmethod
+    def _get_rootfs_version(headers: Message) -> Optional[Dict[str, Optional[str]]]:
         """
-        Extract the Parabola rootfs
+        Get the version of the rootfs archive from the headers of a response
         
         Args:
-            mount_point: Mount point for the system partition
+            headers: HTTP headers of the response
+        
+        Returns:
+            Dictionary of the ETag and Last-Modified headers, None if the server sent neither
+        """
+        version = {'etag': headers.get('ETag'), 'last_modified': headers.get('Last-Modified')}
+        return version if any(version.values()) else None
+    
+    def _is_rootfs_outdated(self, meta: Dict[str, str]) -> bool:
+        """
+        Check whether the rootfs archive changed upstream since it was downloaded
+        
+        Args:
+            meta: Version of the cached archive
+        
+        Returns:
+            True if the server reports a different version, False if it is the same or cannot be reached
+        """
+        try:
+            request = urllib.request.Request(ROOTFS_URL, method='HEAD')
+            
+            with urllib.request.urlopen(request, timeout=10) as response:
+                upstream = self._get_rootfs_version(response.headers)
+        except Exception as e:
+            logger.warning("Failed to check for a newer Parabola rootfs, using the cached one: %s", str(e))
+            return False
+        
+        return upstream is not None and upstream != meta
+    
+    @staticmethod
+    def _read_state(path: str) -> Optional[Dict[str, Any]]:
+        """
+        Read a JSON state file
+        
+        Args:
+            path: Path to the state file
+        
+        Returns:
+            Content of the state file, None if it does not exist or cannot be parsed
+        """
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    @staticmethod
+    def _write_state(path: str, state: Dict[str, Any]) -> None:
+        """
+        Write a JSON state file
+        
+        Args:
+            path: Path to the state file
+            state: Content of the state file
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        
+        with open(path, 'w') as f:
+            json.dump(state, f)
+    
+    @staticmethod
+    def _decompress_rootfs(rootfs_path: str, tar_path: str) -> None:
+        """
+        Keep a decompressed copy of the rootfs archive for later installations
+        
+        Decompressing the archive takes most of the time of extracting it, so
+        later installations extract the copy instead. The copy is skipped if
+        the build directory is short of space.
+        
+        Args:
+            rootfs_path: Path to the rootfs archive
+            tar_path: Path to the decompressed copy
+        """
+        partial_tar_path = tar_path + '.part'
+        
+        try:
+            # The gzip trailer holds the decompressed size, modulo 4 GiB
+            with open(rootfs_path, 'rb') as f:
+                f.seek(-4, os.SEEK_END)
+                size = int.from_bytes(f.read(4), 'little')
+            
+            # Leave as much space free as the copy takes
+            if shutil.disk_usage(os.path.dirname(tar_path)).free < 2 * size:
+                logger.info("Not enough space to keep a decompressed copy of the Parabola rootfs")
+                return
+            
+            logger.info("Decompressing Parabola rootfs for later installations...")
+            
+            # Prefer the parallel pigz if it is installed
+            pigz = shutil.which('pigz')
+            
+            with open(partial_tar_path, 'wb') as out:
+                if pigz:
+                    subprocess.run([pigz, '-dc', rootfs_path], stdout=out, check=True)
+                else:
+                    with gzip.open(rootfs_path, 'rb') as f:
+                        shutil.copyfileobj(f, out, _DOWNLOAD_BUFFER_SIZE)
+            
+            os.replace(partial_tar_path, tar_path)
+        except Exception as e:
+            logger.warning("Failed to decompress Parabola rootfs: %s", str(e))
+            
+            if os.path.exists(partial_tar_path):
+                os.remove(partial_tar_path)
+    
+    @staticmethod
+    def _preallocate(f: BinaryIO, content_length: Optional[str]) -> bool:
+        """
+        Reserve the disk space of a file that is about to be written
+        
+        Args:
+            f: File to reserve the space of
+            content_length: Final size of the file, None if unknown
         
         Returns:
-            True if the rootfs was extracted successfully, False otherwise
+            True if the space was reserved, False otherwise
         """
+        if not content_length or not hasattr(os, 'posix_fallocate'):
+            return False
+        
         try:
-            rootfs_path = os.path.join(self.build_dir, 'parabola-rootfs.tar.gz')
+            os.posix_fallocate(f.fileno(), 0, int(content_length))
+            return True
+        except (OSError, ValueError):
+            return False
+    
+    def _extract_archive(self, reader: _TeeReader, mount_point: str, mode: str = 'r|gz') -> None:
+        """
+        Extract a tar archive in a single pass over a stream
+        
+        The archive is extracted by the system tar if it is installed, and by
+        tarfile otherwise.
+        
+        Args:
+            reader: Reader of the archive
+            mount_point: Directory to extract the archive to
+            mode: Streaming mode of tarfile to open the archive with
+        """
+        tar_binary = shutil.which('tar')
+        
+        if tar_binary:
+            self._extract_with_tar(tar_binary, reader, mount_point, mode.endswith('gz'))
+        else:
+            self._extract_with_tarfile(reader, mount_point, mode)
+    
+    @staticmethod
+    def _extract_with_tar(tar_binary: str, reader: _TeeReader, mount_point: str, compressed: bool) -> None:
+        """
+        Extract a tar archive by piping a stream to the system tar
+        
+        Args:
+            tar_binary: Path to the tar binary
+            reader: Reader of the archive
+            mount_point: Directory to extract the archive to
+            compressed: Whether the archive is gzipped
+        """
+        # Owners are kept as numbers, since the host may map names differently than the rootfs
+        command = [tar_binary, '-x', '--numeric-owner', '-C', mount_point, '-f', '-']
+        
+        if compressed:
+            pigz = shutil.which('pigz')
+            command += ['--use-compress-program=' + pigz] if pigz else ['-z']
+        
+        # Errors go to a file, as a full pipe would block tar while it is fed
+        with tempfile.TemporaryFile() as errors:
+            process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=errors)
+            
+            try:
+                buffer = bytearray(_DOWNLOAD_BUFFER_SIZE)
+                view = memoryview(buffer)
+                
+                while True:
+                    count = reader.readinto(buffer)
+                    if not count:
+                        break
+                    
+                    try:
+                        process.stdin.write(view[:count])
+                    except BrokenPipeError:
+                        # tar stops at the end of the tar data, so read the rest of the stream,
+                        # copying and hashing it completely, unless tar failed
+                        if process.wait():
+                            break
+                        while reader.readinto(buffer):
+                            pass
+                        break
+                
+                try:
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass
+                
+                process.wait()
+            finally:
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+            
+            errors.seek(0)
+            message = errors.read().decode(errors='replace').strip()
+        
+        if process.returncode:
+            raise OSError("tar failed with status %d: %s" % (process.returncode, message))
+    
+    def _extract_with_tarfile(self, reader: _TeeReader, mount_point: str, mode: str) -> None:
+        """
+        Extract a tar archive with tarfile
+        
+        The archive is decompressed on the calling thread, while small regular
+        files are written by a pool of threads. Directory attributes are set
+        at the end, like tarfile's extractall does.
+        
+        Args:
+            reader: Reader of the archive
+            mount_point: Directory to extract the archive to
+            mode: Streaming mode of tarfile to open the archive with
+        """
+        stream = io.BufferedReader(reader, _DOWNLOAD_BUFFER_SIZE)
+        
+        with tarfile.open(fileobj=stream, mode=mode) as tar, ThreadPoolExecutor(max_workers=_EXTRACT_WRITERS) as writers:
+            pending = collections.deque()
+            directories = []
             
-            logger.info("Extracting Parabola rootfs...")
+            # Directories known to exist, so files only create their parent once
+            existing = set()
+            
+            for member in tar:
+                member = _rootfs_filter(member, mount_point)
+                
+                if member.isreg() and member.size <= _EXTRACT_SMALL_FILE_SIZE:
+                    data = tar.extractfile(member).read()
+                    pending.append(writers.submit(self._write_member, tar, member, data, mount_point, existing))
+                    
+                    # Bound the memory held by queued files
+                    if len(pending) > _EXTRACT_QUEUE_DEPTH:
+                        pending.popleft().result()
+                    continue
+                
+                # Hard links need their target written first
+                if member.islnk():
+                    while pending:
+                        pending.popleft().result()
+                
+                if member.isdir():
+                    directories.append(member)
+                
+                tar.extract(member, path=mount_point, set_attrs=not member.isdir(), **_EXTRACT_OPTIONS)
+                
+                if member.isdir():
+                    existing.add(os.path.join(mount_point, member.name).rstrip('/'))
             
-            # Extract the rootfs
-            with tarfile.open(rootfs_path, 'r:gz') as tar:
-                tar.extractall(path=mount_point)
+            while pending:
+                pending.popleft().result()
             
-            logger.info("Parabola rootfs extracted successfully")
+            # Set the attributes of the directories last, deepest first, so that
+            # read-only directories do not prevent extracting their contents
+            for member in sorted(directories, key=lambda member: member.name, reverse=True):
+                path = os.path.join(mount_point, member.name)
+                tar.chown(member, path, False)
+                tar.utime(member, path)
+                tar.chmod(member, path)
+        
+        # Read the rest of the archive after the end of the tar data, so it is
+        # copied and hashed completely
+        while stream.read(_DOWNLOAD_BUFFER_SIZE):
+            pass
+    
+    @staticmethod
+    def _write_member(tar: tarfile.TarFile, member: tarfile.TarInfo, data: bytes, mount_point: str, existing: set) -> None:
+        """
+        Write a regular file of an archive and set its attributes
+        
+        Args:
+            tar: Archive the file belongs to
+            member: Archive member of the file
+            data: Content of the file
+            mount_point: Directory the archive is extracted to
+            existing: Directories known to exist, updated with the parent of the file
+        """
+        path = os.path.join(mount_point, member.name)
+        parent = os.path.dirname(path)
+        
+        if parent not in existing:
+            os.makedirs(parent, exist_ok=True)
+            existing.add(parent)
+        
+        with open(path, 'wb') as f:
+            f.write(data)
+        
+        tar.chown(member, path, False)
+        tar.chmod(member, path)
+        tar.utime(member, path)
+    
+    @staticmethod
+    def _is_gzip_intact(path: str, truncated: bool = False) -> bool:
+        """
+        Check a gzip file against the checksum and size in its trailer
+        
+        Args:
+            path: Path to the gzip file
+            truncated: Whether the file may end early, as a partial download does
+        
+        Returns:
+            True if the whole file decompresses and matches its trailer, False otherwise
+        """
+        try:
+            with gzip.open(path, 'rb') as f:
+                while f.read(_DOWNLOAD_BUFFER_SIZE):
+                    pass
             return True
-        except Exception as e:
-            logger.error("Error extracting Parabola rootfs: %s", str(e))
+        except EOFError:
+            return truncated
+        except (OSError, zlib.error):
             return False
     
+    @staticmethod
+    def _hash_file(path: str) -> 'hashlib._Hash':
+        """
+        Hash a file with SHA-256
+        
+        Args:
+            path: Path to the file
+        
+        Returns:
+            hashlib object the file was hashed with
+        """
+        digest = hashlib.sha256()
+        
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_DOWNLOAD_BUFFER_SIZE), b''):
+                digest.update(chunk)
+        
+        return digest
+    
+    def _verify_rootfs(self, digest: Optional['hashlib._Hash'], expected_sha256: Optional[str]) -> bool:
+        """
+        Verify the checksum of the rootfs archive
+        
+        Args:
+            digest: hashlib object the archive was hashed with, None if not verified
+            expected_sha256: Expected SHA-256 checksum of the archive
+        
+        Returns:
+            True if the checksum matches or is not configured, False otherwise
+        """
+        if digest is None or not expected_sha256 or digest.hexdigest() == expected_sha256.lower():
+            return True
+        
+        logger.error("Parabola rootfs checksum mismatch: expected %s, got %s", expected_sha256, digest.hexdigest())
+        return False
+    
     def _install_kernel(self, mount_point: str, kernel_files: Dict[str, str]) -> bool:
         """
         Install the kernel files
@@ -164,10 +820,10 @@ class SystemInstaller:
             os.makedirs(boot_dir, exist_ok=True)
             
             # Copy the kernel image
-            shutil.copy(kernel_files['zImage'], os.path.join(boot_dir, 'zImage'))
+            shutil.copyfile(kernel_files['zImage'], os.path.join(boot_dir, 'zImage'))
             
             # Copy the device tree binary
-            shutil.copy(kernel_files['dtb'], os.path.join(boot_dir, 'zero-gravitas.dtb'))
+            shutil.copyfile(kernel_files['dtb'], os.path.join(boot_dir, 'zero-gravitas.dtb'))
             
             logger.info("Kernel files installed successfully")
             return True
@@ -191,11 +847,11 @@ class SystemInstaller:
             
             # Copy the waveform file
             if 'waveform' in bootloader_files:
-                shutil.copy(bootloader_files['waveform'], os.path.join(mount_point, 'waveform.bin'))
+                shutil.copyfile(bootloader_files['waveform'], os.path.join(mount_point, 'waveform.bin'))
             
             # Copy the splash screen
             if 'splash' in bootloader_files:
-                shutil.copy(bootloader_files['splash'], os.path.join(mount_point, 'splash.bmp'))
+                shutil.copyfile(bootloader_files['splash'], os.path.join(mount_point, 'splash.bmp'))
             
             logger.info("Bootloader files installed successfully")
             return True
@@ -216,20 +872,18 @@ class SystemInstaller:
         try:
             logger.info("Configuring system...")
             
-            # Configure fstab
-            if not self._configure_fstab(mount_point):
-                return False
+            # The configuration steps write distinct files, so run them at the same time
+            configuration_steps = [
+                self._configure_fstab,
+                self._configure_network,
+                self._configure_serial_console,
+                self._configure_pam
+            ]
             
-            # Configure network
-            if not self._configure_network(mount_point):
-                return False
-            
-            # Configure serial console
-            if not self._configure_serial_console(mount_point):
-                return False
+            with ThreadPoolExecutor(max_workers=len(configuration_steps)) as executor:
+                results = list(executor.map(lambda step: step(mount_point), configuration_steps))
             
-            # Configure PAM
-            if not self._configure_pam(mount_point):
+            if not all(results):
                 return False
             
             logger.info("System configured successfully")
@@ -255,14 +909,7 @@ class SystemInstaller:
             
             # Write the fstab file
             with open(fstab_path, 'w') as f:
-                f.write("/dev/mmcblk1p2  /               auto    defaults                    1  1\n")
-                f.write("/dev/mmcblk1p1  /var/lib/uboot  auto    defaults                    0  0\n")
-                f.write("/dev/mmcblk1p3  /home           auto    defaults                    0  2\n")
-                f.write("devpts  /dev/pts        devpts  mode=0620,gid=5                     0  0\n")
-                f.write("proc    /proc           proc    defaults                            0  0\n")
-                f.write("tmpfs   /run            tmpfs   mode=0755,nodev,nosuid,strictatime  0  0\n")
-                f.write("tmpfs   /tmp            tmpfs   defaults                            0  0\n")
-                f.write("tmpfs   /root/.cache    tmpfs   defaults,size=20M                   0  0\n")
+                f.write(FSTAB)
             
             logger.info("fstab configured successfully")
             return True
@@ -288,31 +935,34 @@ class SystemInstaller:
             # Create the network directory if it doesn't exist
             os.makedirs(network_dir, exist_ok=True)
             
+            network = self.system_config.get('network', {})
+            
             # Configure USB networking
-            usb_networking = self.system_config.get('network', {}).get('usb_networking', {})
+            usb_networking = network.get('usb_networking', {})
             
             if usb_networking.get('enable', True):
                 # Write the USB network configuration
                 usb0_path = os.path.join(network_dir, 'usb0.network')
                 
                 with open(usb0_path, 'w') as f:
-                    f.write("[Match]\n")
-                    f.write("Name=usb0\n\n")
-                    f.write("[Network]\n")
-                    f.write(f"Address={usb_networking.get('ip_address', '10.11.99.1')}/{usb_networking.get('netmask', '255.255.255.0').count('255')}\n")
+                    f.write(USB0_NETWORK.format(
+                        address=usb_networking.get('ip_address', '10.11.99.1'),
+                        prefix_length=ipaddress.IPv4Network('0.0.0.0/' + usb_networking.get('netmask', '255.255.255.0')).prefixlen
+                    ))
             
             # Configure DHCP server
-            dhcp_server = self.system_config.get('network', {}).get('dhcp_server', {})
+            dhcp_server = network.get('dhcp_server', {})
             
             if dhcp_server.get('enable', True):
                 # Install dnsmasq configuration
                 dnsmasq_path = os.path.join(mount_point, 'etc', 'dnsmasq.conf')
                 
                 with open(dnsmasq_path, 'w') as f:
-                    f.write("interface=usb0\n")
-                    f.write("bind-interfaces\n")
-                    f.write(f"dhcp-range={dhcp_server.get('range_start', '10.11.99.2')},{dhcp_server.get('range_end', '10.11.99.253')},{dhcp_server.get('lease_time', 10)}m\n")
-                    f.write("dhcp-option=6  # Don't send DNS\n")
+                    f.write(DNSMASQ_CONF.format(
+                        range_start=dhcp_server.get('range_start', '10.11.99.2'),
+                        range_end=dhcp_server.get('range_end', '10.11.99.253'),
+                        lease_time=dhcp_server.get('lease_time', 10)
+                    ))
             
             logger.info("Network configured successfully")
             return True
@@ -370,23 +1020,19 @@ class SystemInstaller:
             
             # Disable pam_securetty.so in login
             if os.path.isfile(pam_login_path):
-                with open(pam_login_path, 'r') as f:
-                    content = f.read()
-                
-                content = content.replace('auth       required     pam_securetty.so', '#auth       required     pam_securetty.so')
-                
-                with open(pam_login_path, 'w') as f:
-                    f.write(content)
+                self._replace_in_file(
+                    pam_login_path,
+                    b'auth       required     pam_securetty.so',
+                    b'#auth       required     pam_securetty.so'
+                )
             
             # Disable pam_systemd.so in system-login
             if os.path.isfile(pam_system_login_path):
-                with open(pam_system_login_path, 'r') as f:
-                    content = f.read()
-                
-                content = content.replace('session   optional   pam_systemd.so', '#-session   optional   pam_systemd.so')
-                
-                with open(pam_system_login_path, 'w') as f:
-                    f.write(content)
+                self._replace_in_file(
+                    pam_system_login_path,
+                    b'session   optional   pam_systemd.so',
+                    b'#-session   optional   pam_systemd.so'
+                )
             
             logger.info("PAM configured successfully")
             return True
@@ -394,6 +1040,33 @@ class SystemInstaller:
             logger.error("Error configuring PAM: %s", str(e))
             return False
     
+    @staticmethod
+    def _replace_in_file(path: str, old: bytes, new: bytes) -> None:
+        """
+        Replace all occurrences of a string in a file
+        
+        The file is searched through a memory map and only rewritten if the
+        string is found.
+        
+        Args:
+            path: Path to the file
+            old: String to replace
+            new: Replacement string
+        """
+        with open(path, 'r+b') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if mm.find(old) == -1:
+                    return
+                
+                content = mm[:].replace(old, new)
+            
+            f.seek(0)
+            f.write(content)
+            f.truncate()
+    
     def configure_auto_login(self, mount_point: str) -> bool:
         """
         Configure automatic login
@@ -419,10 +1092,11 @@ class SystemInstaller:
                 content = f.read()
             
             # Modify the ExecStart line to auto-login as root
-            content = re.sub(
-                r'ExecStart=-/sbin/agetty.*',
-                'ExecStart=-/sbin/agetty -a root --noclear %I $TERM',
-                content
+            exec_start = 'ExecStart=-/sbin/agetty -a root --noclear %I $TERM'
+            content = ''.join(
+                (exec_start + '\n' if line.endswith('\n') else exec_start)
+                if line.startswith('ExecStart=-/sbin/agetty') else line
+                for line in content.splitlines(keepends=True)
             )
             
             # Write the modified service file
@@ -457,25 +1131,14 @@ class SystemInstaller:
             
             # Write the shutdown script
             with open(shutdown_script_path, 'w') as f:
-                f.write("#!/usr/bin/env bash\n")
-                f.write("pgrep Xorg | xargs wait\n")
-                f.write("sleep 1\n")
-                f.write("journalctl --vacuum-size=100M\n")
-                f.write("/var/lib/remarkable/epdc-show-bitmap /var/lib/uboot/splash-off.raw\n")
+                f.write(SHUTDOWN_SCRIPT)
             
             # Make the script executable
             os.chmod(shutdown_script_path, 0o755)
             
             # Write the shutdown service
             with open(shutdown_service_path, 'w') as f:
-                f.write("[Unit]\n")
-                f.write("Description=rM shutdown helper\n\n")
-                f.write("[Service]\n")
-                f.write("Type=oneshot\n")
-                f.write("RemainAfterExit=true\n")
-                f.write("ExecStop=/var/lib/remarkable/shutdown.sh\n\n")
-                f.write("[Install]\n")
-                f.write("WantedBy=multi-user.target\n")
+                f.write(SHUTDOWN_SERVICE)
             
             logger.info("Graceful shutdown configured successfully")
             return True
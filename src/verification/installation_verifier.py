@@ -8,20 +8,40 @@ This module verifies that the installation was successful.
 """
 
 import os
-import sys
 import logging
 import tempfile
-import shutil
 import time
-from typing import Dict, Any, List, Optional, Tuple
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, List, Optional, Tuple
 
-# Add the parent directory to the path
-sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
-
-from src.cross_env.env_manager import CrossEnvManager
+from ..cross_env.env_manager import CrossEnvManager
 
 logger = logging.getLogger(__name__)
 
+# Files the installation must have created, relative to the system partition
+SYSTEM_FILES = (
+    'boot/zImage',
+    'boot/zero-gravitas.dtb',
+    'etc/fstab',
+    'etc/systemd/network/usb0.network',
+    'etc/pam.d/login',
+    'etc/pam.d/system-login'
+)
+
+DESKTOP_FILES = (
+    'etc/X11/xorg.conf',
+    'root/.xserverrc',
+    'root/.xinitrc',
+    'root/.bash_profile'
+)
+
+XFCE_FILES = (
+    'usr/bin/xfce4-session',
+    'usr/bin/xfwm4',
+    'usr/bin/xfdesktop'
+)
+
 class InstallationVerifier:
     """
     Installation Verifier
@@ -39,6 +59,22 @@ class InstallationVerifier:
         """
         self.config = config
         self.env_manager = env_manager
+        
+        # Entries of the directories listed on the mounted partitions
+        self._directory_entries = {}
+        
+        # Results of the verification checks, by check name and device
+        self._verify_cache = {}
+        
+        # Temporary directory holding the mount points, reused by every verification
+        self._mount_root = None
+        self._mount_root_finalizer = None
+    
+    def invalidate(self) -> None:
+        """
+        Forget the results of previous verifications
+        """
+        self._verify_cache.clear()
     
     def verify(self, device: str) -> bool:
         """
@@ -53,45 +89,143 @@ class InstallationVerifier:
         try:
             logger.info("Verifying installation...")
             
-            # Verify the bootloader
-            if not self._verify_bootloader(device):
+            # Verify the bootloader and the partitions
+            results = self._verify_devices(device)
+            
+            if not (results['bootloader'] and results['partitions']):
                 return False
             
-            # Verify the partitions
-            if not self._verify_partitions(device):
+            # Verify the system and the desktop environment
+            results = self._verify_mounted(device, stop_on_failure=True)
+            
+            if not (results['system'] and results['desktop']):
                 return False
             
+            logger.info("Installation verified successfully")
+            return True
+        except Exception as e:
+            logger.error("Error verifying installation: %s", str(e))
+            return False
+    
+    def _get_result(self, name: str, device: str, check: Callable[[], bool]) -> bool:
+        """
+        Get the result of a verification check, running it only once per device
+        
+        Args:
+            name: Name of the check
+            device: Device the check verifies
+            check: Function running the check
+        
+        Returns:
+            Result of the check
+        """
+        key = (name, device)
+        
+        if key not in self._verify_cache:
+            self._verify_cache[key] = check()
+        
+        return self._verify_cache[key]
+    
+    def _verify_devices(self, device: str) -> Dict[str, bool]:
+        """
+        Verify the bootloader and the partitions
+        
+        The boot0 device and the partitions are checked at once.
+        
+        Args:
+            device: Device to verify
+        
+        Returns:
+            Dictionary of the results of the bootloader and partitions checks
+        """
+        missing = None
+        
+        if any((name, device) not in self._verify_cache for name in ('bootloader', 'partitions')):
+            missing = self._find_missing_devices(self._get_device_paths(device))
+        
+        return {
+            'bootloader': self._get_result('bootloader', device, lambda: self._verify_bootloader(device, missing)),
+            'partitions': self._get_result('partitions', device, lambda: self._verify_partitions(device, missing))
+        }
+    
+    def _verify_mounted(self, device: str, stop_on_failure: bool = False) -> Dict[str, bool]:
+        """
+        Verify the system and the desktop environment
+        
+        The partitions are only mounted if a check was not run on the device yet.
+        
+        Args:
+            device: Device to verify
+            stop_on_failure: Whether to skip the remaining checks after a failed one
+        
+        Returns:
+            Dictionary of the results of the system and desktop checks, which are
+            False if they were not run
+        """
+        checks = [('system', self._verify_system), ('desktop', self._verify_desktop)]
+        pending = [(name, check) for name, check in checks if (name, device) not in self._verify_cache]
+        
+        if pending:
             # Create temporary mount points
             mount_points = self._create_mount_points()
             
             try:
                 # Mount the partitions
-                if not self._mount_partitions(device, mount_points):
-                    return False
-                
-                # Verify the system
-                if not self._verify_system(mount_points[2]):
-                    return False
-                
-                # Verify the desktop environment
-                if not self._verify_desktop(mount_points[2]):
-                    return False
+                if self._mount_partitions(device, mount_points):
+                    for name, check in pending:
+                        if not self._get_result(name, device, lambda: check(mount_points[2])) and stop_on_failure:
+                            break
             finally:
                 # Unmount the partitions
                 self._unmount_partitions(list(mount_points.values()))
-            
-            logger.info("Installation verified successfully")
-            return True
-        except Exception as e:
-            logger.error("Error verifying installation: %s", str(e))
-            return False
+        
+        return {name: self._verify_cache.get((name, device), False) for name, check in checks}
+    
+    @staticmethod
+    def _get_device_paths(device: str) -> List[str]:
+        """
+        Get the paths of the boot0 device and the partitions of a device
+        
+        Args:
+            device: Device to verify
+        
+        Returns:
+            List of the boot0 device and partition paths
+        """
+        return [f"{device}boot0"] + [f"{device}p{i}" for i in range(1, 4)]
     
-    def _verify_bootloader(self, device: str) -> bool:
+    def _find_missing_devices(self, devices: List[str]) -> List[str]:
+        """
+        Find the devices that do not exist
+        
+        The devices are checked directly on the host, or with a single command
+        in the containerized environment.
+        
+        Args:
+            devices: Paths of the devices to check
+        
+        Returns:
+            List of the devices that were not found
+        """
+        if self.env_manager.is_local():
+            return [device for device in devices if not os.path.exists(device)]
+        
+        # ls lists the devices it finds and reports the others as errors
+        returncode, stdout, stderr = self.env_manager.run_command(
+            ['ls', '-1d'] + devices,
+            cwd=None
+        )
+        
+        found = set(stdout.splitlines())
+        return [device for device in devices if device not in found]
+    
+    def _verify_bootloader(self, device: str, missing: Optional[List[str]] = None) -> bool:
         """
         Verify the bootloader
         
         Args:
             device: Device to verify
+            missing: Devices already known not to exist, checked here if not given
         
         Returns:
             True if the bootloader was verified successfully, False otherwise
@@ -103,12 +237,10 @@ class InstallationVerifier:
             boot0_device = f"{device}boot0"
             
             # Check if the boot0 device exists
-            returncode, stdout, stderr = self.env_manager.run_command(
-                ['ls', boot0_device],
-                cwd=None
-            )
+            if missing is None:
+                missing = self._find_missing_devices([boot0_device])
             
-            if returncode != 0:
+            if boot0_device in missing:
                 logger.error("Boot0 device not found: %s", boot0_device)
                 return False
             
@@ -118,12 +250,13 @@ class InstallationVerifier:
             logger.error("Error verifying bootloader: %s", str(e))
             return False
     
-    def _verify_partitions(self, device: str) -> bool:
+    def _verify_partitions(self, device: str, missing: Optional[List[str]] = None) -> bool:
         """
         Verify the partitions
         
         Args:
             device: Device to verify
+            missing: Devices already known not to exist, checked here if not given
         
         Returns:
             True if the partitions were verified successfully, False otherwise
@@ -131,17 +264,14 @@ class InstallationVerifier:
         try:
             logger.info("Verifying partitions...")
             
+            partitions = [f"{device}p{i}" for i in range(1, 4)]
+            
             # Check if the partitions exist
-            for i in range(1, 4):
-                partition = f"{device}p{i}"
-                
-                # Check if the partition exists
-                returncode, stdout, stderr = self.env_manager.run_command(
-                    ['ls', partition],
-                    cwd=None
-                )
-                
-                if returncode != 0:
+            if missing is None:
+                missing = self._find_missing_devices(partitions)
+            
+            for partition in partitions:
+                if partition in missing:
                     logger.error("Partition not found: %s", partition)
                     return False
             
@@ -155,25 +285,65 @@ class InstallationVerifier:
         """
         Create temporary mount points
         
+        The mount points are created once and reused until cleanup() is called.
+        
         Returns:
             Dictionary of partition numbers to mount points
         """
+        create = self._mount_root is None
+        
         # Create a temporary directory for mount points
-        temp_dir = tempfile.mkdtemp()
+        if create:
+            self._mount_root = tempfile.mkdtemp()
+            self._mount_root_finalizer = weakref.finalize(self, self._remove_mount_points, self._mount_root)
         
         # Create mount points for each partition
         mount_points = {
-            1: os.path.join(temp_dir, 'p1'),
-            2: os.path.join(temp_dir, 'p2'),
-            3: os.path.join(temp_dir, 'p3')
+            1: os.path.join(self._mount_root, 'p1'),
+            2: os.path.join(self._mount_root, 'p2'),
+            3: os.path.join(self._mount_root, 'p3')
         }
         
-        # Create the mount point directories
-        for mount_point in mount_points.values():
-            os.makedirs(mount_point, exist_ok=True)
+        # Create the mount point directories in the new temporary directory
+        if create:
+            for mount_point in mount_points.values():
+                os.mkdir(mount_point)
         
         return mount_points
     
+    def cleanup(self) -> None:
+        """
+        Remove the temporary mount points
+        """
+        if self._mount_root_finalizer is not None:
+            self._mount_root_finalizer()
+        
+        self._mount_root = None
+        self._mount_root_finalizer = None
+    
+    @staticmethod
+    def _remove_mount_points(mount_root: str) -> None:
+        """
+        Remove a temporary directory of mount points
+        
+        The directories are removed one by one, so a partition that is still
+        mounted keeps its mount point, and its files, in place.
+        
+        Args:
+            mount_root: Temporary directory holding the mount points
+        """
+        removed = True
+        
+        for name in os.listdir(mount_root):
+            try:
+                os.rmdir(os.path.join(mount_root, name))
+            except OSError as e:
+                logger.warning("Failed to remove mount point: %s", str(e))
+                removed = False
+        
+        if removed:
+            os.rmdir(mount_root)
+    
     def _mount_partitions(self, device: str, mount_points: Dict[int, str]) -> bool:
         """
         Mount the partitions
@@ -188,19 +358,27 @@ class InstallationVerifier:
         try:
             logger.info("Mounting partitions...")
             
-            # Mount each partition
-            for i, mount_point in mount_points.items():
-                partition = f"{device}p{i}"
-                
-                # Mount the partition
-                returncode, stdout, stderr = self.env_manager.run_command(
-                    ['mount', partition, mount_point],
-                    cwd=None
-                )
+            # Mount the partitions at the same time, as they are independent
+            with ThreadPoolExecutor(max_workers=len(mount_points)) as executor:
+                futures = {
+                    f"{device}p{i}": executor.submit(
+                        self.env_manager.run_command,
+                        ['mount', f"{device}p{i}", mount_point],
+                        cwd=None
+                    )
+                    for i, mount_point in mount_points.items()
+                }
                 
+                results = {partition: future.result() for partition, future in futures.items()}
+            
+            failed = False
+            for partition, (returncode, stdout, stderr) in results.items():
                 if returncode != 0:
                     logger.error("Failed to mount partition %s: %s", partition, stderr)
-                    return False
+                    failed = True
+            
+            if failed:
+                return False
             
             logger.info("Partitions mounted successfully")
             return True
@@ -221,21 +399,22 @@ class InstallationVerifier:
         try:
             logger.info("Unmounting partitions...")
             
-            # Unmount each partition
-            for mount_point in mount_points:
-                # Unmount the partition
-                returncode, stdout, stderr = self.env_manager.run_command(
-                    ['umount', mount_point],
-                    cwd=None
-                )
+            # Unmount the partitions at the same time, as they are independent
+            with ThreadPoolExecutor(max_workers=len(mount_points)) as executor:
+                futures = {
+                    mount_point: executor.submit(self.env_manager.run_command, ['umount', mount_point], cwd=None)
+                    for mount_point in mount_points
+                }
                 
+                results = {mount_point: future.result() for mount_point, future in futures.items()}
+            
+            for mount_point, (returncode, stdout, stderr) in results.items():
                 if returncode != 0:
                     logger.warning("Failed to unmount %s: %s", mount_point, stderr)
                     # Continue anyway, this is not critical
             
-            # Remove the temporary directory
-            if os.path.exists(os.path.dirname(mount_points[0])):
-                shutil.rmtree(os.path.dirname(mount_points[0]))
+            # The listed directories belonged to the unmounted partitions
+            self._directory_entries.clear()
             
             logger.info("Partitions unmounted successfully")
             return True
@@ -257,21 +436,11 @@ class InstallationVerifier:
             logger.info("Verifying system...")
             
             # Check if essential system files exist
-            essential_files = [
-                'boot/zImage',
-                'boot/zero-gravitas.dtb',
-                'etc/fstab',
-                'etc/systemd/network/usb0.network',
-                'etc/pam.d/login',
-                'etc/pam.d/system-login'
-            ]
-            
-            for file in essential_files:
-                file_path = os.path.join(mount_point, file)
-                
-                if not os.path.exists(file_path):
-                    logger.error("Essential system file not found: %s", file)
-                    return False
+            missing = self._find_missing_files(mount_point, SYSTEM_FILES)
+            
+            if missing:
+                logger.error("Essential system file not found: %s", missing[0])
+                return False
             
             logger.info("System verified successfully")
             return True
@@ -300,34 +469,19 @@ class InstallationVerifier:
             logger.info("Verifying desktop environment...")
             
             # Check if essential desktop files exist
-            essential_files = [
-                'etc/X11/xorg.conf',
-                'root/.xserverrc',
-                'root/.xinitrc',
-                'root/.bash_profile'
-            ]
-            
-            for file in essential_files:
-                file_path = os.path.join(mount_point, file)
-                
-                if not os.path.exists(file_path):
-                    logger.error("Essential desktop file not found: %s", file)
-                    return False
+            missing = self._find_missing_files(mount_point, DESKTOP_FILES)
+            
+            if missing:
+                logger.error("Essential desktop file not found: %s", missing[0])
+                return False
             
             # Check if the desktop environment is installed
             if environment == 'xfce':
-                xfce_files = [
-                    'usr/bin/xfce4-session',
-                    'usr/bin/xfwm4',
-                    'usr/bin/xfdesktop'
-                ]
+                missing = self._find_missing_files(mount_point, XFCE_FILES)
                 
-                for file in xfce_files:
-                    file_path = os.path.join(mount_point, file)
-                    
-                    if not os.path.exists(file_path):
-                        logger.error("Xfce file not found: %s", file)
-                        return False
+                if missing:
+                    logger.error("Xfce file not found: %s", missing[0])
+                    return False
             
             logger.info("Desktop environment verified successfully")
             return True
@@ -335,6 +489,40 @@ class InstallationVerifier:
             logger.error("Error verifying desktop environment: %s", str(e))
             return False
     
+    def _find_missing_files(self, mount_point: str, files: Tuple[str, ...]) -> List[str]:
+        """
+        Find the files that do not exist on a mounted partition
+        
+        Each directory is listed once, instead of checking every file on its
+        own, and its entries are kept until the partitions are unmounted.
+        
+        Args:
+            mount_point: Mount point of the partition
+            files: Paths of the files, relative to the mount point
+        
+        Returns:
+            List of the files that were not found
+        """
+        missing = []
+        
+        for file in files:
+            directory = os.path.join(mount_point, os.path.dirname(file))
+            entries = self._directory_entries.get(directory)
+            
+            if entries is None:
+                try:
+                    with os.scandir(directory) as iterator:
+                        entries = {entry.name for entry in iterator}
+                except (FileNotFoundError, NotADirectoryError):
+                    entries = set()
+                
+                self._directory_entries[directory] = entries
+            
+            if os.path.basename(file) not in entries:
+                missing.append(file)
+        
+        return missing
+    
     def generate_report(self, device: str) -> Dict[str, Any]:
         """
         Generate a report of the installation
@@ -364,26 +552,11 @@ class InstallationVerifier:
         }
         
         try:
-            # Verify the bootloader
-            report['bootloader']['verified'] = self._verify_bootloader(device)
+            # Verify the components, reusing the results of a previous verification
+            results = {**self._verify_devices(device), **self._verify_mounted(device)}
             
-            # Verify the partitions
-            report['partitions']['verified'] = self._verify_partitions(device)
-            
-            # Create temporary mount points
-            mount_points = self._create_mount_points()
-            
-            try:
-                # Mount the partitions
-                if self._mount_partitions(device, mount_points):
-                    # Verify the system
-                    report['system']['verified'] = self._verify_system(mount_points[2])
-                    
-                    # Verify the desktop environment
-                    report['desktop']['verified'] = self._verify_desktop(mount_points[2])
-            finally:
-                # Unmount the partitions
-                self._unmount_partitions(list(mount_points.values()))
+            for name, verified in results.items():
+                report[name]['verified'] = verified
             
             # Set overall success
             report['success'] = (
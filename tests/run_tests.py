@@ -7,21 +7,60 @@ Test Runner for Parabola RM Builder
 This script runs all the tests for the Parabola RM Builder.
 """
 
+import io
 import os
 import sys
 import unittest
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 
-# Add the parent directory to the path
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Make the repository importable when this script is run directly; the test
+# modules themselves are imported as the tests package and rely on this
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _REPO_ROOT not in sys.path:
+    sys.path.insert(0, _REPO_ROOT)
 
-def run_tests(verbose=False, test_pattern=None):
+def _iter_tests(suite):
+    """
+    Iterate over the tests of a suite
+    
+    Args:
+        suite: Test suite
+    
+    Returns:
+        Iterator over the test cases of the suite and its nested suites
+    """
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            yield from _iter_tests(test)
+        else:
+            yield test
+
+def _run_module(module_name, verbose=False):
+    """
+    Run the tests of a module, in a worker process
+    
+    Args:
+        module_name: Name of the test module
+        verbose: Whether to run the tests in verbose mode
+    
+    Returns:
+        Tuple of (test output, whether all tests passed)
+    """
+    stream = io.StringIO()
+    suite = unittest.defaultTestLoader.loadTestsFromName(module_name)
+    result = unittest.TextTestRunner(stream=stream, verbosity=2 if verbose else 1).run(suite)
+    
+    return stream.getvalue(), result.wasSuccessful()
+
+def run_tests(verbose=False, test_pattern=None, jobs=1):
     """
     Run the tests
     
     Args:
         verbose: Whether to run the tests in verbose mode
         test_pattern: Pattern to match test names
+        jobs: Number of processes running test modules at the same time
     
     Returns:
         True if all tests passed, False otherwise
@@ -33,16 +72,32 @@ def run_tests(verbose=False, test_pattern=None):
     if test_pattern:
         suite = loader.loadTestsFromName(test_pattern)
     else:
-        suite = loader.discover(os.path.dirname(os.path.abspath(__file__)))
+        tests_dir = os.path.dirname(os.path.abspath(__file__))
+        suite = loader.discover(tests_dir, pattern='test_*.py', top_level_dir=os.path.dirname(tests_dir))
     
     # Create a test runner
     runner = unittest.TextTestRunner(verbosity=2 if verbose else 1)
     
-    # Run the tests
-    result = runner.run(suite)
+    if jobs <= 1 or test_pattern:
+        # Run the tests
+        result = runner.run(suite)
+        
+        # Return True if all tests passed, False otherwise
+        return result.wasSuccessful()
+    
+    # Run each module in its own process
+    modules = sorted({test.__module__ for test in _iter_tests(suite)})
+    success = True
+    
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(_run_module, name, verbose) for name in modules]
+        
+        for name, future in zip(modules, futures):
+            output, passed = future.result()
+            sys.stderr.write(f"{name}\n{output}")
+            success = passed and success
     
-    # Return True if all tests passed, False otherwise
-    return result.wasSuccessful()
+    return success
 
 def main():
     """
@@ -55,10 +110,12 @@ def main():
     parser = argparse.ArgumentParser(description='Run tests for Parabola RM Builder')
     parser.add_argument('-v', '--verbose', action='store_true', help='Run tests in verbose mode')
     parser.add_argument('-p', '--pattern', help='Pattern to match test names')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='Number of test modules to run at the same time (default: number of CPUs)')
     args = parser.parse_args()
     
     # Run the tests
-    success = run_tests(args.verbose, args.pattern)
+    success = run_tests(args.verbose, args.pattern, args.jobs)
     
     # Return 0 if all tests passed, 1 otherwise
     return 0 if success else 1
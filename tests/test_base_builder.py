@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the Base Builder
+"""
+
+import os
+import unittest
+import tempfile
+import subprocess
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock, call
+
+from src.builders.base_builder import BaseBuilder
+from src.cross_env.env_manager import CrossEnvManager
+from src.config_manager.config_manager import ConfigManager
+
+def _make_patch(*paths: str) -> str:
+    """
+    Create a patch changing the first line of files
+    
+    Args:
+        paths: Paths of the files in the source tree
+    
+    Returns:
+        Content of the patch
+    """
+    return ''.join(
+        f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n@@ -1 +1 @@\n-old\n+new\n"
+        for path in paths
+    )
+
+class TestBaseBuilder(unittest.TestCase):
+    """
+    Tests for the Base Builder
+    """
+    
+    def setUp(self):
+        """
+        Set up the test
+        """
+        # Create a temporary directory for the patches
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        
+        # Create a builder running commands through a mock environment manager
+        self.builder = BaseBuilder()
+        self.builder.env_manager = MagicMock()
+        
+        # Apply the patches with git, as pygit2 is optional
+        patcher = patch('src.builders.base_builder.pygit2', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def _write_patches(self, patches: dict) -> list:
+        """
+        Write patches to the temporary directory
+        
+        Args:
+            patches: Dictionary of patch file names to the files they change
+        
+        Returns:
+            Paths to the patches, sorted by file name
+        """
+        for name, paths in patches.items():
+            with open(os.path.join(self.temp_dir.name, name), 'w') as f:
+                f.write(_make_patch(*paths))
+        
+        return [os.path.join(self.temp_dir.name, name) for name in sorted(patches)]
+    
+    def _use_default_config(self, env_type: str) -> None:
+        """
+        Configure the builder with the default configuration, keeping the home directory in the temporary directory
+        
+        Args:
+            env_type: Type of the cross-compilation environment
+        """
+        patcher = patch.dict(os.environ, {'HOME': self.temp_dir.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        
+        config = ConfigManager().load_config()
+        config['cross_compilation']['environment_type'] = env_type
+        
+        self.builder.config = config
+        self.builder.build_dir = os.path.join(self.temp_dir.name, 'build')
+        self.builder.env_manager = CrossEnvManager(config)
+        self.builder.env_manager.container_runtime = 'docker'
+    
+    def test_get_build_env_default_config(self):
+        """
+        Test caching objects with ccache in the container with the default configuration
+        """
+        self._use_default_config('container')
+        env_vars = self.builder._get_build_env()
+        
+        # Check that the compiler is wrapped with ccache, which the image installs
+        cache_dir = os.path.join(self.temp_dir.name, '.parabola-rm-builder', 'cache')
+        self.assertEqual(env_vars['CROSS_COMPILE'], 'ccache arm-poky-linux-gnueabi-')
+        self.assertEqual(env_vars['CCACHE_DIR'], cache_dir)
+        self.assertIn('        ccache \\\n', self.builder.env_manager._generate_dockerfile())
+        
+        # Check that the cache directory is mounted at the same path in the container
+        container_command = self.builder.env_manager._get_container_command(['make'], '/tmp/source', env_vars)
+        self.assertIn(f'{cache_dir}:{cache_dir}', container_command)
+    
+    def test_get_build_env_default_config_direct(self):
+        """
+        Test building without ccache on a host where it is not installed
+        """
+        self._use_default_config('direct')
+        
+        with patch('shutil.which', return_value=None):
+            env_vars = self.builder._get_build_env()
+        
+        self.assertEqual(env_vars, {'ARCH': 'arm', 'CROSS_COMPILE': 'arm-poky-linux-gnueabi-'})
+    
+    def test_list_patches(self):
+        """
+        Test listing the patches of a directory in the order to apply them
+        """
+        patch_paths = self._write_patches({
+            '0002-b.patch': ['drivers/b.c'],
+            '0001-a.patch': ['arch/a.c'],
+            '.0003-swap.patch': ['arch/a.c']
+        })
+        with open(os.path.join(self.temp_dir.name, 'README'), 'w') as f:
+            f.write('Not a patch\n')
+        
+        # Check that hidden files and other files are skipped
+        self.assertEqual(self.builder._list_patches(self.temp_dir.name), patch_paths[1:])
+    
+    def test_group_patches(self):
+        """
+        Test grouping patches by the top-level directories they touch
+        """
+        patch_paths = self._write_patches({
+            '0001-arch.patch': ['arch/arm/boot/dts/zero-gravitas.dts'],
+            '0002-drivers.patch': ['drivers/video/epdc.c'],
+            '0003-arch-include.patch': ['arch/arm/mach-imx/clk.c', 'include/linux/epdc.h'],
+            '0004-include.patch': ['include/linux/epdc.h'],
+            '0005-firmware.patch': ['firmware/Makefile']
+        })
+        
+        # Check that patches sharing directories, directly or through another patch,
+        # are grouped, keeping their order
+        groups = sorted(self.builder._group_patches(patch_paths))
+        self.assertEqual(groups, [
+            [patch_paths[0], patch_paths[2], patch_paths[3]],
+            [patch_paths[1]],
+            [patch_paths[4]]
+        ])
+    
+    def test_group_patches_merge(self):
+        """
+        Test merging groups joined by a later patch
+        """
+        patch_paths = self._write_patches({
+            '0001-arch.patch': ['arch/a.c'],
+            '0002-drivers.patch': ['drivers/b.c'],
+            '0003-include.patch': ['include/c.h'],
+            '0004-arch-drivers.patch': ['drivers/b.c', 'arch/a.c']
+        })
+        
+        # Check that the merged group applies its patches in their original order
+        groups = sorted(self.builder._group_patches(patch_paths))
+        self.assertEqual(groups, [
+            [patch_paths[0], patch_paths[1], patch_paths[3]],
+            [patch_paths[2]]
+        ])
+    
+    def test_group_patches_unknown_targets(self):
+        """
+        Test applying all patches as one group when the files a patch changes are unknown
+        """
+        patch_paths = self._write_patches({
+            '0001-arch.patch': ['arch/a.c'],
+            '0002-drivers.patch': ['drivers/b.c']
+        })
+        with open(patch_paths[1], 'w') as f:
+            f.write('Not a diff\n')
+        
+        self.assertEqual(self.builder._group_patches(patch_paths), [patch_paths])
+    
+    def test_apply_patch_group(self):
+        """
+        Test applying a group of patches with a single git invocation
+        """
+        patch_paths = self._write_patches({'0001-a.patch': ['a.c'], '0002-b.patch': ['b.c']})
+        self.builder.env_manager.run_command.return_value = (0, '', '')
+        
+        self.assertTrue(self.builder._apply_patch_group(patch_paths, '/tmp/source'))
+        self.builder.env_manager.run_command.assert_called_once_with(['git', 'apply'] + patch_paths, cwd='/tmp/source')
+    
+    def test_apply_patch_group_fallback(self):
+        """
+        Test applying patches one by one when the batch fails
+        """
+        patch_paths = self._write_patches({'0001-a.patch': ['a.c'], '0002-b.patch': ['b.c']})
+        self.builder.env_manager.run_command.side_effect = [(1, '', 'error'), (0, '', ''), (0, '', '')]
+        
+        self.assertTrue(self.builder._apply_patch_group(patch_paths, '/tmp/source'))
+        
+        # Check that the patches were applied one by one, in order, after the batch
+        self.assertEqual(self.builder.env_manager.run_command.call_args_list, [
+            call(['git', 'apply'] + patch_paths, cwd='/tmp/source'),
+            call(['git', 'apply', patch_paths[0]], cwd='/tmp/source'),
+            call(['git', 'apply', patch_paths[1]], cwd='/tmp/source')
+        ])
+    
+    def test_apply_patch_group_fallback_failure(self):
+        """
+        Test stopping at the first patch that does not apply on its own
+        """
+        patch_paths = self._write_patches({'0001-a.patch': ['a.c'], '0002-b.patch': ['b.c']})
+        self.builder.env_manager.run_command.side_effect = [(1, '', 'error'), (1, '', 'error')]
+        
+        self.assertFalse(self.builder._apply_patch_group(patch_paths, '/tmp/source'))
+        self.assertEqual(self.builder.env_manager.run_command.call_count, 2)
+    
+    def _make_pygit2(self, source_dir: str, patch_paths: list, applies: list) -> MagicMock:
+        """
+        Create a stand-in for pygit2 applying patches by writing the files they change
+        
+        Args:
+            source_dir: Source tree the patches are applied to
+            patch_paths: Paths to the patches, changing one file each
+            applies: Whether each patch applies
+        
+        Returns:
+            Mock of the pygit2 module
+        """
+        # Each patch changes the file named after it
+        diffs = {}
+        for patch_path in patch_paths:
+            with open(patch_path, 'rb') as f:
+                path = os.path.basename(patch_path)[5:-len('.patch')] + '.c'
+                diffs[f.read()] = SimpleNamespace(
+                    path=path,
+                    deltas=[SimpleNamespace(old_file=SimpleNamespace(path=path), new_file=SimpleNamespace(path=path))]
+                )
+        
+        def apply(diff, location):
+            with open(os.path.join(source_dir, diff.path), 'w') as f:
+                f.write('new\n')
+        
+        mock_pygit2 = MagicMock()
+        mock_pygit2.Diff.parse_diff.side_effect = diffs.__getitem__
+        mock_pygit2.Repository.return_value.applies.side_effect = applies
+        mock_pygit2.Repository.return_value.apply.side_effect = apply
+        return mock_pygit2
+    
+    def test_apply_patch_group_in_process_fallback(self):
+        """
+        Test restoring the source tree and applying the patches with git when one does not apply with libgit2
+        """
+        patch_paths = self._write_patches({'0001-a.patch': ['a.c'], '0002-b.patch': ['b.c']})
+        self.builder.env_manager.run_command.return_value = (0, '', '')
+        
+        # Create a source tree where only the first patch applies with libgit2
+        source_dir = os.path.join(self.temp_dir.name, 'source')
+        os.makedirs(source_dir)
+        with open(os.path.join(source_dir, 'a.c'), 'w') as f:
+            f.write('old\n')
+        
+        mock_pygit2 = self._make_pygit2(source_dir, patch_paths, [True, False])
+        
+        with patch('src.builders.base_builder.pygit2', mock_pygit2):
+            self.assertTrue(self.builder._apply_patch_group(patch_paths, source_dir))
+        
+        # Check that the first patch was undone before applying the group with git
+        with open(os.path.join(source_dir, 'a.c')) as f:
+            self.assertEqual(f.read(), 'old\n')
+        self.assertFalse(os.path.exists(os.path.join(source_dir, 'b.c')))
+        self.builder.env_manager.run_command.assert_called_once_with(['git', 'apply'] + patch_paths, cwd=source_dir)
+    
+    def test_apply_patch_group_in_process_error(self):
+        """
+        Test restoring the source tree and applying the patches with git when libgit2 fails
+        """
+        patch_paths = self._write_patches({'0001-a.patch': ['a.c'], '0002-b.patch': ['b.c']})
+        self.builder.env_manager.run_command.return_value = (0, '', '')
+        
+        source_dir = os.path.join(self.temp_dir.name, 'source')
+        os.makedirs(source_dir)
+        
+        # Make libgit2 fail after writing the file of the second patch
+        mock_pygit2 = self._make_pygit2(source_dir, patch_paths, [True, True])
+        apply = mock_pygit2.Repository.return_value.apply.side_effect
+        
+        def apply_failing(diff, location):
+            apply(diff, location)
+            if diff.path == 'b.c':
+                raise OSError('disk full')
+        
+        mock_pygit2.Repository.return_value.apply.side_effect = apply_failing
+        
+        with patch('src.builders.base_builder.pygit2', mock_pygit2):
+            self.assertTrue(self.builder._apply_patch_group(patch_paths, source_dir))
+        
+        # Check that both patches were undone before applying the group with git
+        self.assertEqual(os.listdir(source_dir), [])
+        self.builder.env_manager.run_command.assert_called_once_with(['git', 'apply'] + patch_paths, cwd=source_dir)
+    
+    def _git(self, *args: str, cwd: str = None) -> str:
+        """
+        Run git on the host
+        
+        Args:
+            args: Arguments of git
+            cwd: Working directory
+        
+        Returns:
+            Standard output of git, stripped
+        """
+        env = dict(os.environ, GIT_AUTHOR_NAME='test', GIT_AUTHOR_EMAIL='test@example.com',
+                   GIT_COMMITTER_NAME='test', GIT_COMMITTER_EMAIL='test@example.com')
+        result = subprocess.run(['git'] + list(args), cwd=cwd, env=env, stdout=subprocess.PIPE, check=True)
+        return result.stdout.decode().strip()
+    
+    def test_ensure_worktree(self):
+        """
+        Test checking out a worktree from a shallow mirror of a single branch
+        """
+        # Create an upstream repository with two commits on the branch and another branch
+        upstream_dir = os.path.join(self.temp_dir.name, 'upstream')
+        self._git('init', '-q', upstream_dir)
+        self._git('commit', '-q', '--allow-empty', '-m', 'first', cwd=upstream_dir)
+        self._git('checkout', '-q', '-b', 'other', cwd=upstream_dir)
+        self._git('commit', '-q', '--allow-empty', '-m', 'other', cwd=upstream_dir)
+        self._git('checkout', '-q', '-b', 'wanted', 'HEAD~1', cwd=upstream_dir)
+        self._git('commit', '-q', '--allow-empty', '-m', 'second', cwd=upstream_dir)
+        
+        url = 'file://' + upstream_dir
+        worktree_dir = os.path.join(self.temp_dir.name, 'linux')
+        
+        with patch.dict(os.environ, {'PARABOLA_GIT_CACHE': os.path.join(self.temp_dir.name, 'git')}):
+            self.builder.env_manager = CrossEnvManager({'cross_compilation': {'environment_type': 'direct'}})
+        
+        self.assertTrue(self.builder._ensure_worktree(url, worktree_dir, 'wanted'))
+        
+        # Check that only the tip of the branch was mirrored
+        mirror_dir = self.builder._get_mirror(url, 'wanted')
+        self.assertEqual(self._git('--git-dir', mirror_dir, 'for-each-ref', '--format=%(refname)'), 'refs/heads/wanted')
+        self.assertEqual(self._git('--git-dir', mirror_dir, 'rev-list', '--count', 'wanted'), '1')
+        self.assertEqual(self._git('log', '-1', '--format=%s', cwd=worktree_dir), 'second')
+        
+        # Check that the worktree is moved to the new tip of the branch
+        self._git('commit', '-q', '--allow-empty', '-m', 'third', cwd=upstream_dir)
+        self.assertTrue(self.builder._ensure_worktree(url, worktree_dir, 'wanted'))
+        self.assertEqual(self._git('log', '-1', '--format=%s', cwd=worktree_dir), 'third')
+        self.assertEqual(self._git('--git-dir', mirror_dir, 'worktree', 'list', '--porcelain').count('worktree '), 2)
+
+if __name__ == '__main__':
+    unittest.main()
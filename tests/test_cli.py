@@ -6,32 +6,38 @@ Tests for the CLI module
 """
 
 import os
-import sys
 import unittest
 import tempfile
 import yaml
+from types import SimpleNamespace
 from unittest.mock import patch, MagicMock
 
-# Add the parent directory to the path
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Use the libyaml bindings when available
+try:
+    from yaml import CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeDumper
 
 import src.cli as cli
+from src.builders.bootloader.uboot_builder import UBootBuilder
+from src.builders.kernel.kernel_builder import KernelBuilder
 
 class TestCLI(unittest.TestCase):
     """
     Tests for the CLI module
     """
     
-    def setUp(self):
+    @classmethod
+    def setUpClass(cls):
         """
-        Set up the test
+        Set up the tests
         """
         # Create a temporary directory for test files
-        self.temp_dir = tempfile.TemporaryDirectory()
+        cls.temp_dir = tempfile.TemporaryDirectory()
         
-        # Create a test configuration file
-        self.test_config_path = os.path.join(self.temp_dir.name, 'test_config.yaml')
-        self.test_config = {
+        # Create a test configuration file, shared by the tests as none of them modifies it
+        cls.test_config_path = os.path.join(cls.temp_dir.name, 'test_config.yaml')
+        cls.test_config = {
             'cross_compilation': {
                 'environment_type': 'container',
                 'toolchain_version': 'test',
@@ -44,15 +50,16 @@ class TestCLI(unittest.TestCase):
             }
         }
         
-        with open(self.test_config_path, 'w') as f:
-            yaml.dump(self.test_config, f)
+        with open(cls.test_config_path, 'w') as f:
+            yaml.dump(cls.test_config, f, Dumper=SafeDumper)
     
-    def tearDown(self):
+    @classmethod
+    def tearDownClass(cls):
         """
-        Clean up after the test
+        Clean up after the tests
         """
         # Remove the temporary directory
-        self.temp_dir.cleanup()
+        cls.temp_dir.cleanup()
     
     def test_setup_argparse(self):
         """
@@ -76,9 +83,8 @@ class TestCLI(unittest.TestCase):
         mock_config_manager_instance = MagicMock()
         mock_config_manager.return_value = mock_config_manager_instance
         
-        # Create mock arguments
-        args = MagicMock()
-        args.output = self.test_config_path
+        # Create the arguments
+        args = SimpleNamespace(output=self.test_config_path)
         
         # Call the init_config function
         result = cli.init_config(args, mock_config_manager_instance)
@@ -106,9 +112,8 @@ class TestCLI(unittest.TestCase):
         mock_cross_env_manager_instance.setup_environment.return_value = True
         mock_cross_env_manager.return_value = mock_cross_env_manager_instance
         
-        # Create mock arguments
-        args = MagicMock()
-        args.config = self.test_config_path
+        # Create the arguments
+        args = SimpleNamespace(config=self.test_config_path)
         
         # Call the setup_environment function
         result = cli.setup_environment(args, mock_config_manager_instance)
@@ -121,7 +126,7 @@ class TestCLI(unittest.TestCase):
         mock_cross_env_manager.assert_called_once_with(self.test_config)
         mock_cross_env_manager_instance.setup_environment.assert_called_once()
     
-    @patch('src.cli.InstallationExecutor')
+    @patch('src.executor.installation_executor.InstallationExecutor')
     @patch('src.cli.CrossEnvManager')
     @patch('src.cli.ConfigManager')
     def test_build_components_all(self, mock_config_manager, mock_cross_env_manager, mock_installation_executor):
@@ -143,12 +148,13 @@ class TestCLI(unittest.TestCase):
         mock_installation_executor_instance._build_components.return_value = True
         mock_installation_executor.return_value = mock_installation_executor_instance
         
-        # Create mock arguments
-        args = MagicMock()
-        args.config = self.test_config_path
-        args.all = True
-        args.bootloader = False
-        args.kernel = False
+        # Create the arguments
+        args = SimpleNamespace(
+            config=self.test_config_path,
+            all=True,
+            bootloader=False,
+            kernel=False
+        )
         
         # Call the build_components function
         result = cli.build_components(args, mock_config_manager_instance)
@@ -163,7 +169,7 @@ class TestCLI(unittest.TestCase):
         mock_installation_executor.assert_called_once_with(mock_config_manager_instance, mock_cross_env_manager_instance)
         mock_installation_executor_instance._build_components.assert_called_once()
     
-    @patch('src.cli.UBootBuilder')
+    @patch('src.builders.bootloader.uboot_builder.UBootBuilder')
     @patch('src.cli.CrossEnvManager')
     @patch('src.cli.ConfigManager')
     def test_build_components_bootloader(self, mock_config_manager, mock_cross_env_manager, mock_uboot_builder):
@@ -185,12 +191,13 @@ class TestCLI(unittest.TestCase):
         mock_uboot_builder_instance.build.return_value = True
         mock_uboot_builder.return_value = mock_uboot_builder_instance
         
-        # Create mock arguments
-        args = MagicMock()
-        args.config = self.test_config_path
-        args.all = False
-        args.bootloader = True
-        args.kernel = False
+        # Create the arguments
+        args = SimpleNamespace(
+            config=self.test_config_path,
+            all=False,
+            bootloader=True,
+            kernel=False
+        )
         
         # Call the build_components function
         result = cli.build_components(args, mock_config_manager_instance)
@@ -205,7 +212,47 @@ class TestCLI(unittest.TestCase):
         mock_uboot_builder.assert_called_once_with(self.test_config, mock_cross_env_manager_instance)
         mock_uboot_builder_instance.build.assert_called_once()
     
-    @patch('src.cli.InstallationExecutor')
+    @patch('src.builders.orchestrator.BuildOrchestrator')
+    @patch('src.cli.CrossEnvManager')
+    @patch('src.cli.ConfigManager')
+    def test_build_components_bootloader_and_kernel(self, mock_config_manager, mock_cross_env_manager, mock_build_orchestrator):
+        """
+        Test building the bootloader and the kernel in parallel
+        """
+        # Create a mock ConfigManager
+        mock_config_manager_instance = MagicMock()
+        mock_config_manager_instance.load_config.return_value = self.test_config
+        mock_config_manager.return_value = mock_config_manager_instance
+        
+        # Create a mock CrossEnvManager
+        mock_cross_env_manager_instance = MagicMock()
+        mock_cross_env_manager_instance.setup_environment.return_value = True
+        mock_cross_env_manager.return_value = mock_cross_env_manager_instance
+        
+        # Create a mock BuildOrchestrator
+        mock_build_orchestrator_instance = MagicMock()
+        mock_build_orchestrator_instance.build.return_value = True
+        mock_build_orchestrator.return_value = mock_build_orchestrator_instance
+        
+        # Create the arguments
+        args = SimpleNamespace(
+            config=self.test_config_path,
+            all=False,
+            bootloader=True,
+            kernel=True
+        )
+        
+        # Call the build_components function
+        result = cli.build_components(args, mock_config_manager_instance)
+        
+        # Check that the function returned success
+        self.assertEqual(result, 0)
+        
+        # Check that both builders were handed to the orchestrator
+        mock_build_orchestrator.assert_called_once_with(self.test_config, mock_cross_env_manager_instance)
+        mock_build_orchestrator_instance.build.assert_called_once_with([UBootBuilder, KernelBuilder])
+    
+    @patch('src.executor.installation_executor.InstallationExecutor')
     @patch('src.cli.CrossEnvManager')
     @patch('src.cli.ConfigManager')
     def test_install_parabola(self, mock_config_manager, mock_cross_env_manager, mock_installation_executor):
@@ -227,11 +274,12 @@ class TestCLI(unittest.TestCase):
         mock_installation_executor_instance.execute.return_value = True
         mock_installation_executor.return_value = mock_installation_executor_instance
         
-        # Create mock arguments
-        args = MagicMock()
-        args.config = self.test_config_path
-        args.device = '/dev/mmcblk1'
-        args.skip_build = False
+        # Create the arguments
+        args = SimpleNamespace(
+            config=self.test_config_path,
+            device='/dev/mmcblk1',
+            skip_build=False
+        )
         
         # Call the install_parabola function
         result = cli.install_parabola(args, mock_config_manager_instance)
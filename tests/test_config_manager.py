@@ -6,52 +6,70 @@ Tests for the Configuration Manager
 """
 
 import os
-import sys
+import copy
 import unittest
 import tempfile
 import yaml
 
-# Add the parent directory to the path
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Use the libyaml bindings when available
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
 
-from src.config_manager.config_manager import ConfigManager
+from src.config_manager.config_manager import ConfigManager, _split_key_path
+
+# Test configuration, and its YAML serialization written to the test configuration file
+TEST_CONFIG = {
+    'cross_compilation': {
+        'environment_type': 'container',
+        'toolchain_version': 'test',
+        'container': {
+            'base_image': 'test:latest'
+        }
+    },
+    'hardware': {
+        'tablet_model': 'rm1'
+    }
+}
+
+TEST_CONFIG_YAML = yaml.dump(TEST_CONFIG, Dumper=SafeDumper)
+
+# Values of the test configuration, by key path, expected after loading it
+EXPECTED_VALUES = {
+    'cross_compilation.environment_type': 'container',
+    'cross_compilation.toolchain_version': 'test',
+    'cross_compilation.container.base_image': 'test:latest',
+    'hardware.tablet_model': 'rm1'
+}
 
 class TestConfigManager(unittest.TestCase):
     """
     Tests for the Configuration Manager
     """
     
-    def setUp(self):
+    @classmethod
+    def setUpClass(cls):
         """
-        Set up the test
+        Set up the tests
         """
         # Create a temporary directory for test files
-        self.temp_dir = tempfile.TemporaryDirectory()
-        
-        # Create a test configuration file
-        self.test_config_path = os.path.join(self.temp_dir.name, 'test_config.yaml')
-        self.test_config = {
-            'cross_compilation': {
-                'environment_type': 'container',
-                'toolchain_version': 'test',
-                'container': {
-                    'base_image': 'test:latest'
-                }
-            },
-            'hardware': {
-                'tablet_model': 'rm1'
-            }
-        }
+        cls.temp_dir = tempfile.TemporaryDirectory()
+        
+        # Create a test configuration file, shared by the tests and never modified
+        cls.test_config_path = os.path.join(cls.temp_dir.name, 'test_config.yaml')
+        cls.test_config = TEST_CONFIG
         
-        with open(self.test_config_path, 'w') as f:
-            yaml.dump(self.test_config, f)
+        with open(cls.test_config_path, 'w') as f:
+            f.write(TEST_CONFIG_YAML)
     
-    def tearDown(self):
+    @classmethod
+    def tearDownClass(cls):
         """
-        Clean up after the test
+        Clean up after the tests
         """
         # Remove the temporary directory
-        self.temp_dir.cleanup()
+        cls.temp_dir.cleanup()
     
     def test_load_config(self):
         """
@@ -61,23 +79,50 @@ class TestConfigManager(unittest.TestCase):
         config_manager = ConfigManager(self.test_config_path)
         
         # Load the configuration
-        config = config_manager.load_config()
+        config_manager.load_config()
         
         # Check that the configuration was loaded correctly
-        self.assertEqual(config['cross_compilation']['environment_type'], 'container')
-        self.assertEqual(config['cross_compilation']['toolchain_version'], 'test')
-        self.assertEqual(config['cross_compilation']['container']['base_image'], 'test:latest')
+        self.assertEqual({key: config_manager.get_value(key) for key in EXPECTED_VALUES}, EXPECTED_VALUES)
+    
+    def test_load_config_cached(self):
+        """
+        Test reloading an unchanged and a changed configuration file
+        """
+        # Create a configuration manager with a copy of the test configuration file,
+        # as the file is changed by this test
+        test_dir = tempfile.mkdtemp(dir=self.temp_dir.name)
+        test_config_path = os.path.join(test_dir, 'test_config.yaml')
+        with open(test_config_path, 'w') as f:
+            f.write(TEST_CONFIG_YAML)
+        config_manager = ConfigManager(test_config_path)
+        
+        # Load the configuration and modify the loaded values
+        config_manager.load_config()
+        config_manager.set_value('hardware.tablet_model', 'rm2')
+        
+        # Check that reloading discards the modifications
+        config = config_manager.load_config()
         self.assertEqual(config['hardware']['tablet_model'], 'rm1')
+        
+        # Change the configuration file
+        test_config = copy.deepcopy(self.test_config)
+        test_config['hardware']['tablet_model'] = 'rm2'
+        with open(test_config_path, 'w') as f:
+            yaml.dump(test_config, f, Dumper=SafeDumper)
+        os.utime(test_config_path, ns=(0, 0))
+        
+        # Check that reloading picks up the change
+        config = config_manager.load_config()
+        self.assertEqual(config['hardware']['tablet_model'], 'rm2')
     
     def test_get_value(self):
         """
         Test getting a value from the configuration
         """
-        # Create a configuration manager with the test configuration file
-        config_manager = ConfigManager(self.test_config_path)
-        
-        # Load the configuration
-        config_manager.load_config()
+        # Create a configuration manager holding the test configuration, without
+        # loading it, as only the lookup is tested
+        config_manager = ConfigManager()
+        config_manager.config = copy.deepcopy(self.test_config)
         
         # Get values from the configuration
         self.assertEqual(
@@ -105,16 +150,20 @@ class TestConfigManager(unittest.TestCase):
             config_manager.get_value('non_existent_key', 'default_value'),
             'default_value'
         )
+        
+        # Check that the key path split by the earlier lookup is reused
+        hits = _split_key_path.cache_info().hits
+        config_manager.get_value('hardware.tablet_model')
+        self.assertEqual(_split_key_path.cache_info().hits, hits + 1)
     
     def test_set_value(self):
         """
         Test setting a value in the configuration
         """
-        # Create a configuration manager with the test configuration file
-        config_manager = ConfigManager(self.test_config_path)
-        
-        # Load the configuration
-        config_manager.load_config()
+        # Create a configuration manager holding the test configuration, without
+        # loading it, as only the update is tested
+        config_manager = ConfigManager()
+        config_manager.config = copy.deepcopy(self.test_config)
         
         # Set values in the configuration
         config_manager.set_value('cross_compilation.environment_type', 'direct')
@@ -173,16 +222,19 @@ class TestConfigManager(unittest.TestCase):
         config_manager.set_value('new_section.new_key', 'new_value')
         
         # Save the configuration to a new file
-        new_config_path = os.path.join(self.temp_dir.name, 'new_config.yaml')
+        new_config_path = os.path.join(tempfile.mkdtemp(dir=self.temp_dir.name), 'new_config.yaml')
         config_manager.save_config(new_config_path)
         
         # Load the new configuration file
         with open(new_config_path, 'r') as f:
-            new_config = yaml.safe_load(f)
+            new_config = yaml.load(f, Loader=SafeLoader)
         
-        # Check that the configuration was saved correctly
-        self.assertEqual(new_config['cross_compilation']['environment_type'], 'direct')
-        self.assertEqual(new_config['new_section']['new_key'], 'new_value')
+        # Check that the whole configuration, including the changed values, was saved correctly
+        self.assertEqual(new_config, config_manager.config)
+        self.assertEqual(
+            (new_config['cross_compilation']['environment_type'], new_config['new_section']['new_key']),
+            ('direct', 'new_value')
+        )
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -5,17 +5,68 @@
 Tests for the Cross-Compilation Environment Manager
 """
 
+import io
 import os
-import sys
+import copy
 import unittest
 import tempfile
-import yaml
-from unittest.mock import patch, MagicMock
+import json
+from types import MappingProxyType
+from unittest.mock import patch, MagicMock, ANY, call
 
-# Add the parent directory to the path
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.cross_env.env_manager import CrossEnvManager, _detect_runtime, _REPO_ROOT
 
-from src.cross_env.env_manager import CrossEnvManager
+# Test configuration, copied by the tests that modify it
+TEST_CONFIG = {
+    'cross_compilation': {
+        'environment_type': 'container',
+        'toolchain_version': 'test',
+        'container': {
+            'base_image': 'test:latest',
+            'resource_limits': {
+                'cpu': 2,
+                'memory': '2g'
+            },
+            'volume_mounts': [
+                'source:/workspaces/source',
+                'output:/workspaces/output'
+            ]
+        },
+        'direct': {
+            'install_path': '/tmp/toolchain',
+            'use_system_package_manager': True
+        },
+        'build': {
+            'parallel_jobs': 2,
+            'use_ccache': True,
+            'cache_dir': '/tmp/cache'
+        }
+    }
+}
+
+# Toolchain directory used by the toolchain tests, and its environment setup script
+_TOOLCHAIN_DIR = '/tmp/toolchain'
+_TOOLCHAIN_ENV_FILE = '/tmp/toolchain/poky-2.1.3/environment-setup-armv7at2hf-neon-poky-linux-gnueabi'
+
+# Expected calls probing the container runtimes on PATH
+_DOCKER_CALL = call(
+    ['/usr/bin/docker', 'version', '--format', '{{.Server.Version}}'],
+    stdout=-1,
+    stderr=-1,
+    check=False
+)
+_PODMAN_CALL = call(
+    ['/usr/bin/podman', 'info', '--format', '{{.Host.Arch}}'],
+    stdout=-1,
+    stderr=-1,
+    check=False
+)
+
+# Results of the container runtime probes, shared by the tests
+_DOCKER_OK = MagicMock(returncode=0, stdout=b'20.10.7')
+_DOCKER_FAIL = MagicMock(returncode=1)
+_PODMAN_OK = MagicMock(returncode=0, stdout=b'amd64')
+_PODMAN_FAIL = MagicMock(returncode=1)
 
 class TestCrossEnvManager(unittest.TestCase):
     """
@@ -26,33 +77,20 @@ class TestCrossEnvManager(unittest.TestCase):
         """
         Set up the test
         """
-        # Create a test configuration
-        self.test_config = {
-            'cross_compilation': {
-                'environment_type': 'container',
-                'toolchain_version': 'test',
-                'container': {
-                    'base_image': 'test:latest',
-                    'resource_limits': {
-                        'cpu': 2,
-                        'memory': '2g'
-                    },
-                    'volume_mounts': [
-                        'source:/workspaces/source',
-                        'output:/workspaces/output'
-                    ]
-                },
-                'direct': {
-                    'install_path': '/tmp/toolchain',
-                    'use_system_package_manager': True
-                },
-                'build': {
-                    'parallel_jobs': 2,
-                    'use_ccache': True,
-                    'cache_dir': '/tmp/cache'
-                }
-            }
-        }
+        # Forget the container runtime detected by previous tests
+        _detect_runtime.cache_clear()
+        
+        # Share the test configuration, read-only so that a test cannot change it for the others
+        self.test_config = MappingProxyType(TEST_CONFIG)
+        
+        # Keep the git mirrors in a temporary directory
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.git_cache_dir = os.path.join(temp_dir.name, 'git')
+        
+        patcher = patch.dict(os.environ, {'PARABOLA_GIT_CACHE': self.git_cache_dir})
+        patcher.start()
+        self.addCleanup(patcher.stop)
     
     def test_init(self):
         """
@@ -67,106 +105,97 @@ class TestCrossEnvManager(unittest.TestCase):
         self.assertEqual(env_manager.container_config, self.test_config['cross_compilation']['container'])
         self.assertEqual(env_manager.build_config, self.test_config['cross_compilation']['build'])
     
+    @patch('shutil.which')
     @patch('subprocess.run')
-    def test_check_container_runtime_docker(self, mock_run):
+    def test_check_container_runtime(self, mock_run, mock_which):
         """
-        Test checking for Docker container runtime
+        Test checking for Docker, Podman, or no container runtime
         """
-        # Mock the subprocess.run function to return success for Docker
-        mock_process = MagicMock()
-        mock_process.returncode = 0
-        mock_process.stdout = b'Docker version 20.10.7, build f0df350'
-        mock_run.return_value = mock_process
-        
-        # Create a Cross-Compilation Environment Manager
-        env_manager = CrossEnvManager(self.test_config)
+        # Mock both runtimes being on PATH
+        mock_which.side_effect = lambda name: f'/usr/bin/{name}'
         
-        # Check for container runtime
-        result = env_manager._check_container_runtime()
+        # Results of the runtime probes, with the expected runtime and calls
+        cases = [
+            ((_DOCKER_OK,), '/usr/bin/docker', [_DOCKER_CALL]),
+            ((_DOCKER_FAIL, _PODMAN_OK), '/usr/bin/podman', [_DOCKER_CALL, _PODMAN_CALL]),
+            ((_DOCKER_FAIL, _PODMAN_FAIL), None, [_DOCKER_CALL, _PODMAN_CALL])
+        ]
         
-        # Check that Docker was found
-        self.assertTrue(result)
-        self.assertEqual(env_manager.container_runtime, 'docker')
-        
-        # Check that subprocess.run was called with the correct arguments
-        mock_run.assert_called_once_with(
-            ['docker', '--version'],
-            stdout=-1,
-            stderr=-1,
-            check=False
-        )
+        for results, runtime, calls in cases:
+            with self.subTest(runtime=runtime):
+                # Forget the container runtime detected by the previous case
+                _detect_runtime.cache_clear()
+                mock_run.reset_mock()
+                mock_run.side_effect = iter(results)
+                
+                # Create a Cross-Compilation Environment Manager
+                env_manager = CrossEnvManager(self.test_config)
+                
+                # Check that the expected runtime was found, probing the runtimes in order
+                self.assertEqual(env_manager._check_container_runtime(), runtime is not None)
+                self.assertEqual(mock_run.call_args_list, calls)
+                if runtime is not None:
+                    self.assertEqual(env_manager.container_runtime, runtime)
+                
+                # Check that the result is reused
+                self.assertEqual(CrossEnvManager(self.test_config)._check_container_runtime(), runtime is not None)
+                self.assertEqual(mock_run.call_args_list, calls)
     
+    @patch('shutil.which')
     @patch('subprocess.run')
-    def test_check_container_runtime_podman(self, mock_run):
+    def test_check_container_runtime_not_on_path(self, mock_run, mock_which):
         """
-        Test checking for Podman container runtime
+        Test checking for container runtime when none is on PATH
         """
-        # Mock the subprocess.run function to return failure for Docker and success for Podman
-        mock_docker_process = MagicMock()
-        mock_docker_process.returncode = 1
-        mock_podman_process = MagicMock()
-        mock_podman_process.returncode = 0
-        mock_podman_process.stdout = b'podman version 3.0.1'
-        mock_run.side_effect = [mock_docker_process, mock_podman_process]
+        # Mock neither runtime being on PATH
+        mock_which.return_value = None
         
         # Create a Cross-Compilation Environment Manager
         env_manager = CrossEnvManager(self.test_config)
         
-        # Check for container runtime
-        result = env_manager._check_container_runtime()
-        
-        # Check that Podman was found
-        self.assertTrue(result)
-        self.assertEqual(env_manager.container_runtime, 'podman')
-        
-        # Check that subprocess.run was called with the correct arguments
-        mock_run.assert_any_call(
-            ['docker', '--version'],
-            stdout=-1,
-            stderr=-1,
-            check=False
-        )
-        mock_run.assert_any_call(
-            ['podman', '--version'],
-            stdout=-1,
-            stderr=-1,
-            check=False
-        )
+        # Check that no container runtime was found without spawning a process
+        self.assertFalse(env_manager._check_container_runtime())
+        mock_run.assert_not_called()
     
     @patch('subprocess.run')
-    def test_check_container_runtime_none(self, mock_run):
+    def test_check_container_image_store(self, mock_run):
         """
-        Test checking for container runtime when none is available
+        Test finding the container image in the local image store
         """
-        # Mock the subprocess.run function to return failure for both Docker and Podman
-        mock_docker_process = MagicMock()
-        mock_docker_process.returncode = 1
-        mock_podman_process = MagicMock()
-        mock_podman_process.returncode = 1
-        mock_run.side_effect = [mock_docker_process, mock_podman_process]
-        
         # Create a Cross-Compilation Environment Manager
         env_manager = CrossEnvManager(self.test_config)
+        env_manager.container_runtime = '/usr/bin/podman'
+        image_name = env_manager._get_container_image_name()
         
-        # Check for container runtime
-        result = env_manager._check_container_runtime()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # Create a Podman image index listing the image
+            store = os.path.join(temp_dir, 'images.json')
+            with open(store, 'w') as f:
+                json.dump([{'id': 'abc123', 'names': [f'localhost/{image_name}']}], f)
+            
+            with patch('src.cross_env.env_manager._PODMAN_IMAGE_STORES', [store]):
+                result = env_manager._check_container_image(image_name)
         
-        # Check that no container runtime was found
-        self.assertFalse(result)
+        # Check that the image was found without running the container runtime
+        self.assertTrue(result)
+        mock_run.assert_not_called()
+    
+    def test_get_container_image_name(self):
+        """
+        Test that the container image tag follows the generated Dockerfile
+        """
+        # Create Cross-Compilation Environment Managers with different base images
+        env_manager = CrossEnvManager(self.test_config)
+        same_env_manager = CrossEnvManager(self.test_config)
+        other_config = {'cross_compilation': dict(self.test_config['cross_compilation'], container={'base_image': 'other:latest'})}
+        other_env_manager = CrossEnvManager(other_config)
         
-        # Check that subprocess.run was called with the correct arguments
-        mock_run.assert_any_call(
-            ['docker', '--version'],
-            stdout=-1,
-            stderr=-1,
-            check=False
-        )
-        mock_run.assert_any_call(
-            ['podman', '--version'],
-            stdout=-1,
-            stderr=-1,
-            check=False
-        )
+        # Check that the tag starts with the toolchain version
+        self.assertTrue(env_manager._get_container_image_name().startswith('parabola-rm-builder-toolchain:test-'))
+        
+        # Check that the tag only changes with the Dockerfile
+        self.assertEqual(env_manager._get_container_image_name(), same_env_manager._get_container_image_name())
+        self.assertNotEqual(env_manager._get_container_image_name(), other_env_manager._get_container_image_name())
     
     @patch('os.path.isdir')
     @patch('os.path.isfile')
@@ -182,14 +211,14 @@ class TestCrossEnvManager(unittest.TestCase):
         env_manager = CrossEnvManager(self.test_config)
         
         # Check for the toolchain
-        result = env_manager._check_toolchain('/tmp/toolchain')
+        result = env_manager._check_toolchain(_TOOLCHAIN_DIR)
         
         # Check that the toolchain was found
         self.assertTrue(result)
         
         # Check that os.path.isdir and os.path.isfile were called with the correct arguments
-        mock_isdir.assert_called_once_with('/tmp/toolchain')
-        mock_isfile.assert_called_once_with('/tmp/toolchain/poky-2.1.3/environment-setup-armv7at2hf-neon-poky-linux-gnueabi')
+        mock_isdir.assert_called_once_with(_TOOLCHAIN_DIR)
+        mock_isfile.assert_called_once_with(_TOOLCHAIN_ENV_FILE)
     
     @patch('os.path.isdir')
     @patch('os.path.isfile')
@@ -205,14 +234,102 @@ class TestCrossEnvManager(unittest.TestCase):
         env_manager = CrossEnvManager(self.test_config)
         
         # Check for the toolchain
-        result = env_manager._check_toolchain('/tmp/toolchain')
+        result = env_manager._check_toolchain(_TOOLCHAIN_DIR)
         
         # Check that the toolchain was not found
         self.assertFalse(result)
         
         # Check that os.path.isdir and os.path.isfile were called with the correct arguments
-        mock_isdir.assert_called_once_with('/tmp/toolchain')
-        mock_isfile.assert_called_once_with('/tmp/toolchain/poky-2.1.3/environment-setup-armv7at2hf-neon-poky-linux-gnueabi')
+        mock_isdir.assert_called_once_with(_TOOLCHAIN_DIR)
+        mock_isfile.assert_called_once_with(_TOOLCHAIN_ENV_FILE)
+    
+    @patch('shutil.rmtree')
+    @patch('os.makedirs')
+    @patch('subprocess.Popen')
+    def test_install_toolchain_checksum_mismatch(self, mock_popen, mock_makedirs, mock_rmtree):
+        """
+        Test installing a toolchain whose archive does not match the checksum
+        """
+        # Mock curl streaming the archive into tar
+        curl_process = MagicMock()
+        curl_process.stdout = io.BytesIO(b'toolchain archive')
+        curl_process.wait.return_value = 0
+        tar_process = MagicMock()
+        tar_process.stdin = io.BytesIO()
+        tar_process.wait.return_value = 0
+        mock_popen.side_effect = [curl_process, tar_process]
+        
+        # Create a Cross-Compilation Environment Manager expecting another archive
+        direct_config = {'cross_compilation': dict(self.test_config['cross_compilation'], environment_type='direct')}
+        direct_config['cross_compilation']['direct'] = dict(direct_config['cross_compilation']['direct'], toolchain_sha256='0' * 64)
+        env_manager = CrossEnvManager(direct_config)
+        
+        # Install the toolchain
+        result = env_manager._install_toolchain(_TOOLCHAIN_DIR)
+        
+        # Check that the installation failed
+        self.assertFalse(result)
+        
+        # Check that the archive was streamed into tar without an intermediate file
+        self.assertEqual(mock_popen.call_args_list[1][0][0], ['tar', 'xzf', '-', '-C', _TOOLCHAIN_DIR])
+        
+        # Check that the extracted toolchain was removed
+        mock_rmtree.assert_called_once_with(_TOOLCHAIN_DIR, ignore_errors=True)
+    
+    def test_setup_env_vars(self):
+        """
+        Test loading the variables exported by the environment setup script
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # Create an environment setup script
+            env_setup_dir = os.path.join(temp_dir, 'toolchain', 'poky-2.1.3')
+            os.makedirs(env_setup_dir)
+            with open(os.path.join(env_setup_dir, 'environment-setup-armv7at2hf-neon-poky-linux-gnueabi'), 'w') as f:
+                f.write('# Poky environment\n')
+                f.write('export ARCH=arm\n')
+                f.write('export CC="arm-poky-linux-gnueabi-gcc -march=armv7-a"\n')
+                f.write('unset command_not_found_handle\n')
+            
+            with patch('src.cross_env.env_manager.ENV_CACHE_DIR', os.path.join(temp_dir, 'cache')):
+                # Set up the environment variables twice
+                env_manager = CrossEnvManager(self.test_config)
+                env_manager._setup_env_vars(os.path.join(temp_dir, 'toolchain'))
+                
+                with patch('src.cross_env.env_manager._parse_env_setup') as mock_parse:
+                    cached_env_manager = CrossEnvManager(self.test_config)
+                    cached_env_manager._setup_env_vars(os.path.join(temp_dir, 'toolchain'))
+                    
+                    # Check that the second call used the cached result
+                    mock_parse.assert_not_called()
+            
+            # Check that the exported variables were parsed without their quotes
+            expected = {'ARCH': 'arm', 'CC': 'arm-poky-linux-gnueabi-gcc -march=armv7-a'}
+            self.assertEqual(env_manager.env_vars, expected)
+            self.assertEqual(cached_env_manager.env_vars, expected)
+            self.assertEqual(env_manager._base_env['CC'], expected['CC'])
+    
+    @patch('subprocess.run')
+    def test_build_container_image(self, mock_run):
+        """
+        Test building the container image from a Dockerfile passed on standard input
+        """
+        # Mock a successful build
+        mock_run.return_value = MagicMock(returncode=0)
+        
+        # Create a Cross-Compilation Environment Manager
+        env_manager = CrossEnvManager(self.test_config)
+        env_manager.container_runtime = 'podman'
+        
+        # Build the image
+        result = env_manager._build_container_image('parabola-rm-builder-toolchain:test')
+        
+        # Check that the image was built
+        self.assertTrue(result)
+        
+        # Check that the Dockerfile was passed on standard input
+        build_cmd = mock_run.call_args[0][0]
+        self.assertEqual(build_cmd[:6], ['podman', 'build', '-t', 'parabola-rm-builder-toolchain:test', '-f', '-'])
+        self.assertIn(b'FROM test:latest AS fetcher', mock_run.call_args[1]['input'])
     
     def test_get_container_command(self):
         """
@@ -227,24 +344,193 @@ class TestCrossEnvManager(unittest.TestCase):
         container_command = env_manager._get_container_command(command, '/tmp/workdir')
         
         # Check that the container command is correct
-        self.assertEqual(container_command[0], 'docker')
-        self.assertEqual(container_command[1], 'run')
-        self.assertEqual(container_command[2], '--rm')
-        self.assertIn('--cpus', container_command)
-        self.assertIn('2', container_command)
-        self.assertIn('--memory', container_command)
-        self.assertIn('2g', container_command)
-        self.assertIn('-v', container_command)
-        self.assertIn('source:/workspaces/source', container_command)
-        self.assertIn('-v', container_command)
-        self.assertIn('output:/workspaces/output', container_command)
-        self.assertIn('-v', container_command)
-        self.assertIn('/tmp/workdir:/workspaces/cwd', container_command)
-        self.assertIn('-w', container_command)
-        self.assertIn('/workspaces/cwd', container_command)
-        self.assertIn('parabola-rm-builder-toolchain:test', container_command)
-        self.assertIn('-c', container_command)
-        self.assertIn('make -j2', container_command)
+        self.assertEqual(container_command[:3], ['docker', 'run', '--rm'])
+        
+        # Check that the options and arguments are present, listing any missing ones at once
+        expected = {
+            '--cpus', '2',
+            '--memory', '2g',
+            '-v', 'source:/workspaces/source',
+            'output:/workspaces/output',
+            '/tmp/workdir:/workspaces/cwd',
+            '-w', '/workspaces/cwd',
+            env_manager._get_container_image_name(),
+            '-c', 'make -j2'
+        }
+        self.assertEqual(expected - set(container_command), set())
+        
+        # Check that arguments are quoted for the shell in the container
+        container_command = env_manager._get_container_command(['dd', 'if=/tmp/u boot.imx'], None)
+        self.assertEqual(container_command[-2:], ['-c', "dd 'if=/tmp/u boot.imx'"])
+    
+    def test_get_container_command_duplicate_mount(self):
+        """
+        Test that the current directory replaces a configured mount with the same destination
+        """
+        # Create a Cross-Compilation Environment Manager mounting a directory at /workspaces/cwd
+        test_config = copy.deepcopy(TEST_CONFIG)
+        test_config['cross_compilation']['container']['volume_mounts'].append('/tmp/other:/workspaces/cwd')
+        env_manager = CrossEnvManager(test_config)
+        env_manager.container_runtime = 'docker'
+        
+        # Get a container command
+        container_command = env_manager._get_container_command(['make'], '/tmp/workdir')
+        
+        # Check that /workspaces/cwd is mounted only once, from the current directory
+        mounts = [container_command[i + 1] for i, arg in enumerate(container_command) if arg == '-v']
+        self.assertEqual(mounts, [
+            'source:/workspaces/source',
+            'output:/workspaces/output',
+            '/tmp/workdir:/workspaces/cwd',
+            f'{_REPO_ROOT}:{_REPO_ROOT}',
+            f'{self.git_cache_dir}:{self.git_cache_dir}',
+            '/tmp/cache:/tmp/cache'
+        ])
+    
+    def test_get_container_command_git_cache(self):
+        """
+        Test mounting the git mirrors at the same path as on the host
+        """
+        # Create a Cross-Compilation Environment Manager
+        env_manager = CrossEnvManager(self.test_config)
+        env_manager.container_runtime = 'docker'
+        
+        # Get a container command updating a mirror
+        mirror_dir = os.path.join(self.git_cache_dir, 'mirror')
+        container_command = env_manager._get_container_command(['git', '--git-dir', mirror_dir, 'fetch'])
+        
+        # Check that the git cache directory was created and mounted at its own path
+        self.assertTrue(os.path.isdir(self.git_cache_dir))
+        self.assertIn(f'{self.git_cache_dir}:{self.git_cache_dir}', container_command)
+    
+    def test_get_container_command_env(self):
+        """
+        Test passing environment variables to a container command
+        """
+        # Create a Cross-Compilation Environment Manager
+        env_manager = CrossEnvManager(self.test_config)
+        env_manager.container_runtime = 'docker'
+        
+        # Get a container command with environment variables
+        container_command = env_manager._get_container_command(
+            ['make'],
+            '/tmp/workdir',
+            {'ARCH': 'arm', 'CCACHE_DIR': '/tmp/cache'}
+        )
+        
+        # Check that the environment variables are passed to the container
+        self.assertIn('ARCH=arm', container_command)
+        self.assertIn('CCACHE_DIR=/tmp/cache', container_command)
+        self.assertEqual(container_command[container_command.index('ARCH=arm') - 1], '-e')
+        
+        # Check that the image name comes after the options
+        self.assertLess(
+            container_command.index('CCACHE_DIR=/tmp/cache'),
+            container_command.index(env_manager._get_container_image_name())
+        )
+    
+    @patch('subprocess.run')
+    def test_session(self, mock_run):
+        """
+        Test running commands in a long-lived session container
+        """
+        # Mock the container runtime starting the session container
+        mock_run.return_value = MagicMock(returncode=0, stdout=b'abc123\n')
+        
+        # Create a Cross-Compilation Environment Manager
+        env_manager = CrossEnvManager(self.test_config)
+        env_manager.container_runtime = 'docker'
+        
+        with env_manager.session():
+            # Check that the session container was started
+            start_command = mock_run.call_args[0][0]
+            self.assertEqual(start_command[:4], ['docker', 'run', '-d', '--rm'])
+            self.assertEqual(start_command[-3:], [env_manager._get_container_image_name(), '-c', 'sleep infinity'])
+            self.assertIn(f'{self.git_cache_dir}:{self.git_cache_dir}', start_command)
+            
+            # Check that commands in the repository are executed in the session container
+            cwd = os.path.dirname(os.path.abspath(__file__))
+            container_command = env_manager._get_container_command(['make'], cwd)
+            self.assertEqual(container_command, ['docker', 'exec', '-w', cwd, 'abc123', 'make'])
+            
+            # Check that commands in the git cache directory are executed there as well
+            container_command = env_manager._get_container_command(['git', 'fetch'], self.git_cache_dir)
+            self.assertEqual(container_command, ['docker', 'exec', '-w', self.git_cache_dir, 'abc123', 'git', 'fetch'])
+            
+            # Check that commands outside the repository still get a container of their own
+            container_command = env_manager._get_container_command(['make'], '/tmp/elsewhere')
+            self.assertEqual(container_command[:3], ['docker', 'run', '--rm'])
+        
+        # Check that the session container was removed
+        mock_run.assert_called_with(['docker', 'rm', '-f', 'abc123'], stdout=ANY, stderr=ANY, check=False)
+        self.assertIsNone(env_manager._session_container)
+    
+    def test_run_command_input(self):
+        """
+        Test passing standard input to a command
+        """
+        # Create a Cross-Compilation Environment Manager running commands directly
+        direct_config = {'cross_compilation': dict(self.test_config['cross_compilation'], environment_type='direct')}
+        env_manager = CrossEnvManager(direct_config)
+        
+        # Run a command that echoes its standard input
+        returncode, stdout, stderr = env_manager.run_command(['cat'], input='label: dos\n')
+        
+        # Check that the input was passed to the command
+        self.assertEqual(returncode, 0)
+        self.assertEqual(stdout, 'label: dos\n')
+        
+        # Check that container commands keep standard input open
+        env_manager = CrossEnvManager(self.test_config)
+        env_manager.container_runtime = 'docker'
+        container_command = env_manager._get_container_command(['sfdisk'], None, None, True)
+        self.assertEqual(container_command[:4], ['docker', 'run', '--rm', '-i'])
+    
+    @patch('src.cross_env.env_manager.OUTPUT_TAIL_LINES', 3)
+    def test_run_command_output_tail(self):
+        """
+        Test keeping only the tail of the output of a command
+        """
+        # Create a Cross-Compilation Environment Manager running commands directly
+        direct_config = {'cross_compilation': dict(self.test_config['cross_compilation'], environment_type='direct')}
+        env_manager = CrossEnvManager(direct_config)
+        
+        # Run a command printing more lines than are kept
+        returncode, stdout, stderr = env_manager.run_command(['seq', '10'])
+        
+        # Check that only the last lines were returned
+        self.assertEqual(returncode, 0)
+        self.assertEqual(stdout, '8\n9\n10\n')
+        self.assertEqual(stderr, '')
+    
+    @patch('src.cross_env.env_manager.OUTPUT_TAIL_LINES', 3)
+    @patch('src.cross_env.env_manager.CrossEnvManager.get_build_command', side_effect=lambda command, *args: command)
+    def test_run_batch(self, mock_get_build_command):
+        """
+        Test running a sequence of commands in a single container
+        """
+        # Create a Cross-Compilation Environment Manager, running the container command on the host
+        env_manager = CrossEnvManager(self.test_config)
+        
+        # Run a batch that fails in its last step, after more output than is kept
+        returncode, step, stderr = env_manager.run_batch([
+            ('print', ['echo', 'u boot']),
+            ('count', ['seq', '10']),
+            ('write', ['sh', '-c', 'seq 5; echo No space left on device >&2; exit 1'])
+        ])
+        
+        # Check that the commands were joined into a single invocation
+        self.assertEqual(mock_get_build_command.call_args[0][0], [
+            '/bin/bash', '-c',
+            "echo '::step print' && echo 'u boot' && "
+            "echo '::step count' && seq 10 && "
+            "echo '::step write' && sh -c 'seq 5; echo No space left on device >&2; exit 1'"
+        ])
+        
+        # Check that the failing step was reported, although its marker is not in the tail
+        self.assertEqual(returncode, 1)
+        self.assertEqual(step, 'write')
+        self.assertEqual(stderr, 'No space left on device\n')
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the Desktop Environment Configurator
+"""
+
+import os
+import unittest
+import tempfile
+from unittest.mock import MagicMock
+
+from src.installers.desktop.desktop_configurator import DesktopConfigurator, CONFIG_STAMP_PATH
+
+class TestDesktopConfigurator(unittest.TestCase):
+    """
+    Tests for the Desktop Environment Configurator
+    """
+    
+    def setUp(self):
+        """
+        Set up the test
+        """
+        # Create a test configuration
+        self.test_config = {
+            'desktop': {
+                'environment': 'xfce',
+                'ui': {
+                    'theme': 'High Contrast'
+                }
+            }
+        }
+        
+        # Create a mock environment manager
+        self.mock_env_manager = MagicMock()
+        self.mock_env_manager.run_command.return_value = (0, '', '')
+        
+        # Create a temporary root filesystem
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.mount_point = self.temp_dir.name
+        os.makedirs(os.path.join(self.mount_point, 'usr', 'sbin'))
+    
+    def tearDown(self):
+        """
+        Clean up after the test
+        """
+        self.temp_dir.cleanup()
+    
+    def test_install_unchanged_config(self):
+        """
+        Test that reinstalling with an unchanged configuration is skipped
+        """
+        # Install and configure the battery monitor twice
+        for _ in range(2):
+            configurator = DesktopConfigurator(self.test_config, self.mock_env_manager)
+            self.assertTrue(configurator.install(self.mount_point))
+            self.assertTrue(configurator.configure_battery_monitor(self.mount_point))
+        
+        # Check that the packages were only installed once
+        self.mock_env_manager.run_command.assert_called_once()
+        self.assertTrue(os.path.isfile(os.path.join(self.mount_point, CONFIG_STAMP_PATH)))
+        
+        # Check that the battery monitor was only added to the panel once
+        with open(os.path.join(self.mount_point, 'root', 'configure-xfce.sh'), 'r') as f:
+            self.assertEqual(f.read().count('xfce4-panel --add=genmon'), 1)
+        
+        # Check that a changed configuration is installed again
+        self.test_config['desktop']['ui']['theme'] = 'Adwaita'
+        configurator = DesktopConfigurator(self.test_config, self.mock_env_manager)
+        self.assertTrue(configurator.install(self.mount_point))
+        self.assertEqual(self.mock_env_manager.run_command.call_count, 2)
+        
+        with open(os.path.join(self.mount_point, 'root', 'configure-xfce.sh'), 'r') as f:
+            self.assertIn("-s Adwaita\n", f.read())
+    
+    def test_configure_battery_monitor(self):
+        """
+        Test adding the battery monitor to the panel only once it is installed
+        """
+        configurator = DesktopConfigurator(self.test_config, self.mock_env_manager)
+        self.assertTrue(configurator.install(self.mount_point))
+        
+        xfce_config_path = os.path.join(self.mount_point, 'root', 'configure-xfce.sh')
+        with open(xfce_config_path, 'r') as f:
+            self.assertNotIn('genmon', f.read())
+        
+        self.assertTrue(configurator.configure_battery_monitor(self.mount_point))
+        
+        # Check that the panel entry is only added on logins where no plugin runs the monitor yet
+        with open(xfce_config_path, 'r') as f:
+            self.assertIn(
+                "if ! xfconf-query -c xfce4-panel -l -v | grep -q /usr/sbin/battery-monitor.sh; then\n"
+                "    xfce4-panel --add=genmon\n",
+                f.read()
+            )
+    
+    def test_configure_battery_monitor_failure(self):
+        """
+        Test leaving the panel alone when the battery monitor cannot be installed
+        """
+        configurator = DesktopConfigurator(self.test_config, self.mock_env_manager)
+        self.assertTrue(configurator.install(self.mount_point))
+        
+        os.rmdir(os.path.join(self.mount_point, 'usr', 'sbin'))
+        self.assertFalse(configurator.configure_battery_monitor(self.mount_point))
+        
+        with open(os.path.join(self.mount_point, 'root', 'configure-xfce.sh'), 'r') as f:
+            self.assertNotIn('battery-monitor.sh', f.read())
+
+if __name__ == '__main__':
+    unittest.main()
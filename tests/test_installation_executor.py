@@ -5,76 +5,138 @@
 Tests for the Installation Executor
 """
 
-import os
-import sys
 import unittest
-import tempfile
-import yaml
-from unittest.mock import patch, MagicMock
-
-# Add the parent directory to the path
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from unittest.mock import patch, create_autospec, DEFAULT
 
+from src.config_manager.config_manager import ConfigManager
+from src.cross_env.env_manager import CrossEnvManager
+from src.builders.bootloader.uboot_builder import UBootBuilder
+from src.builders.kernel.kernel_builder import KernelBuilder
+from src.builders.orchestrator import BuildOrchestrator
+from src.builders.partition.partition_manager import PartitionManager
+from src.installers.system.system_installer import SystemInstaller
+from src.installers.desktop.desktop_configurator import DesktopConfigurator
 from src.executor.installation_executor import InstallationExecutor
 
+# Test configuration, shared by the tests as none of them modifies it
+TEST_CONFIG = {
+    'cross_compilation': {
+        'environment_type': 'container',
+        'toolchain_version': 'test',
+        'container': {
+            'base_image': 'test:latest'
+        }
+    },
+    'hardware': {
+        'tablet_model': 'rm1'
+    },
+    'partition': {
+        'layout': {
+            'fat_size': 20,
+            'system_size': 2,
+            'home_size': 0
+        }
+    }
+}
+
 class TestInstallationExecutor(unittest.TestCase):
     """
     Tests for the Installation Executor
     """
     
+    @classmethod
+    def setUpClass(cls):
+        """
+        Set up the tests
+        """
+        # Patch the classes the executor creates its components from, once for all tests
+        cls.patcher = patch.multiple(
+            'src.executor.installation_executor',
+            UBootBuilder=DEFAULT,
+            KernelBuilder=DEFAULT,
+            BuildOrchestrator=DEFAULT,
+            PartitionManager=DEFAULT,
+            SystemInstaller=DEFAULT,
+            DesktopConfigurator=DEFAULT
+        )
+        cls.mock_classes = cls.patcher.start()
+        
+        # Create mock objects following the interfaces of the real classes, reset by each test
+        cls.mock_config_manager = create_autospec(ConfigManager, instance=True)
+        cls.mock_env_manager = create_autospec(CrossEnvManager, instance=True)
+        
+        cls.mock_bootloader_builder = create_autospec(UBootBuilder, instance=True)
+        cls.mock_kernel_builder = create_autospec(KernelBuilder, instance=True)
+        cls.mock_build_orchestrator = create_autospec(BuildOrchestrator, instance=True)
+        cls.mock_partition_manager = create_autospec(PartitionManager, instance=True)
+        cls.mock_system_installer = create_autospec(SystemInstaller, instance=True)
+        cls.mock_desktop_configurator = create_autospec(DesktopConfigurator, instance=True)
+        
+        cls.mock_instances = (
+            cls.mock_config_manager,
+            cls.mock_env_manager,
+            cls.mock_bootloader_builder,
+            cls.mock_kernel_builder,
+            cls.mock_build_orchestrator,
+            cls.mock_partition_manager,
+            cls.mock_system_installer,
+            cls.mock_desktop_configurator
+        )
+        
+        cls.mock_classes['UBootBuilder'].return_value = cls.mock_bootloader_builder
+        cls.mock_classes['KernelBuilder'].return_value = cls.mock_kernel_builder
+        cls.mock_classes['BuildOrchestrator'].return_value = cls.mock_build_orchestrator
+        cls.mock_classes['PartitionManager'].return_value = cls.mock_partition_manager
+        cls.mock_classes['SystemInstaller'].return_value = cls.mock_system_installer
+        cls.mock_classes['DesktopConfigurator'].return_value = cls.mock_desktop_configurator
+    
+    @classmethod
+    def tearDownClass(cls):
+        """
+        Clean up after the tests
+        """
+        # Restore the patched classes
+        cls.patcher.stop()
+    
     def setUp(self):
         """
         Set up the test
         """
-        # Create a test configuration
-        self.test_config = {
-            'cross_compilation': {
-                'environment_type': 'container',
-                'toolchain_version': 'test',
-                'container': {
-                    'base_image': 'test:latest'
-                }
-            },
-            'hardware': {
-                'tablet_model': 'rm1'
-            },
-            'partition': {
-                'layout': {
-                    'fat_size': 20,
-                    'system_size': 2,
-                    'home_size': 0
-                }
-            }
-        }
+        # Share the test configuration, which the executor does not change
+        self.test_config = TEST_CONFIG
+        
+        # Forget the calls and the results configured by previous tests
+        for mock_class in self.mock_classes.values():
+            mock_class.reset_mock()
+        
+        for mock_instance in self.mock_instances:
+            mock_instance.reset_mock(return_value=True, side_effect=True)
         
-        # Create mock objects
-        self.mock_config_manager = MagicMock()
         self.mock_config_manager.get_config.return_value = self.test_config
+    
+    def _make_executor(self):
+        """
+        Create an Installation Executor holding the mock components, without running its constructor
         
-        self.mock_env_manager = MagicMock()
+        Returns:
+            Installation Executor
+        """
+        executor = InstallationExecutor.__new__(InstallationExecutor)
+        executor.config_manager = self.mock_config_manager
+        executor.env_manager = self.mock_env_manager
+        executor.config = self.test_config
+        executor.bootloader_builder = self.mock_bootloader_builder
+        executor.kernel_builder = self.mock_kernel_builder
+        executor.partition_manager = self.mock_partition_manager
+        executor.system_installer = self.mock_system_installer
+        executor.desktop_configurator = self.mock_desktop_configurator
         
-        self.mock_bootloader_builder = MagicMock()
-        self.mock_kernel_builder = MagicMock()
-        self.mock_partition_manager = MagicMock()
-        self.mock_system_installer = MagicMock()
-        self.mock_desktop_configurator = MagicMock()
+        return executor
     
-    @patch('src.executor.installation_executor.UBootBuilder')
-    @patch('src.executor.installation_executor.KernelBuilder')
-    @patch('src.executor.installation_executor.PartitionManager')
-    @patch('src.executor.installation_executor.SystemInstaller')
-    @patch('src.executor.installation_executor.DesktopConfigurator')
-    def test_init(self, mock_desktop_configurator, mock_system_installer, mock_partition_manager, mock_kernel_builder, mock_bootloader_builder):
+    def test_init(self):
         """
         Test initialization of the Installation Executor
         """
-        # Set up the mock objects
-        mock_bootloader_builder.return_value = self.mock_bootloader_builder
-        mock_kernel_builder.return_value = self.mock_kernel_builder
-        mock_partition_manager.return_value = self.mock_partition_manager
-        mock_system_installer.return_value = self.mock_system_installer
-        mock_desktop_configurator.return_value = self.mock_desktop_configurator
-        
         # Create an Installation Executor
         executor = InstallationExecutor(self.mock_config_manager, self.mock_env_manager)
         
@@ -84,34 +146,21 @@ class TestInstallationExecutor(unittest.TestCase):
         self.assertEqual(executor.config, self.test_config)
         
         # Check that the builders and installers were created correctly
-        mock_bootloader_builder.assert_called_once_with(self.test_config, self.mock_env_manager)
-        mock_kernel_builder.assert_called_once_with(self.test_config, self.mock_env_manager)
-        mock_partition_manager.assert_called_once_with(self.test_config, self.mock_env_manager)
-        mock_system_installer.assert_called_once_with(self.test_config, self.mock_env_manager)
-        mock_desktop_configurator.assert_called_once_with(self.test_config, self.mock_env_manager)
+        self.mock_classes['UBootBuilder'].assert_called_once_with(self.test_config, self.mock_env_manager)
+        self.mock_classes['KernelBuilder'].assert_called_once_with(self.test_config, self.mock_env_manager)
+        self.mock_classes['PartitionManager'].assert_called_once_with(self.test_config, self.mock_env_manager)
+        self.mock_classes['SystemInstaller'].assert_called_once_with(self.test_config, self.mock_env_manager)
+        self.mock_classes['DesktopConfigurator'].assert_called_once_with(self.test_config, self.mock_env_manager)
     
-    @patch('src.executor.installation_executor.UBootBuilder')
-    @patch('src.executor.installation_executor.KernelBuilder')
-    @patch('src.executor.installation_executor.PartitionManager')
-    @patch('src.executor.installation_executor.SystemInstaller')
-    @patch('src.executor.installation_executor.DesktopConfigurator')
-    def test_build_components(self, mock_desktop_configurator, mock_system_installer, mock_partition_manager, mock_kernel_builder, mock_bootloader_builder):
+    def test_build_components(self):
         """
         Test building components
         """
-        # Set up the mock objects
-        mock_bootloader_builder.return_value = self.mock_bootloader_builder
-        mock_kernel_builder.return_value = self.mock_kernel_builder
-        mock_partition_manager.return_value = self.mock_partition_manager
-        mock_system_installer.return_value = self.mock_system_installer
-        mock_desktop_configurator.return_value = self.mock_desktop_configurator
-        
-        # Set up the mock builders
-        self.mock_bootloader_builder.build.return_value = True
-        self.mock_kernel_builder.build.return_value = True
+        # Set up the mock build orchestrator
+        self.mock_build_orchestrator.build.return_value = True
         
-        # Create an Installation Executor
-        executor = InstallationExecutor(self.mock_config_manager, self.mock_env_manager)
+        # Create an Installation Executor for the step
+        executor = self._make_executor()
         
         # Build the components
         result = executor._build_components()
@@ -119,66 +168,43 @@ class TestInstallationExecutor(unittest.TestCase):
         # Check that the function returned success
         self.assertTrue(result)
         
-        # Check that the builders were called
-        self.mock_bootloader_builder.build.assert_called_once()
-        self.mock_kernel_builder.build.assert_called_once()
+        # Check that both builders were handed to the orchestrator, with the unchanged configuration
+        self.mock_classes['BuildOrchestrator'].assert_called_once_with(self.test_config, self.mock_env_manager)
+        self.mock_build_orchestrator.build.assert_called_once_with(
+            [self.mock_classes['UBootBuilder'], self.mock_classes['KernelBuilder']]
+        )
+        
+        # Check that the builders of the executor were left alone
+        self.mock_bootloader_builder.build.assert_not_called()
+        self.mock_kernel_builder.build.assert_not_called()
     
-    @patch('src.executor.installation_executor.UBootBuilder')
-    @patch('src.executor.installation_executor.KernelBuilder')
-    @patch('src.executor.installation_executor.PartitionManager')
-    @patch('src.executor.installation_executor.SystemInstaller')
-    @patch('src.executor.installation_executor.DesktopConfigurator')
-    def test_build_components_bootloader_failure(self, mock_desktop_configurator, mock_system_installer, mock_partition_manager, mock_kernel_builder, mock_bootloader_builder):
+    def test_build_components_failure(self):
         """
-        Test building components with bootloader failure
+        Test building components with a failing build
         """
-        # Set up the mock objects
-        mock_bootloader_builder.return_value = self.mock_bootloader_builder
-        mock_kernel_builder.return_value = self.mock_kernel_builder
-        mock_partition_manager.return_value = self.mock_partition_manager
-        mock_system_installer.return_value = self.mock_system_installer
-        mock_desktop_configurator.return_value = self.mock_desktop_configurator
+        # Set up the mock build orchestrator
+        self.mock_build_orchestrator.build.return_value = False
         
-        # Set up the mock builders
-        self.mock_bootloader_builder.build.return_value = False
-        
-        # Create an Installation Executor
-        executor = InstallationExecutor(self.mock_config_manager, self.mock_env_manager)
+        # Create an Installation Executor for the step
+        executor = self._make_executor()
         
         # Build the components
         result = executor._build_components()
         
         # Check that the function returned failure
         self.assertFalse(result)
-        
-        # Check that the bootloader builder was called
-        self.mock_bootloader_builder.build.assert_called_once()
-        
-        # Check that the kernel builder was not called
-        self.mock_kernel_builder.build.assert_not_called()
     
-    @patch('src.executor.installation_executor.UBootBuilder')
-    @patch('src.executor.installation_executor.KernelBuilder')
-    @patch('src.executor.installation_executor.PartitionManager')
-    @patch('src.executor.installation_executor.SystemInstaller')
-    @patch('src.executor.installation_executor.DesktopConfigurator')
-    def test_partition_and_format(self, mock_desktop_configurator, mock_system_installer, mock_partition_manager, mock_kernel_builder, mock_bootloader_builder):
+    def test_partition_and_format(self):
         """
         Test partitioning and formatting
         """
-        # Set up the mock objects
-        mock_bootloader_builder.return_value = self.mock_bootloader_builder
-        mock_kernel_builder.return_value = self.mock_kernel_builder
-        mock_partition_manager.return_value = self.mock_partition_manager
-        mock_system_installer.return_value = self.mock_system_installer
-        mock_desktop_configurator.return_value = self.mock_desktop_configurator
-        
         # Set up the mock partition manager
         self.mock_partition_manager.partition_device.return_value = True
+        self.mock_partition_manager.wait_for_partitions.return_value = True
         self.mock_partition_manager.format_partitions.return_value = True
         
-        # Create an Installation Executor
-        executor = InstallationExecutor(self.mock_config_manager, self.mock_env_manager)
+        # Create an Installation Executor for the step
+        executor = self._make_executor()
         
         # Partition and format
         result = executor._partition_and_format('/dev/mmcblk1')
@@ -188,28 +214,38 @@ class TestInstallationExecutor(unittest.TestCase):
         
         # Check that the partition manager was called
         self.mock_partition_manager.partition_device.assert_called_once_with('/dev/mmcblk1')
+        self.mock_partition_manager.wait_for_partitions.assert_called_once_with('/dev/mmcblk1')
         self.mock_partition_manager.format_partitions.assert_called_once_with('/dev/mmcblk1')
     
-    @patch('src.executor.installation_executor.UBootBuilder')
-    @patch('src.executor.installation_executor.KernelBuilder')
-    @patch('src.executor.installation_executor.PartitionManager')
-    @patch('src.executor.installation_executor.SystemInstaller')
-    @patch('src.executor.installation_executor.DesktopConfigurator')
-    @patch('src.executor.installation_executor.time.sleep')
-    def test_execute(self, mock_sleep, mock_desktop_configurator, mock_system_installer, mock_partition_manager, mock_kernel_builder, mock_bootloader_builder):
+    def test_partition_and_format_bootloader_failure(self):
         """
-        Test executing the installation
+        Test formatting while the bootloader installation fails
         """
-        # Set up the mock objects
-        mock_bootloader_builder.return_value = self.mock_bootloader_builder
-        mock_kernel_builder.return_value = self.mock_kernel_builder
-        mock_partition_manager.return_value = self.mock_partition_manager
-        mock_system_installer.return_value = self.mock_system_installer
-        mock_desktop_configurator.return_value = self.mock_desktop_configurator
+        # Set up the mock partition manager
+        self.mock_bootloader_builder.get_output_path.return_value = '/tmp/u-boot.imx'
+        self.mock_partition_manager.partition_device.return_value = True
+        self.mock_partition_manager.format_partitions.return_value = True
+        self.mock_partition_manager.install_bootloader.return_value = False
         
+        # Create an Installation Executor for the step
+        executor = self._make_executor()
+        
+        # Partition and format while installing the bootloader
+        result = executor._partition_and_format('/dev/mmcblk1', install_bootloader=True)
+        
+        # Check that the function returned failure
+        self.assertFalse(result)
+        
+        # Check that formatting and the bootloader installation both ran
+        self.mock_partition_manager.format_partitions.assert_called_once_with('/dev/mmcblk1')
+        self.mock_partition_manager.install_bootloader.assert_called_once_with('/dev/mmcblk1', '/tmp/u-boot.imx')
+    
+    def test_execute(self):
+        """
+        Test executing the installation
+        """
         # Set up the mock builders and installers
-        self.mock_bootloader_builder.build.return_value = True
-        self.mock_kernel_builder.build.return_value = True
+        self.mock_build_orchestrator.build.return_value = True
         self.mock_bootloader_builder.get_output_path.return_value = '/tmp/u-boot.imx'
         self.mock_kernel_builder.get_output_paths.return_value = {
             'zImage': '/tmp/zImage',
@@ -234,8 +270,7 @@ class TestInstallationExecutor(unittest.TestCase):
         self.assertTrue(result)
         
         # Check that the builders and installers were called
-        self.mock_bootloader_builder.build.assert_called_once()
-        self.mock_kernel_builder.build.assert_called_once()
+        self.mock_build_orchestrator.build.assert_called_once()
         self.mock_partition_manager.partition_device.assert_called_once_with('/dev/mmcblk1')
         self.mock_partition_manager.format_partitions.assert_called_once_with('/dev/mmcblk1')
         self.mock_partition_manager.install_bootloader.assert_called_once_with('/dev/mmcblk1', '/tmp/u-boot.imx')
@@ -243,6 +278,26 @@ class TestInstallationExecutor(unittest.TestCase):
         self.mock_system_installer.install.assert_called_once()
         self.mock_desktop_configurator.install.assert_called_once()
         self.mock_partition_manager.unmount_partitions.assert_called_once()
+    
+    def test_execute_build_failure(self):
+        """
+        Test that a failed build leaves the device untouched
+        """
+        # Set up the mock build orchestrator, with a build failing
+        self.mock_build_orchestrator.build.return_value = False
+        
+        # Create an Installation Executor
+        executor = InstallationExecutor(self.mock_config_manager, self.mock_env_manager)
+        
+        # Execute the installation
+        result = executor.execute('/dev/mmcblk1', False)
+        
+        # Check that the function returned failure
+        self.assertFalse(result)
+        
+        # Check that the device was not partitioned
+        self.mock_partition_manager.partition_device.assert_not_called()
+        self.mock_partition_manager.format_partitions.assert_not_called()
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
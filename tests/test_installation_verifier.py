@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the Installation Verifier
+"""
+
+import unittest
+from unittest.mock import MagicMock
+
+from src.verification.installation_verifier import InstallationVerifier
+
+class TestInstallationVerifier(unittest.TestCase):
+    """
+    Tests for the Installation Verifier
+    """
+    
+    def setUp(self):
+        """
+        Set up the test
+        """
+        # Create a mock environment manager running commands in a container,
+        # where ls finds every device and mounting succeeds
+        self.mock_env_manager = MagicMock()
+        self.mock_env_manager.is_local.return_value = False
+        self.mock_env_manager.run_command.side_effect = lambda command, cwd=None: (
+            0, '\n'.join(command[2:]) + '\n' if command[0] == 'ls' else '', ''
+        )
+        
+        # Create the verifier, with the system check failing
+        self.verifier = InstallationVerifier({}, self.mock_env_manager)
+        self.verifier._verify_system = MagicMock(return_value=False)
+        self.verifier._verify_desktop = MagicMock(return_value=True)
+    
+    def test_generate_report_after_verify(self):
+        """
+        Test that generating a report reuses the results of a verification
+        """
+        self.assertFalse(self.verifier.verify('/dev/mmcblk1'))
+        
+        # Check that the devices were checked with a single command
+        ls_calls = [c for c in self.mock_env_manager.run_command.call_args_list if c.args[0][0] == 'ls']
+        self.assertEqual(len(ls_calls), 1)
+        
+        # Check that only the checks skipped by the verification are run
+        report = self.verifier.generate_report('/dev/mmcblk1')
+        
+        self.assertFalse(report['success'])
+        self.assertTrue(report['bootloader']['verified'])
+        self.assertTrue(report['partitions']['verified'])
+        self.assertFalse(report['system']['verified'])
+        self.assertTrue(report['desktop']['verified'])
+        self.verifier._verify_system.assert_called_once()
+        self.verifier._verify_desktop.assert_called_once()
+        
+        # Check that a complete report does not mount the partitions again
+        call_count = self.mock_env_manager.run_command.call_count
+        self.verifier.generate_report('/dev/mmcblk1')
+        self.assertEqual(self.mock_env_manager.run_command.call_count, call_count)
+        
+        # Check that the checks are run again after invalidating the results
+        self.verifier.invalidate()
+        self.verifier.verify('/dev/mmcblk1')
+        self.assertEqual(self.verifier._verify_system.call_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the Linux Kernel Builder
+"""
+
+import os
+import unittest
+import tempfile
+from unittest.mock import MagicMock
+
+from src.builders.kernel.kernel_builder import KernelBuilder
+
+# Configuration of the kernel, and the defconfig it is applied to
+TEST_CONFIG = {
+    'kernel': {
+        'drivers': {
+            'usb': {
+                'enable_acm': False
+            }
+        },
+        'hardware_support': {
+            'wifi_support': True
+        }
+    }
+}
+
+TEST_DEFCONFIG = """\
+CONFIG_LOCALVERSION="-rm"
+CONFIG_PM=n
+CONFIG_PM_SLEEP=y
+# CONFIG_BRCMFMAC is not set
+CONFIG_USB_ACM=y
+"""
+
+class TestKernelBuilder(unittest.TestCase):
+    """
+    Tests for the Linux Kernel Builder
+    """
+    
+    def setUp(self):
+        """
+        Set up the test
+        """
+        # Create a kernel tree holding the test defconfig
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        
+        self.config_file = os.path.join(self.temp_dir.name, 'arch', 'arm', 'configs', 'zero-gravitas_defconfig')
+        os.makedirs(os.path.dirname(self.config_file))
+        
+        with open(self.config_file, 'w') as f:
+            f.write(TEST_DEFCONFIG)
+        
+        self.builder = KernelBuilder(TEST_CONFIG, MagicMock())
+    
+    def test_modify_kernel_config(self):
+        """
+        Test setting the configured options in the defconfig
+        """
+        self.builder._modify_kernel_config(self.temp_dir.name)
+        
+        # Check that assignments are rewritten in place, other lines are kept, and
+        # missing options are appended, after a "not set" comment for the same option
+        with open(self.config_file) as f:
+            self.assertEqual(f.read(), """\
+CONFIG_LOCALVERSION="-rm"
+CONFIG_PM=y
+CONFIG_PM_SLEEP=y
+# CONFIG_BRCMFMAC is not set
+CONFIG_USB_ACM=n
+CONFIG_FB_MXC_EINK_AUTO_UPDATE_MODE=y
+CONFIG_USB_F_ACM=n
+CONFIG_USB_U_SERIAL=y
+CONFIG_USB_CDC_COMPOSITE=y
+CONFIG_BRCMFMAC=m
+""")
+    
+    def test_modify_kernel_config_unchanged(self):
+        """
+        Test leaving an up to date defconfig untouched
+        """
+        self.builder._modify_kernel_config(self.temp_dir.name)
+        os.utime(self.config_file, ns=(0, 0))
+        
+        # Check that applying the same options again does not write the file
+        self.builder._modify_kernel_config(self.temp_dir.name)
+        self.assertEqual(os.stat(self.config_file).st_mtime_ns, 0)
+
+if __name__ == '__main__':
+    unittest.main()
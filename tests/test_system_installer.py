@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the System Installer
+"""
+
+import io
+import os
+import gzip
+import json
+import tarfile
+import unittest
+import tempfile
+import urllib.error
+from unittest.mock import patch, MagicMock
+
+from src.installers.system.system_installer import SystemInstaller, ROOTFS_MARKER_PATH
+
+def _make_rootfs() -> bytes:
+    """
+    Create a gzipped rootfs archive holding a small and an incompressible file
+    
+    Returns:
+        Content of the archive
+    """
+    files = {'etc/hostname': b'parabola\n', 'usr/lib/firmware.bin': os.urandom(512 * 1024)}
+    stream = io.BytesIO()
+    
+    with tarfile.open(fileobj=stream, mode='w') as tar:
+        for name, data in files.items():
+            member = tarfile.TarInfo(name)
+            member.size = len(data)
+            tar.addfile(member, io.BytesIO(data))
+    
+    return gzip.compress(stream.getvalue())
+
+# Rootfs archive served by the tests, and the version the server reports for it
+ROOTFS = _make_rootfs()
+ROOTFS_ETAG = '"rootfs-1"'
+
+class _Response(io.BytesIO):
+    """
+    Response of urlopen serving part of the rootfs archive
+    """
+    
+    def __init__(self, data: bytes, status: int = 200, content_length: int = None):
+        """
+        Initialize the response
+        
+        Args:
+            data: Body of the response
+            status: HTTP status of the response
+            content_length: Content-Length header, the length of the body by default
+        """
+        super().__init__(data)
+        self.status = status
+        self.headers = {
+            'Content-Length': str(len(data) if content_length is None else content_length),
+            'ETag': ROOTFS_ETAG
+        }
+
+class TestSystemInstaller(unittest.TestCase):
+    """
+    Tests for the System Installer
+    """
+    
+    def setUp(self):
+        """
+        Set up the test
+        """
+        # Create a System Installer downloading to a temporary build directory
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        
+        self.installer = SystemInstaller({}, MagicMock())
+        self.installer.build_dir = os.path.join(self.temp_dir.name, 'build')
+        os.makedirs(self.installer.build_dir)
+        
+        self.mount_point = os.path.join(self.temp_dir.name, 'mnt')
+        os.makedirs(self.mount_point)
+        
+        self.rootfs_path = os.path.join(self.installer.build_dir, 'parabola-rootfs.tar.gz')
+        self.partial_path = self.rootfs_path + '.part'
+        self.meta_path = os.path.join(self.installer.build_dir, 'parabola-rootfs.meta.json')
+        
+        # Patch the download of the rootfs
+        patcher = patch('urllib.request.urlopen')
+        self.mock_urlopen = patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def _get_request_headers(self, index: int = 0) -> dict:
+        """
+        Get the headers of a rootfs request
+        
+        Args:
+            index: Index of the request
+        
+        Returns:
+            Dictionary of header names to values
+        """
+        return dict(self.mock_urlopen.call_args_list[index].args[0].header_items())
+    
+    def _check_installed(self):
+        """
+        Check that the rootfs was extracted and cached completely
+        """
+        with open(os.path.join(self.mount_point, 'etc', 'hostname'), 'rb') as f:
+            self.assertEqual(f.read(), b'parabola\n')
+        
+        with open(self.rootfs_path, 'rb') as f:
+            self.assertEqual(f.read(), ROOTFS)
+        
+        self.assertFalse(os.path.exists(self.partial_path))
+    
+    def test_install_rootfs_download(self):
+        """
+        Test downloading and extracting the rootfs in one pass
+        """
+        self.mock_urlopen.return_value = _Response(ROOTFS)
+        
+        self.assertTrue(self.installer._install_rootfs(self.mount_point))
+        self._check_installed()
+        
+        # Check that the whole archive was requested
+        self.assertNotIn('Range', self._get_request_headers())
+        
+        # Check that the extracted version was recorded on the partition
+        with open(os.path.join(self.mount_point, ROOTFS_MARKER_PATH)) as f:
+            self.assertEqual(json.load(f)['etag'], ROOTFS_ETAG)
+    
+    def test_install_rootfs_resume(self):
+        """
+        Test resuming an interrupted download
+        """
+        # Leave half of the archive from an interrupted download of the same version
+        with open(self.partial_path, 'wb') as f:
+            f.write(ROOTFS[:len(ROOTFS) // 2])
+        with open(self.meta_path, 'w') as f:
+            json.dump({'etag': ROOTFS_ETAG, 'last_modified': None}, f)
+        
+        self.mock_urlopen.return_value = _Response(ROOTFS[len(ROOTFS) // 2:], status=206)
+        
+        self.assertTrue(self.installer._install_rootfs(self.mount_point))
+        self._check_installed()
+        
+        # Check that only the rest of the archive was requested, if it did not change
+        headers = self._get_request_headers()
+        self.assertEqual(headers['Range'], 'bytes=%d-' % (len(ROOTFS) // 2))
+        self.assertEqual(headers['If-range'], ROOTFS_ETAG)
+    
+    def test_install_rootfs_resume_without_tar(self):
+        """
+        Test resuming an interrupted download, extracting it with tarfile
+        """
+        with patch('shutil.which', return_value=None):
+            self.test_install_rootfs_resume()
+    
+    def test_install_rootfs_resume_ignored(self):
+        """
+        Test downloading the whole rootfs again when the server ignores the range
+        """
+        # Leave the start of an archive that changed since
+        with open(self.partial_path, 'wb') as f:
+            f.write(b'outdated')
+        
+        self.mock_urlopen.return_value = _Response(ROOTFS, status=200)
+        
+        self.assertTrue(self.installer._install_rootfs(self.mount_point))
+        self._check_installed()
+    
+    def test_install_rootfs_complete_part(self):
+        """
+        Test installing a download that was interrupted after receiving the whole rootfs
+        """
+        with open(self.partial_path, 'wb') as f:
+            f.write(ROOTFS)
+        
+        self.mock_urlopen.side_effect = urllib.error.HTTPError(
+            'http://localhost/rootfs.tar.gz', 416, 'Range Not Satisfiable',
+            {'Content-Range': 'bytes */%d' % len(ROOTFS)}, None
+        )
+        
+        # Check that the downloaded part is used without downloading it again
+        self.assertTrue(self.installer._install_rootfs(self.mount_point))
+        self._check_installed()
+        self.mock_urlopen.assert_called_once()
+    
+    def test_install_rootfs_corrupt_part(self):
+        """
+        Test discarding a full-size download whose end was never written
+        """
+        # Leave a part padded with zeros, as left by an interrupted preallocated download
+        with open(self.partial_path, 'wb') as f:
+            f.write(ROOTFS[:len(ROOTFS) // 2] + bytes(len(ROOTFS) - len(ROOTFS) // 2))
+        
+        self.mock_urlopen.side_effect = [
+            urllib.error.HTTPError(
+                'http://localhost/rootfs.tar.gz', 416, 'Range Not Satisfiable',
+                {'Content-Range': 'bytes */%d' % len(ROOTFS)}, None
+            ),
+            _Response(ROOTFS)
+        ]
+        
+        # Check that the part is discarded and the whole archive downloaded again
+        self.assertTrue(self.installer._install_rootfs(self.mount_point))
+        self._check_installed()
+        self.assertNotIn('Range', self._get_request_headers(1))
+    
+    def test_install_rootfs_truncated(self):
+        """
+        Test keeping the received part of a download cut short by the connection
+        """
+        received = len(ROOTFS) // 2
+        self.mock_urlopen.return_value = _Response(ROOTFS[:received], content_length=len(ROOTFS))
+        
+        self.assertFalse(self.installer._install_rootfs(self.mount_point))
+        
+        # Check that the received data is kept for the next attempt, without the reserved space
+        self.assertEqual(os.path.getsize(self.partial_path), received)
+        self.assertFalse(os.path.exists(self.rootfs_path))
+        
+        # Check that the next attempt resumes after the received data
+        self.mock_urlopen.reset_mock()
+        self.mock_urlopen.return_value = _Response(ROOTFS[received:], status=206)
+        
+        self.assertTrue(self.installer._install_rootfs(self.mount_point))
+        self._check_installed()
+        self.assertEqual(self._get_request_headers()['Range'], 'bytes=%d-' % received)
+    
+    def test_install_rootfs_corrupt_cache(self):
+        """
+        Test dropping a cached rootfs that cannot be extracted
+        """
+        with open(self.rootfs_path, 'wb') as f:
+            f.write(b'corrupt' * 1024)
+        
+        self.assertFalse(self.installer._install_rootfs(self.mount_point))
+        
+        # Check that the cached archive is removed, so the next attempt downloads it again
+        self.assertFalse(os.path.exists(self.rootfs_path))
+        self.mock_urlopen.assert_not_called()
+    
+    def test_install_rootfs_target_failure(self):
+        """
+        Test keeping the cached rootfs when it cannot be written to the partition
+        """
+        with open(self.rootfs_path, 'wb') as f:
+            f.write(ROOTFS)
+        
+        # Make tar fail on the target, as it does on a full or read-only partition
+        os.rmdir(self.mount_point)
+        with open(self.mount_point, 'w') as f:
+            f.write('not a directory')
+        
+        self.assertFalse(self.installer._install_rootfs(self.mount_point))
+        
+        # Check that the intact archive is kept, so the next attempt does not download it again
+        with open(self.rootfs_path, 'rb') as f:
+            self.assertEqual(f.read(), ROOTFS)
+        self.mock_urlopen.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()